@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+### Benchmark of the client side hot loop
+### Runs against utils.fake_carla (no server needed) with 10, 50, 200 and
+### 1000 vehicles and measures spawning, episode reset, every code path of
+### a logging tick and the whole tick (steps per second). The peak memory
+### allocated by one call of every path is measured with tracemalloc.
+### The results are written as json, --compare prints the change against
+### the json of another commit.
+###
+###     python benchmark.py --out bench.json
+###     python benchmark.py --compare bench_master.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils import fake_carla as carla
+from utils.actor_pool import ActorPool
+from utils.lane_index import LaneIndex
+from utils.neighbors import NeighborScanner
+from utils.observation import ObservationEncoder, TypeCodes
+from utils.recorder import ColumnRecorder
+from utils.snapshot import SnapshotReader
+from utils.spawner import VehicleSpawner, VehicleSpec
+
+## time metrics, a higher value is a regression (steps_per_s is the other way round)
+LOWER_IS_BETTER = ('spawn_ms', 'reset_ms', 'mean_us', 'p50_us', 'p99_us', 'peak_kib')
+## rows buffered by the benchmark recorders, small enough that the writes of the chunks
+## fall into the timed appends of the log paths (--steps 200 appends about 420 rows)
+LOG_CHUNK = 64
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def highway_transforms(map, count):
+    """count transforms spread evenly over the lanes of the fake highway"""
+    lanes = len(map.lane_x)
+    spacing = map.length / float(-(-count // lanes))
+    return [carla.Transform(carla.Location(x=float(map.lane_x[k % lanes]), y=map.y_min + (k // lanes) * spacing,
+                                           z=map.z + 0.3),
+                            carla.Rotation(yaw=90.0))
+            for k in range(count)]
+
+
+def timings(values):
+    values = np.asarray(values) * 1e6
+    return {'mean_us': float(values.mean()), 'p50_us': float(np.percentile(values, 50)),
+            'p99_us': float(np.percentile(values, 99))}
+
+
+def peak_kib(fn, repeat=20):
+    """Largest memory peak of one call of fn, in KiB"""
+    fn()    ## warm up the caches and buffers
+    tracemalloc.start()
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return peak / 1024.0
+
+
+class Scenario(object):
+    """One fake server with num_vehicles autopilot vehicles and the hot loop objects"""
+
+    def __init__(self, num_vehicles, directory, port):
+        self.client = carla.Client('benchmark', port)
+        self.world = self.client.get_world()
+        settings = self.world.get_settings()
+        settings.synchronous_mode = True
+        settings.fixed_delta_seconds = 0.05
+        self.world.apply_settings(settings)
+        traffic_manager = self.client.get_trafficmanager(8000)
+        blueprints = self.world.get_blueprint_library().filter('vehicle.*')
+        specs = [VehicleSpec(blueprints[k % len(blueprints)], transform,
+                             tm_settings={'distance_to_leading_vehicle': 3.0},
+                             tag='ego' if k == 0 else None)
+                 for k, transform in enumerate(highway_transforms(self.world.get_map(), num_vehicles))]
+        self.spawner = VehicleSpawner(carla, self.client, self.world, traffic_manager)
+        start = time.perf_counter()
+        results = self.spawner.spawn(specs, True)
+        self.spawn_ms = (time.perf_counter() - start) * 1000.0
+        self.ids = [r.actor_id for r in results if r.ok]
+        self.pool = ActorPool(carla, self.client, self.world, self.spawner, results)
+
+        self.reader = SnapshotReader(self.world, self.ids)
+        self.scanner = NeighborScanner(self.world, self.ids[1:], radius=50.0, max_neighbors=15)
+        self.lane_index = LaneIndex.from_map(self.world.get_map())
+        self.encoder = ObservationEncoder(TypeCodes.from_world(self.world))
+        columns = ['c{}'.format(i) for i in range(11 + 15 * 10)]
+        self.csv = ColumnRecorder(os.path.join(directory, 'bench_{}.csv'.format(port)), columns,
+                                  chunk_size=LOG_CHUNK)
+        self.npz = ColumnRecorder(os.path.join(directory, 'bench_{}.npz'.format(port)), columns, fmt='npz',
+                                  chunk_size=LOG_CHUNK)
+        self.row = [0.0] * len(columns)
+        self.world.tick()
+        self.read()
+
+    def read(self):
+        self.snapshot = self.reader.read()
+        self.ego = self.snapshot[self.ids[0]]
+        self.neighbors = self.scanner.scan(tuple(self.ego.location), self.snapshot)
+        self.lane_ids = self.lane_index.query(np.vstack([tuple(self.ego.location), self.neighbors.location]))
+
+    def paths(self):
+        """The code paths of one logging tick, in the order of the loop"""
+        return [
+            ('tick', self.world.tick),
+            ('snapshot', self.reader.read),
+            ('neighbors', lambda: self.scanner.scan(tuple(self.ego.location), self.snapshot)),
+            ('lane_ids', lambda: self.lane_index.query(np.vstack([tuple(self.ego.location),
+                                                                   self.neighbors.location]))),
+            ('encode', lambda: self.encoder.encode(self.ego, self.neighbors, self.lane_ids)),
+            ('log_csv', lambda: self.csv.append(self.row)),
+            ('log_npz', lambda: self.npz.append(self.row)),
+        ]
+
+    def step(self):
+        self.world.tick()
+        self.read()
+        self.encoder.encode(self.ego, self.neighbors, self.lane_ids)
+        self.csv.append(self.row)
+
+    def close(self):
+        self.csv.close()
+        self.npz.close()
+
+
+def run(num_vehicles, steps, resets, directory, port):
+    scenario = Scenario(num_vehicles, directory, port)
+    result = {'vehicles': len(scenario.ids), 'spawn_ms': scenario.spawn_ms}
+
+    reset_times = []
+    for _ in range(resets):
+        start = time.perf_counter()
+        scenario.pool.reset()
+        reset_times.append(time.perf_counter() - start)
+        scenario.world.tick()
+    result['reset_ms'] = float(np.median(reset_times) * 1000.0)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        scenario.step()
+    result['steps_per_s'] = steps / (time.perf_counter() - start)
+
+    result['paths'] = {}
+    for name, fn in scenario.paths():
+        values = []
+        for _ in range(steps):
+            start = time.perf_counter()
+            fn()
+            values.append(time.perf_counter() - start)
+        stats = timings(values)
+        stats['peak_kib'] = peak_kib(fn)
+        result['paths'][name] = stats
+    scenario.close()
+    return result
+
+
+def flatten(results):
+    flat = {}
+    for result in results:
+        prefix = '{} vehicles '.format(result['vehicles'])
+        for key in ('spawn_ms', 'reset_ms', 'steps_per_s'):
+            flat[prefix + key] = result[key]
+        for name, stats in result['paths'].items():
+            for key, value in stats.items():
+                flat[prefix + name + ' ' + key] = value
+    return flat
+
+
+def compare(current, baseline, threshold):
+    """Print every metric which changed more than threshold (relative), return the regressions"""
+    old, new = flatten(baseline['results']), flatten(current['results'])
+    regressions = []
+    for key in sorted(set(old) & set(new), key=lambda k: (int(k.split()[0]), k)):
+        if not old[key]:
+            continue
+        change = new[key] / old[key] - 1.0
+        if abs(change) < threshold:
+            continue
+        worse = change > 0 if key.endswith(LOWER_IS_BETTER) else change < 0
+        print('{:<45} {:12.2f} -> {:12.2f}  {:+7.1f}% {}'.format(key, old[key], new[key], 100.0 * change,
+                                                               'REGRESSION' if worse else ''))
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument(
+        '--vehicles',
+        default='10,50,200,1000',
+        help='comma separated numbers of vehicles (default: 10,50,200,1000)')
+    argparser.add_argument(
+        '--steps',
+        default=200,
+        type=int,
+        help='ticks measured per code path (default: 200)')
+    argparser.add_argument(
+        '--resets',
+        default=10,
+        type=int,
+        help='episode resets measured (default: 10)')
+    argparser.add_argument(
+        '--out',
+        default='benchmark.json',
+        help='json file of the results (default: benchmark.json)')
+    argparser.add_argument(
+        '--compare',
+        default=None,
+        help='json results of another commit to compare with')
+    argparser.add_argument(
+        '--threshold',
+        default=0.1,
+        type=float,
+        help='relative change reported by --compare (default: 0.1)')
+    args = argparser.parse_args()
+
+    results = []
+    ## the logged chunks are only written to be timed, they are removed afterwards
+    with tempfile.TemporaryDirectory(prefix='carla_benchmark_') as directory:
+        for k, num_vehicles in enumerate(int(n) for n in args.vehicles.split(',')):
+            result = run(num_vehicles, args.steps, args.resets, directory, 2000 + 2 * k)
+            results.append(result)
+            print('{:5d} vehicles: {:8.1f} steps/s, reset {:7.2f} ms, spawn {:8.2f} ms'.format(
+                result['vehicles'], result['steps_per_s'], result['reset_ms'], result['spawn_ms']))
+            for name, stats in result['paths'].items():
+                print('      {:<10} {:9.1f} us p50 {:9.1f} us p99 {:9.1f} KiB peak'.format(
+                    name, stats['p50_us'], stats['p99_us'], stats['peak_kib']))
+
+    output = {'commit': git_commit(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'python': platform.python_version(), 'numpy': np.__version__,
+              'steps': args.steps, 'results': results}
+    with open(args.out, 'w') as f:
+        json.dump(output, f, indent=2)
+    print('results written to', args.out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('compared with commit', baseline.get('commit'))
+        if compare(output, baseline, args.threshold):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
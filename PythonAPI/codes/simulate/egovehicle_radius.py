@@ -11,7 +11,6 @@ import glob
 import os
 import sys
 import time
-import pandas as pd
 import numpy as np
 
 
@@ -29,9 +28,31 @@ import argparse
 import logging
 import random
 import copy
+import threading
 
 ## utils
 from utils.ego_to_exit import get_exit_waypoint
+from utils.neighbors import NeighborScanner
+from utils.recorder import ColumnRecorder, FORMATS
+from utils.lane_index import LaneIndex
+from utils.snapshot import SnapshotReader
+from utils.spawner import VehicleSpawner, VehicleSpec
+from utils.actor_pool import ActorPool, ensure_world
+from utils.start_table import StartTable
+from utils.collisions import CollisionMonitor
+from utils.profiler import TickProfiler
+from utils.trace import TraceWriter
+from utils.debug_draw import DebugDraw
+from utils.sampling import add_sampling_arguments, policy_from_args
+from utils.tm_proxy import TrafficManagerProxy
+from utils.pipeline import TickPipeline
+from utils.warm_cache import WarmCache, UNSAFE
+from utils.walkers import WalkerCrowd
+from utils.hybrid_radius import HybridRadius
+
+## actions of the ego vehicle recorded with --trace: the forced lane change of the tick
+## (-1 left, 1 right, 0 none) and the traffic manager settings of the ego vehicle
+EGO_ACTIONS = ('lane_change', 'ignore_vehicles_percentage', 'distance_to_leading_vehicle', 'auto_lane_change')
 
 def main():
     argparser = argparse.ArgumentParser(
@@ -59,6 +80,10 @@ def main():
         default=50,
         type=int,
         help='number of walkers (default: 50)')
+    argparser.add_argument(
+        '--no_walkers',
+        action='store_true',
+        help='no walkers, e.g. on the highway (Town04)')
     argparser.add_argument(
         '--assigned',
         default=True,
@@ -91,7 +116,26 @@ def main():
     argparser.add_argument(
         '--hybrid',
         action='store_true',
-        help='Enanble')
+        help='Enanble hybrid physics, the radius covers --radius and adapts to --hybrid_budget')
+    argparser.add_argument(
+        '--radius',
+        default=50.0,
+        type=float,
+        help='radius of the logged neighbors of the ego vehicle (default: 50)')
+    argparser.add_argument(
+        '--hybrid_budget',
+        default=50.0,
+        type=float,
+        help='server tick time in ms the hybrid radius is adapted to (default: 50, real time at 20 fps)')
+    argparser.add_argument(
+        '--hybrid_window',
+        default=500,
+        type=int,
+        help='ticks between two adaptations of the hybrid radius, it is adapted at every reset too (default: 500)')
+    argparser.add_argument(
+        '--hybrid_file',
+        default=None,
+        help='csv file under Datasets the adaptations of the hybrid radius are written to')
     argparser.add_argument(
         '--sync',
         action='store_true',
@@ -141,6 +185,62 @@ def main():
         default= 80,
         type=float,
         help= 'velocity (default 80)')
+    argparser.add_argument(
+        '--log_format',
+        default='csv',
+        choices=FORMATS,
+        help='format of the saved dataset (default: csv)')
+    argparser.add_argument(
+        '--log_chunk',
+        default=1024,
+        type=int,
+        help='number of rows buffered before they are written (default: 1024)')
+    argparser.add_argument(
+        '--profile',
+        action='store_true',
+        help='measure the time of every phase of the tick loop')
+    argparser.add_argument(
+        '--profile_every',
+        default=100,
+        type=int,
+        help='print the timing percentiles every N ticks (default: 100)')
+    argparser.add_argument(
+        '--profile_file',
+        default=None,
+        help='csv file the timings of the last ticks are written to at the end')
+    add_sampling_arguments(argparser, stride=20)
+    argparser.add_argument(
+        '--no_draw',
+        action='store_true',
+        help='no debug drawing in the simulator (headless runs)')
+    argparser.add_argument(
+        '--draw_budget',
+        default=100,
+        type=int,
+        help='debug shapes drawn per frame at most (default: 100)')
+    argparser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='log a tick on a worker thread while the next tick runs')
+    argparser.add_argument(
+        '--pipeline_depth',
+        default=2,
+        type=int,
+        help='ticks waiting for the logging thread before the loop waits (default: 2)')
+    argparser.add_argument(
+        '--trace',
+        default=None,
+        help='directory under Datasets to record the states of every tick to, for replays')
+    argparser.add_argument(
+        '--reset_every',
+        default=0,
+        type=int,
+        help='teleport all vehicles back to new start points every N ticks (default: 0, never)')
+    argparser.add_argument(
+        '--max_ticks',
+        default=0,
+        type=int,
+        help='stop after N ticks (default: 0, run until Ctrl+C)')
     argparser.set_defaults(autopilot=False)
     argparser.set_defaults(coordination_read=True)
 
@@ -150,26 +250,28 @@ def main():
     logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
     vehicles_list = []
-    walkers_list = []
-    all_id = []
+    walkers = None
     client = carla.Client(args.host, args.port)
-    client.load_world(map_name=args.map_name)
     client.set_timeout(10.0)
+    ensure_world(client, args.map_name)   ## the map is only loaded if the server runs another one
 
     ## Datasets path
     path_dataset = os.getcwd() + "/Datasets/"
     coord_file = path_dataset + args.coord_file
     path_collision_dataset = path_dataset + args.collision_file
+    path_trace = path_dataset + args.trace if args.trace else None
+    path_hybrid = path_dataset + args.hybrid_file if args.hybrid_file else None
     path_dataset = path_dataset + args.file_name
-
-
-    if os.path.isfile(path_dataset):
-        newfile = False
-    else:
-        newfile = True
+    recorder = None
+    collision_monitor = None
+    trace = None
+    pipeline = None
+    hybrid = None
+    profiler = TickProfiler(enabled=False)
 
     try:
-        traffic_manager = client.get_trafficmanager(args.tm_port)
+        ## the per vehicle settings are sent once per tick, unchanged ones are dropped
+        traffic_manager = TrafficManagerProxy(client.get_trafficmanager(args.tm_port))
 
         ## tm set the global distance to other vehicles
         traffic_manager.set_global_distance_to_leading_vehicle(4.0)
@@ -189,21 +291,14 @@ def main():
             else:
                 synchronous_master = False
 
-        blueprints = world.get_blueprint_library().filter(args.filterv)
-        blueprintsWalkers = world.get_blueprint_library().filter(args.filterw)
-        blueprints_sensors = world.get_blueprint_library().filter('sensor.*.*')
+        ## blueprint ids, spawn points and waypoints of the map are cached under Datasets/warm_cache
+        cache = WarmCache(carla, client, world, os.path.dirname(path_dataset), map=map)
 
         ## Autobahn -- number of wheels == 4   ## to reject bikes on the highway
-        blueprints = [x for x in blueprints if int(x.get_attribute("number_of_wheels")) == 4]
-
-        if args.safe:
-            blueprints = [x for x in blueprints if int(x.get_attribute('number_of_wheels')) == 4]
-            blueprints = [x for x in blueprints if not x.id.endswith('isetta')]
-            blueprints = [x for x in blueprints if not x.id.endswith('carlacola')]
-            blueprints = [x for x in blueprints if not x.id.endswith('cybertruck')]
-            blueprints = [x for x in blueprints if not x.id.endswith('t2')]
+        blueprints = cache.blueprints(args.filterv, wheels=4, exclude=UNSAFE if args.safe else ())
+        blueprintsWalkers = cache.blueprints(args.filterw)
 
-        spawn_points = world.get_map().get_spawn_points()
+        spawn_points = cache.spawn_points()
         number_of_spawn_points = len(spawn_points)
 
         if args.number_of_vehicles < number_of_spawn_points:
@@ -222,7 +317,6 @@ def main():
         # --------------
         # Spawn vehicles
         # --------------
-        batch = []
         blueprint_audi = None          ## for audi tt
         actorblueprint_audi = None
         actor_audi = None
@@ -236,16 +330,32 @@ def main():
 
         ## load the coordination
         if args.coordination_read:
-            coordination = pd.read_csv(coord_file)
+            start_table = StartTable.load(coord_file)    ## compiled to .npy on the first run
         elif not args.coordination_read:
-            waypoints = map.generate_waypoints(distance=10.0)  ## the waypoints
+            waypoints = cache.waypoint_transforms(distance=10.0)  ## the transforms of the waypoints
 
 
         # if args.assigned:   ### assign special car, here is audi
         if blueprint_audi is None:
-            blueprint_audi = world.get_blueprint_library().filter('vehicle.audi.tt')   ## actorblueprint, transform, rotation
+            blueprint_audi = cache.blueprints('vehicle.audi.tt')   ## actorblueprint, transform, rotation
             actorblueprint_audi = blueprint_audi[0]
 
+        ## velocity set control (just for the start)
+        start_control = carla.VehicleControl(throttle=0, brake=0, manual_gear_shift=True, gear=0)
+        ## traffic manager settings of the ego vehicle and of the other vehicles
+        ego_settings = {'distance_to_leading_vehicle': 3.0,   ## set the minimum distance in meters to keep with the others
+                        'vehicle_percentage_speed_difference': actor_velocity,
+                        'auto_lane_change': bool(args.autopilot),   ## only the autopilot ego-vehicle changes the lane
+                        'ignore_vehicles_percentage': 100,
+                        'ignore_lights_percentage': 100}
+        vehicle_settings = {'distance_to_leading_vehicle': 3.0,
+                            'vehicle_percentage_speed_difference': actor_velocity,
+                            'auto_lane_change': True,
+                            'ignore_lights_percentage': 100,
+                            'ignore_vehicles_percentage': 30}
+        vehicle_specs = []
+        start_rows = []     ## (lane, frame) of the coordination file for each vehicle, used for the resets
+
         for n, transform in enumerate(spawn_points):
             if n >= args.number_of_vehicles - 1:   ### number of vehicles must be greater than 2
                 break
@@ -262,81 +372,24 @@ def main():
                 actorblueprint_audi.set_attribute('color', '255,0,0')  # set the color of the audi
                 ## set the starting point on the highway
                 if args.coordination_read:
-                    transform.location.x = coordination['lane3 X'][151]
-                    transform.location.y = coordination['lane3 Y'][151]
-                    transform.location.z = coordination['lane3 Z'][151] + 2
-                    transform.rotation.yaw = coordination['lane3 yaw'][151]
-                    transform.rotation.pitch = coordination['lane3 pitch'][151]
-                    transform.rotation.roll = coordination['lane3 roll'][151]
+                    transform = start_table.transforms(carla, [(3, 151)])[0]
                     print(transform)
+                    start_rows.append((3, 151))
                 elif not args.coordination_read:
-                    print('in')
-                    print('in')
-                    print('in')
-                    transform.location.x = waypoints[n].transform.location.x
-                    transform.location.y = waypoints[n].transform.location.y
-                    transform.location.z = waypoints[n].transform.location.z + 2
-                    transform.rotation.yaw = waypoints[n].transform.rotation.yaw
-                    transform.rotation.pitch = waypoints[n].transform.rotation.pitch
-                    transform.rotation.roll = waypoints[n].transform.rotation.roll
-                # actor_audi = SpawnActor(actorblueprint_audi, transform).then(SetAutopilot(FutureActor, True))
-                actor_audi = world.spawn_actor(actorblueprint_audi, transform)
-                audi_id = actor_audi.id
-                print(actor_audi)
-                vehicle_actors.append(actor_audi)
-                traffic_manager.distance_to_leading_vehicle(actor_audi, 3.0) ## set the minimum distance in meters to keep with the others
-                traffic_manager.vehicle_percentage_speed_difference(actor_audi, actor_velocity)
-                actor_audi.set_autopilot()
-                if args.autopilot:  ## autopilot for the ego-vehicle
-                    traffic_manager.auto_lane_change(actor_audi, True)  ### change the lane
-                elif not args.autopilot:
-                    print('not auto')
-                    traffic_manager.auto_lane_change(actor_audi, False) ### not to auto change the lane
-                traffic_manager.ignore_vehicles_percentage(actor_audi, 100)
-                traffic_manager.ignore_lights_percentage(actor_audi, 100)
-
-                ## velocity set control (just for the start)
-                actor_audi.apply_control(carla.VehicleControl(throttle=0, brake=0, manual_gear_shift=True,
-                                                              gear=0))
-                ## collision sensor    carla.CollisionEvent()
-                collision_sensor_bp = blueprints_sensors.find('sensor.other.collision')
-                collision_sensor = world.spawn_actor(collision_sensor_bp, transform, attach_to=actor_audi)
-                collision_sensor.listen(lambda event: collision_detailed(event))
-
-                def collision_detailed(event):
-                    if os.path.isfile(path_collision_dataset):
-                        collision_newfile = False
-                    else:
-                        collision_newfile = True
-                    actor_ego_collide_against = event.other_actor
-                    collision_transform = event.transform
-                    collision_frame = event.frame
-                    print('collision frame', collision_frame)
-                    print('normal frame', frame)
-                    print(actor_ego_collide_against)
-                    print('type_id', actor_ego_collide_against.type_id)
-                    collision_data = pd.DataFrame([[collision_frame, actor_ego_collide_against.id, actor_ego_collide_against.type_id,
-                                                    collision_transform.location.x, collision_transform.location.y, collision_transform.location.z]],
-                                                  columns=["frame", "actor id", "actor type", "location x",
-                                                           "location y", "location z"])
-                    if collision_newfile:
-                        collision_data.to_csv(path_collision_dataset, index=False)
-                    else:
-                        collision_data.to_csv(path_collision_dataset, header=None, mode="a", index=False)
-
-                # actor_audi.set_velocity(carla.Vector3D(0, actor_velocity,0))
+                    transform = waypoints[n]
+                    transform.location.z += 2
+                    start_rows.append(None)
+                vehicle_specs.append(VehicleSpec(actorblueprint_audi, transform, tm_settings=ego_settings,
+                                                 control=start_control, tag='ego'))
 
             else:
                 blueprint.set_attribute('role_name', 'autopilot')  ## set to autopilot
+                start_rows.append(None)
                 ## get actor blueprint
                 if args.coordination_read:        ## for the tranfsorm and location
                     if 71 + num != 151:
-                        transform.location.x = coordination["lane{} X".format(i + 1)][51 + num]
-                        transform.location.y = coordination["lane{} Y".format(i + 1)][51 + num]
-                        transform.location.z = coordination["lane{} Z".format(i + 1)][51 + num] + 2
-                        transform.rotation.yaw = coordination["lane{} yaw".format(i + 1)][51 + num]
-                        transform.rotation.pitch = coordination["lane{} pitch".format(i + 1)][51 + num]
-                        transform.rotation.roll = coordination["lane{} roll".format(i + 1)][51 + num]
+                        start_rows[-1] = (i + 1, 51 + num)
+                        transform = start_table.transforms(carla, start_rows[-1:])[0]
                         print(i, transform)
                         if i >= 3:
                             i = 0
@@ -344,34 +397,56 @@ def main():
                             i += 1
                     num += 20
                 elif not args.coordination_read: ## use waypoints
-                    transform.location.x = waypoints[n].transform.location.x
-                    transform.location.y = waypoints[n].transform.location.y
-                    transform.location.z = waypoints[n].transform.location.z + 2
-                    transform.rotation.yaw = waypoints[n].transform.rotation.yaw
-                    transform.rotation.pitch = waypoints[n].transform.rotation.pitch
-                    transform.rotation.roll = waypoints[n].transform.rotation.roll
-
-                actor = world.spawn_actor(blueprint, transform)
-                rest_vehicleactors.append(actor.id)
-                traffic_manager.distance_to_leading_vehicle(actor, 3.0)
-                traffic_manager.vehicle_percentage_speed_difference(actor, actor_velocity)
-                traffic_manager.auto_lane_change(actor, True)
-                actor.set_autopilot()
-                traffic_manager.ignore_lights_percentage(actor, 100)
-                traffic_manager.ignore_vehicles_percentage(actor, 30)
-
-                ## velocity set control (just for the start)
-                actor.apply_control(carla.VehicleControl(throttle=0, brake=0, manual_gear_shift=True,
-                                                         gear=0))
-                # actor.set_velocity(carla.Vector3D(0, actor_velocity, 0))
-                batch.append(SpawnActor(blueprint, transform).then(SetAutopilot(FutureActor, True)))
-
-        # print(dir(traffic_manager))
-        for response in client.apply_batch_sync(batch, synchronous_master):
-            if response.error:
-                logging.error(response.error)
+                    transform = waypoints[n]
+                    transform.location.z += 2
+                vehicle_specs.append(VehicleSpec(blueprint, transform, tm_settings=vehicle_settings,
+                                                 control=start_control))
+
+        ## every vehicle is spawned once, all of them in one round trip
+        spawner = VehicleSpawner(carla, client, world, traffic_manager, args.tm_port)
+        audi_id = None
+        spawn_results = spawner.spawn(vehicle_specs, synchronous_master)
+        for result in spawn_results:
+            if not result.ok:
+                logging.error('%s: %s', result.spec.blueprint.id, result.error)
+                continue
+            vehicles_list.append(result.actor_id)
+            if result.spec.tag == 'ego':
+                audi_id = result.actor_id
             else:
-                vehicles_list.append(response.actor_id)
+                rest_vehicleactors.append(result.actor_id)
+        if audi_id is None:
+            raise RuntimeError('the ego vehicle could not be spawned')
+        actor_audi = world.get_actor(audi_id)
+        vehicle_actors.append(actor_audi)
+        print(actor_audi)
+        ## the vehicles are kept for the next episodes, a reset only teleports them
+        actor_pool = ActorPool(carla, client, world, spawner, spawn_results)
+
+        def start_transforms(offset):
+            ## the start points of all vehicles moved by offset frames along the lanes
+            transforms = [spec.transform for spec in vehicle_specs]
+            rows = [k for k, row in enumerate(start_rows) if row is not None]
+            if not rows:    ## waypoint starts (-wayr), there is no coordination file
+                return transforms
+            for k, transform in zip(rows, start_table.transforms(carla, [start_rows[k] for k in rows], offset)):
+                transforms[k] = transform
+            return transforms
+        if args.coordination_read:
+            max_offset = start_table.max_offset([row for row in start_rows if row is not None])
+        else:
+            max_offset = 0
+
+        ## collision sensor    carla.CollisionEvent()
+        collision_sensor_bp = cache.blueprint('sensor.other.collision')
+        ## the sensor thread only queues the events, the file is written by a background thread
+        collision_monitor = CollisionMonitor(path_collision_dataset)
+
+        def attach_collision_sensor(ego_actor):
+            sensor = world.spawn_actor(collision_sensor_bp, carla.Transform(), attach_to=ego_actor)
+            sensor.listen(collision_monitor.on_collision)
+            return sensor
+        collision_sensor = attach_collision_sensor(actor_audi)
 
         # -------------
         # Spawn Walkers
@@ -379,78 +454,22 @@ def main():
         # some settings
         percentagePedestriansRunning = 0.0  # how many pedestrians will run
         percentagePedestriansCrossing = 0.0  # how many pedestrians will walk through the road
-        # 1. take all the random locations to spawn
-        spawn_points = []
-        for i in range(args.number_of_walkers):
-            spawn_point = carla.Transform()
-            loc = world.get_random_location_from_navigation()
-            if (loc != None):
-                spawn_point.location = loc
-                spawn_points.append(spawn_point)
-        # 2. we spawn the walker object
-        batch = []
-        walker_speed = []
-        for spawn_point in spawn_points:
-            walker_bp = random.choice(blueprintsWalkers)
-            # set as not invincible
-            if walker_bp.has_attribute('is_invincible'):
-                walker_bp.set_attribute('is_invincible', 'false')
-            # set the max speed
-            if walker_bp.has_attribute('speed'):
-                if (random.random() > percentagePedestriansRunning):
-                    # walking
-                    walker_speed.append(walker_bp.get_attribute('speed').recommended_values[1])
-                else:
-                    # running
-                    walker_speed.append(walker_bp.get_attribute('speed').recommended_values[2])
-            else:
-                print("Walker has no speed")
-                walker_speed.append(0.0)
-            batch.append(SpawnActor(walker_bp, spawn_point))
-        results = client.apply_batch_sync(batch, True)
-        walker_speed2 = []
-        for i in range(len(results)):
-            if results[i].error:
-                logging.error(results[i].error)
-            else:
-                walkers_list.append({"id": results[i].actor_id})
-                walker_speed2.append(walker_speed[i])
-        walker_speed = walker_speed2
-        # 3. we spawn the walker controller
-        batch = []
-        walker_controller_bp = world.get_blueprint_library().find('controller.ai.walker')
-        for i in range(len(walkers_list)):
-            batch.append(SpawnActor(walker_controller_bp, carla.Transform(), walkers_list[i]["id"]))
-        results = client.apply_batch_sync(batch, True)
-        for i in range(len(results)):
-            if results[i].error:
-                logging.error(results[i].error)
-            else:
-                walkers_list[i]["con"] = results[i].actor_id
-        # 4. we put altogether the walkers and controllers id to get the objects from their id
-        for i in range(len(walkers_list)):
-            all_id.append(walkers_list[i]["con"])
-            all_id.append(walkers_list[i]["id"])
-        all_actors = world.get_actors(all_id)
+        ## walkers and their controllers in two batches, none at all with --no_walkers
+        walkers = WalkerCrowd(carla, client, world, blueprintsWalkers, cache.blueprint('controller.ai.walker'))
+        walkers.spawn(0 if args.no_walkers else args.number_of_walkers, percentagePedestriansRunning,
+                      do_tick=synchronous_master)
 
+        traffic_manager.flush()
         # wait for a tick to ensure client receives the last transform of the walkers we have just created
         if not args.sync or not synchronous_master:
             world.wait_for_tick()
         else:
             world.tick()
 
-        # 5. initialize each controller and set target to walk to (list is [controler, actor, controller, actor ...])
-        # set how many pedestrians can cross the road
-        world.set_pedestrians_cross_factor(percentagePedestriansCrossing)
-        for i in range(0, len(all_id), 2):
-            # start walker
-            all_actors[i].start()
-            # set walk to random point
-            all_actors[i].go_to_location(world.get_random_location_from_navigation())
-            # max speed
-            all_actors[i].set_max_speed(float(walker_speed[int(i / 2)]))
+        # 5. initialize each controller and set target to walk to
+        walkers.start(percentagePedestriansCrossing)
 
-        print('spawned %d vehicles and %d walkers, press Ctrl+C to exit.' % (len(vehicles_list), len(walkers_list)))
+        print('spawned %d vehicles and %d walkers, press Ctrl+C to exit.' % (len(vehicles_list), len(walkers)))
 
         ## for dataframe save as csv
         ego_columns = ["Frame", "Ego Vehicle", "Ego ID", "Location X", "Location Y", "Velocity X", "Velocity Y", "Rotation Yaw",
@@ -460,20 +479,137 @@ def main():
                               "Velocity Y {}".format(1 + i), "Rotation Yaw {}".format(1 + i), "Rotation Pitch {}".format(1 + i), "Rotation Roll {}".format(1 + i),
                               "Vehicle {} Lane ID".format(1 + i)]
             ego_columns += vehicle_column
+        ## ids, lane ids and type ids are padded with 'None'
+        dataset_dtypes = {c: object for c in ego_columns if c == "Ego Vehicle" or c.startswith("Vehicle ")}
+        dataset_dtypes.update({"Frame": np.int64, "Ego ID": np.int64, "Ego Lane ID": np.int64})
+        recorder = ColumnRecorder(path_dataset, ego_columns, dtypes=dataset_dtypes, fmt=args.log_format,
+                                  chunk_size=args.log_chunk)
+        ## all vehicles except the ego are read once per logging tick
+        neighbor_scanner = NeighborScanner(world, rest_vehicleactors, radius=args.radius, max_neighbors=15)
+        ## lane ids from the cached waypoint grid, the server is only asked off the indexed lanes
+        lane_index = LaneIndex.load_or_build(map, os.path.dirname(path_dataset))
+        lane_fallback = lambda x, y, z: map.get_waypoint(carla.Location(x=x, y=y, z=z)).lane_id
+        ## the states of the ego and the other vehicles are read once per tick from the world snapshot
+        snapshot_reader = SnapshotReader(world, [audi_id] + rest_vehicleactors)
+        draw = DebugDraw(carla, world.debug, budget=args.draw_budget, enabled=not args.no_draw)
+        sampling = policy_from_args(args)    ## which ticks are logged
+        if path_trace:     ## every tick is recorded, one slot per vehicle (the ego vehicle first)
+            trace = TraceWriter(path_trace, actor_pool.ids, action_size=len(EGO_ACTIONS), action_fields=EGO_ACTIONS)
+        ego_defaults = [0.0] + [float(ego_settings[name]) for name in EGO_ACTIONS[1:]]
+        ego_action = np.array(ego_defaults, dtype=np.float32)
+
+        ## sampling and the draw queue are shared by the main thread and the logging worker (--pipeline)
+        lock = threading.Lock()
+
+        def lap_neighbors(start):
+            if args.pipeline:   ## timed on the worker, added to the tick it overlaps
+                profiler.add('neighbors', time.perf_counter() - start)
+            else:
+                profiler.lap('neighbors')
+
+        def log_tick(counter, frame, snapshot, ego):
+            ## neighbors, lane ids and the dataset row of one tick
+            with lock:
+                candidate = sampling.candidate(counter)
+            if candidate:
+                start = time.perf_counter()
+                ## The distance to audi ego vehicle
+                ego_location = tuple(ego.location)
+                neighbors = neighbor_scanner.scan(ego_location, snapshot)
+                lap_neighbors(start)
+                with lock:
+                    sample = sampling.sample(counter, neighbors.ids)
+                if sample:
+                    start = time.perf_counter()
+                    lane_ids = lane_index.query(np.vstack([ego_location, neighbors.location]), fallback=lane_fallback)
+                    lap_neighbors(start)
+
+                    ## circle the cars inside the circle from 50 radius (queued, drawn by the main thread)
+                    with lock:
+                        draw.points(neighbors.in_radius, color=(255, 0, 0), text='O', life_time=1)
+                    # save the dataframe as a list
+                    data_list = [frame, ego.type_id, audi_id, ego.location.x, ego.location.y,
+                                 ego.velocity.x, ego.velocity.y,
+                                 ego.rotation.yaw, ego.rotation.pitch, ego.rotation.roll,
+                                 ## lane_id
+                                 int(lane_ids[0])
+                                 ]
+                    for i in range(len(neighbors)):
+                        x, y, z = neighbors.location[i]
+                        yaw, pitch, roll = neighbors.rotation[i]
+                        data_list += [neighbors.type_ids[i], int(neighbors.ids[i]), x, y,
+                                      neighbors.velocity[i][0], neighbors.velocity[i][1],
+                                      yaw, pitch, roll,
+                                      ## lane_id
+                                      int(lane_ids[1 + i])]
+                    none_vehicle = ['None', 'None', 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 'None']
+                    data_list += (15 - len(neighbors)) * none_vehicle
+
+                    recorder.append(data_list)
+
+        ## with --pipeline frame t is logged while the main thread ticks frame t + 1
+        pipeline = TickPipeline(log_tick, maxsize=args.pipeline_depth, enabled=args.pipeline)
         counter = 0
         frame = 0
-        if args.hybrid:         ## tm set the hybrid mode
-            traffic_manager.set_hybrid_physics_mode(True)
-            traffic_manager.set_hybrid_physics_radius(30.0)
+        ## tm hybrid mode: full physics at least within the neighbor radius, more while the ticks are fast enough
+        hybrid = HybridRadius(traffic_manager, observation_radius=args.radius, budget=args.hybrid_budget / 1000.0,
+                              window=args.hybrid_window, path=path_hybrid, enabled=args.hybrid)
+        ## 'tick' is the time the server needs, the other phases are client side
+        profiler = TickProfiler(('reset', 'read', 'draw', 'tm', 'neighbors', 'log', 'tick', 'collisions'),
+                                enabled=args.profile, report_every=args.profile_every, path=args.profile_file)
         while True:
             if args.sync and synchronous_master:
+                profiler.tick()
                 counter += 1
                 frame += 1
+                ## no reset on the last tick, it would only start an episode of one tick
+                if args.reset_every and counter % args.reset_every == 0 and counter != args.max_ticks:
+                    ## new episode: teleport the vehicles, only missing ones are spawned again
+                    hybrid.adapt()      ## the radius of the next episode from the ticks of this one
+                    pipeline.join()     ## the logged ticks still refer to the old vehicles
+                    ## the reset ticks once, the snapshot of the server only shows the teleports after a tick
+                    ids = actor_pool.reset(start_transforms(random.randint(0, max_offset)),
+                                           do_tick=synchronous_master)
+                    frame += 1
+                    respawned = actor_pool.respawned
+                    for attempt in range(2):    ## the start of a gone ego vehicle may be blocked, try other starts
+                        if ids[0] is not None:
+                            break
+                        ids = actor_pool.reset(start_transforms(random.randint(0, max_offset)),
+                                               do_tick=synchronous_master)
+                        frame += 1
+                        respawned += actor_pool.respawned
+                    if respawned:
+                        vehicles_list = [x for x in ids if x is not None]
+                        rest_vehicleactors = [x for x in ids[1:] if x is not None]
+                        neighbor_scanner.refresh(rest_vehicleactors)
+                        snapshot_reader.track(vehicles_list)
+                    if ids[0] is None:      ## the vehicles spawned again are destroyed with the others
+                        raise RuntimeError('the ego vehicle could not be spawned again')
+                    if ids[0] != audi_id:   ## the ego vehicle was gone
+                        audi_id = ids[0]
+                        actor_audi = world.get_actor(audi_id)
+                        ego_action[:] = ego_defaults    ## spawned again with the settings of its spec
+                        collision_sensor.destroy()
+                        collision_sensor = attach_collision_sensor(actor_audi)
+                    print('reset, %d vehicles spawned again' % respawned)
+                    ## collisions of the teleports in the reset tick, they are not part of the first transition
+                    for collision in collision_monitor.poll():
+                        print('reset collision frame', collision.frame, 'against', collision.other_ids)
+                    if trace is not None:
+                        trace.new_episode()
+                        trace.track(ids)
+                    profiler.lap('reset')
                 # actor_audi.set_velocity(carla.Vector3D(np.sqrt(actor_velocity), np.sqrt(actor_velocity), 0.0))
-                print('id and velocity x, y', actor_audi.id, actor_audi.get_velocity().x, actor_audi.get_velocity().y)
+                ego_action[0] = 0.0     ## no lane change forced in this tick yet
+                snapshot = snapshot_reader.read()
+                ego = snapshot[audi_id]
+                profiler.lap('read')
+                print('id and velocity x, y', audi_id, ego.velocity.x, ego.velocity.y)
                 ## draw the location of the ego vehicle
-                world.debug.draw_point(actor_audi.get_location(), color=carla.Color(r=0, g=0, b=255),
-                                       life_time=1)
+                with lock:
+                    draw.point(ego.location.x, ego.location.y, ego.location.z, color=(0, 0, 255), life_time=1)
+                profiler.lap('draw')
                 # for vehicle_id in rest_vehicleactors:
                 #     vehicle = world.get_actor(vehicle_id)
                 #     vehicle.set_velocity(carla.Vector3D(np.sqrt(actor_velocity), np.sqrt(actor_velocity), 0.0))
@@ -486,82 +622,70 @@ def main():
                     ## not crash on the cars infront of it
                     traffic_manager.ignore_vehicles_percentage(actor_audi, 0)
                     traffic_manager.distance_to_leading_vehicle(actor_audi, 2)
-                if counter % 20 == 0:
-                    ## The distance to audi ego vehicle
-                    vehicles_data = []
-                    distances = []
-                    for vehicle_id in rest_vehicleactors:
-                        vehicle = world.get_actor(vehicle_id)
-                        distance = np.sum(np.square([vehicle.get_transform().location.x - actor_audi.get_transform().location.x,
-                                              vehicle.get_transform().location.y - actor_audi.get_transform().location.y,
-                                              vehicle.get_transform().location.z - actor_audi.get_transform().location.z]))
-
-                        if distance <= 50 ** 2:  ## in 50 meters
-                            vehicle_data = [vehicle.type_id, vehicle_id, vehicle.get_transform().location.x, vehicle.get_transform().location.y,
-                                            vehicle.get_velocity().x, vehicle.get_velocity().y,
-                                            vehicle.get_transform().rotation.yaw, vehicle.get_transform().rotation.pitch, vehicle.get_transform().rotation.roll,
-                                            ## lane_id
-                                            map.get_waypoint(carla.Location(x=vehicle.get_transform().location.x, y=vehicle.get_transform().location.y,
-                                                                            z=vehicle.get_transform().location.z)).lane_id
-                                            ]
-                            distances.append(distance)
-                            vehicles_data.append(vehicle_data)
-
-                            ## circle the cars inside the circle from 40 radius
-                            world.debug.draw_string(vehicle.get_transform().location, 'O', color=carla.Color(r=255, g=0, b=0),
-                                                   life_time=1)
-                    # save the dataframe as a list
-                    data_list = [frame, actor_audi.type_id, audi_id, actor_audi.get_transform().location.x, actor_audi.get_transform().location.y,
-                                 actor_audi.get_velocity().x, actor_audi.get_velocity().y,
-                                 actor_audi.get_transform().rotation.yaw, actor_audi.get_transform().rotation.pitch, actor_audi.get_transform().rotation.roll,
-                                 ## lane_id
-                                 map.get_waypoint(carla.Location(x=actor_audi.get_transform().location.x,
-                                                                 y=actor_audi.get_transform().location.y,
-                                                                 z=actor_audi.get_transform().location.z)).lane_id
-                                 ]
-                    sort_idx = sorted(range(len(distances)), key=lambda k: distances[k])
-                    if len(distances) >= 15:
-                        for i in range(15):
-                            data_list += vehicles_data[sort_idx[i]]
-                    else:  ## < 15
-                        for i in range(len(distances)):
-                            data_list += vehicles_data[sort_idx[i]]
-                        none_vehicle = ['None', 'None', 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 'None']
-                        data_list += (15 - len(distances)) * none_vehicle
-
-                    ego_neighbor_dt = pd.DataFrame([data_list], columns=ego_columns)
-                    if newfile:
-                        ego_neighbor_dt.to_csv(path_dataset, index=False)
-                        newfile = False
-                    else:
-                        ego_neighbor_dt.to_csv(path_dataset, header=None, mode="a", index=False)
+                    ego_action[1:3] = (0, 2)
+                    profiler.lap('tm')
+                ## feature extraction and logging, on the worker thread with --pipeline
+                pipeline.submit(counter, frame, snapshot, ego)
+                profiler.lap('log')
 
                 if counter % 100 == 0 and not args.autopilot:
                     print('random change lane 20%')
                     traffic_manager.ignore_vehicles_percentage(actor_audi, 100) ## crash the car to the side
                     traffic_manager.distance_to_leading_vehicle(actor_audi, 0)
+                    ego_action[1:3] = (100, 0)
                     ## 20% for changing lane
                     r = np.random.randint(0, 10, size=1)
                     if r <= 1: ## ego to change lane
                         lr = np.random.uniform(0.0, 1.0, size=1)
                         if lr < 0.5:
                             traffic_manager.force_lane_change(actor_audi, False) ##turn left
+                            ego_action[0] = -1.0
+                            with lock:
+                                sampling.event(counter, 'lane_change')
                             print('turn left')
                         else:
                             traffic_manager.force_lane_change(actor_audi, True)  ##turn right
+                            ego_action[0] = 1.0
+                            with lock:
+                                sampling.event(counter, 'lane_change')
                             print('turn right')
                     else: ## ego not to change lane
                         traffic_manager.auto_lane_change(actor_audi, False)
+                        ego_action[3] = 0.0
+                    profiler.lap('tm')
                 # elif counter % 502 == 0:
                 #     traffic_manager.ignore_vehicles_percentage(actor_audi, 100) ## crash the car to the side
                 #     traffic_manager.distance_to_leading_vehicle(actor_audi, 0)
                 #     traffic_manager.force_lane_change(actor_audi, True)         ## turn right
                 #     print('turn right')
 
+                with lock:
+                    draw.flush()
+                profiler.lap('draw')
+                traffic_manager.flush()
+                profiler.lap('tm')
+                tick_start = time.perf_counter()
                 world.tick()        ## synchronous mode
+                hybrid.observe(time.perf_counter() - tick_start)
+                profiler.lap('tick')
+                ## collisions of the ego vehicle during this tick
+                collisions = collision_monitor.poll()
+                ## more full physics around the ego vehicle after collisions, one miss per event
+                hybrid.miss(sum(c.count for c in collisions))
+                for collision in collisions:
+                    with lock:
+                        sampling.event(counter, 'collision')
+                    print('collision frame', collision.frame, 'normal frame', frame)
+                    print('against', collision.other_ids, collision.other_types)
+                profiler.lap('collisions')
+                if trace is not None:
+                    trace.append(snapshot, action=ego_action, collisions=collisions)
+                    profiler.lap('log')
 
             else:
                 world.wait_for_tick()   ## asynchronous mode
+                for collision in collision_monitor.poll():
+                    print('collision frame', collision.frame, collision.other_ids, collision.other_types)
                 counter += 1
                 if counter % 100 == 0:
                     print(counter)
@@ -573,8 +697,27 @@ def main():
                     traffic_manager.ignore_vehicles_percentage(actor_audi, 100) ##
                     traffic_manager.force_lane_change(actor_audi, True)
                     print('turn right')
+                traffic_manager.flush()
+            if args.max_ticks and counter >= args.max_ticks:
+                break
     finally:
 
+        pipeline_error = None
+        if pipeline is not None:   ## log the ticks still queued, a logging error is raised after the cleanup
+            pipeline_error = pipeline.close()
+        ## the logged counts of this run are read by sweep.py
+        if recorder is not None:   ## write the buffered rows
+            recorder.close()
+            print('logged %d rows to %s' % (recorder.rows_written, recorder.path))
+        if collision_monitor is not None:
+            collision_monitor.close()
+            print('logged %d collisions' % collision_monitor.rows_written)
+        if trace is not None:
+            trace.close()
+        profiler.close()
+        if hybrid is not None:
+            hybrid.close()
+
         if args.sync and synchronous_master:
             settings = world.get_settings()
             settings.synchronous_mode = False
@@ -584,14 +727,12 @@ def main():
         print('\ndestroying %d vehicles' % len(vehicles_list))
         client.apply_batch([carla.command.DestroyActor(x) for x in vehicles_list])
 
-        # stop walker controllers (list is [controller, actor, controller, actor ...])
-        for i in range(0, len(all_id), 2):
-            all_actors[i].stop()
-
-        print('\ndestroying %d walkers' % len(walkers_list))
-        client.apply_batch([carla.command.DestroyActor(x) for x in all_id])
+        if walkers is not None:     ## stop the controllers, destroy them with the walkers
+            print('\ndestroying %d walkers' % walkers.destroy())
 
         time.sleep(0.5)
+        if pipeline_error is not None:
+            raise pipeline_error
 
 
 if __name__ == '__main__':
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+### Several servers from one process
+### Every server (--slots port:tm_port) gets its own highway session: the
+### vehicles are spawned on autopilot, the first one is the ego vehicle, and
+### every --log_every ticks the ego state with its neighbors is logged to
+### Datasets/<file_name>_<port>.csv. The sessions are driven by one asyncio
+### controller, the blocking ticks of the servers overlap.
+###
+###     python multi_server.py --slots 2000:8000,2002:8001 -n 50 --max_ticks 20000
+
+import glob
+import os
+import sys
+import time
+
+try:
+    sys.path.append(glob.glob('../carla/dist/carla-*%d.%d-%s.egg' % (
+        sys.version_info.major,
+        sys.version_info.minor,
+        'win-amd64' if os.name == 'nt' else 'linux-x86_64'))[0])
+except IndexError:
+    pass
+
+import carla
+
+import argparse
+import logging
+import random
+import numpy as np
+
+## utils
+from utils.async_control import AsyncController, Session
+from utils.lane_index import LaneIndex
+from utils.neighbors import NeighborScanner
+from utils.recorder import ColumnRecorder, FORMATS
+from utils.snapshot import SnapshotReader
+from utils.spawner import VehicleSpawner, VehicleSpec
+from utils.warm_cache import WarmCache
+from sweep import parse_slots     ## the same --slots as the sweep
+
+
+class HighwaySession(Session):
+    """Autopilot vehicles on one server, the ego vehicle and its neighbors are logged"""
+
+    columns = ["Frame", "Ego ID", "Location X", "Location Y", "Velocity X", "Velocity Y", "Rotation Yaw",
+               "Ego Lane ID", "Neighbors", "Nearest Distance"]
+
+    def __init__(self, carla, host, port, tm_port, args, path_dataset):
+        super(HighwaySession, self).__init__(carla, host, port, tm_port, sync=args.sync, map_name=args.map_name)
+        self.args = args
+        self.path_dataset = path_dataset
+        self.vehicles_list = []
+        self.ego_id = None
+        self.recorder = None
+
+    def setup(self):
+        args = self.args
+        world = self.world
+        self.traffic_manager.set_global_distance_to_leading_vehicle(4.0)
+        cache = WarmCache(self.carla, self.client, world, os.path.dirname(self.path_dataset))
+        blueprints = cache.blueprints(args.filterv, wheels=4)
+        spawn_points = cache.spawn_points()
+        random.shuffle(spawn_points)
+        settings = {'distance_to_leading_vehicle': 3.0,
+                    'vehicle_percentage_speed_difference': -(args.velocity - 70),
+                    'auto_lane_change': True,
+                    'ignore_lights_percentage': 100}
+        specs = []
+        for n, transform in enumerate(spawn_points[:args.number_of_vehicles]):
+            blueprint = random.choice(blueprints)
+            blueprint.set_attribute('role_name', 'hero' if n == 0 else 'autopilot')
+            specs.append(VehicleSpec(blueprint, transform, tm_settings=settings, tag='ego' if n == 0 else None))
+        spawner = VehicleSpawner(self.carla, self.client, world, self.traffic_manager, self.tm_port)
+        results = spawner.spawn(specs, self.synchronous_master)
+        for result in results:
+            if not result.ok:
+                logging.error('%s: %s: %s', self.name, result.spec.blueprint.id, result.error)
+                continue
+            self.vehicles_list.append(result.actor_id)
+            if result.spec.tag == 'ego':
+                self.ego_id = result.actor_id
+        if self.ego_id is None:
+            raise RuntimeError('the ego vehicle could not be spawned')
+        print('%s: spawned %d vehicles' % (self.name, len(self.vehicles_list)))
+
+        map = cache.map
+        self.snapshot_reader = SnapshotReader(world, self.vehicles_list)
+        self.neighbor_scanner = NeighborScanner(world, self.vehicles_list[1:], radius=args.radius, max_neighbors=15)
+        self.lane_index = LaneIndex.load_or_build(map, os.path.dirname(self.path_dataset))
+        self.lane_fallback = lambda x, y, z: map.get_waypoint(self.carla.Location(x=x, y=y, z=z)).lane_id
+        dtypes = {c: np.int64 for c in ("Frame", "Ego ID", "Ego Lane ID", "Neighbors")}
+        self.recorder = ColumnRecorder(self.path_dataset, self.columns, dtypes=dtypes, fmt=args.log_format,
+                                       chunk_size=args.log_chunk)
+
+    def step(self):
+        if self.ticks % self.args.log_every:
+            return
+        snapshot = self.snapshot_reader.read()
+        ego = snapshot[self.ego_id]
+        ego_location = tuple(ego.location)
+        neighbors = self.neighbor_scanner.scan(ego_location, snapshot)
+        lane_ids = self.lane_index.query(np.array([ego_location]), fallback=self.lane_fallback)
+        nearest = float(np.sqrt(neighbors.sq_distances[0])) if len(neighbors) else -1.0
+        self.recorder.append([snapshot.frame, self.ego_id, ego.location.x, ego.location.y,
+                              ego.velocity.x, ego.velocity.y, ego.rotation.yaw,
+                              int(lane_ids[0]), len(neighbors), nearest])
+
+    def close(self):
+        if self.recorder is not None:   ## write the buffered rows
+            self.recorder.close()
+        super(HighwaySession, self).close()
+        print('%s: destroying %d vehicles, %d ticks' % (self.name, len(self.vehicles_list), self.ticks))
+        self.client.apply_batch([self.carla.command.DestroyActor(x) for x in self.vehicles_list])
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description=__doc__)
+    argparser.add_argument(
+        '--host',
+        metavar='H',
+        default='127.0.0.1',
+        help='IP of the host of the servers (default: 127.0.0.1)')
+    argparser.add_argument(
+        '--slots',
+        default='2000:8000',
+        help='comma separated port:tm_port of the running servers (default: 2000:8000)')
+    argparser.add_argument(
+        '-n', '--number-of-vehicles',
+        metavar='N',
+        default=50,
+        type=int,
+        help='number of vehicles per server (default: 50)')
+    argparser.add_argument(
+        '--filterv',
+        metavar='PATTERN',
+        default='vehicle.*',
+        help='vehicles filter (default: "vehicle.*")')
+    argparser.add_argument(
+        '--velocity',
+        default=80,
+        type=float,
+        help='velocity (default 80)')
+    argparser.add_argument(
+        '--radius',
+        default=50.0,
+        type=float,
+        help='radius of the neighbors of the ego vehicle (default: 50)')
+    argparser.add_argument(
+        '--sync',
+        action='store_true',
+        help='Synchronous mode execution')
+    argparser.add_argument(
+        '-m', '--map_name',
+        default='Town04',
+        type=str,
+        help='map name to load in the servers (default: Town04)')
+    argparser.add_argument(
+        '--file_name',
+        default='vehicles_multi.csv',
+        type=str,
+        help='dataset name, the port of the server is appended (default: vehicles_multi.csv)')
+    argparser.add_argument(
+        '--log_format',
+        default='csv',
+        choices=FORMATS,
+        help='format of the saved datasets (default: csv)')
+    argparser.add_argument(
+        '--log_chunk',
+        default=1024,
+        type=int,
+        help='number of rows buffered before they are written (default: 1024)')
+    argparser.add_argument(
+        '--log_every',
+        default=20,
+        type=int,
+        help='log every N ticks (default: 20)')
+    argparser.add_argument(
+        '--max_ticks',
+        default=0,
+        type=int,
+        help='stop every server after N ticks (default: 0, run until Ctrl+C)')
+    args = argparser.parse_args()
+
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+
+    ## Datasets path
+    path_dataset = os.getcwd() + "/Datasets/"
+    stem, extension = os.path.splitext(args.file_name)
+    sessions = [HighwaySession(carla, host, port, tm_port, args,
+                               path_dataset + '{}_{}{}'.format(stem, port, extension))
+                for host, port, tm_port in parse_slots(args.slots, args.host)]
+    controller = AsyncController(sessions, max_ticks=args.max_ticks)
+    start = time.time()
+    try:
+        errors = controller.run()
+    finally:
+        print('%d ticks on %d servers in %.0f s' % (sum(s.ticks for s in sessions), len(sessions),
+                                                    time.time() - start))
+    if any(errors):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print('\ndone.')
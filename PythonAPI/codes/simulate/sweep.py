@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+### Sweep of egovehicle_radius.py runs
+### Every combination of the number of vehicles, velocity, ego mode
+### (autopilot / random lane changes) and map is one run. The runs are
+### spread over the simulator slots (port, tm_port): one worker process per
+### slot, a run takes a free slot and gives it back at its end, so one
+### server never gets two runs at the same time. The datasets
+### are named like the manual runs (vehicles_info_car50_velo80_autopilot.csv),
+### a summary table of all runs (with the rows and collisions every run
+### reports at its end) is written to Datasets/sweep_summary.csv.
+###
+###     python sweep.py --vehicles 10,50 --velocities 80,90 --ego both \
+###         --slots 2000:8000,2002:8001 --max_ticks 20000
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'egovehicle_radius.py')
+EGO_MODES = {'auto': 'autopilot', 'lane_change': 'lanechange'}
+
+_slots = None   ## queue of the free (host, port, tm_port) slots
+
+
+def _init_worker(slots):
+    ## the slots are taken per run, a worker the pool starts again does not wait for one here
+    global _slots
+    _slots = slots
+
+
+def grid(vehicles, velocities, ego_modes, maps):
+    """One dict per run, named like the datasets of the manual runs"""
+    runs = []
+    for n, velocity, ego, map_name in itertools.product(vehicles, velocities, ego_modes, maps):
+        name = 'car{}_velo{:g}_{}'.format(n, velocity, EGO_MODES[ego])
+        if len(maps) > 1:
+            name += '_' + map_name
+        runs.append({'name': name, 'vehicles': n, 'velocity': velocity, 'ego': ego, 'map': map_name})
+    return runs
+
+
+def command(run, host, port, tm_port, max_ticks, extra):
+    cmd = [sys.executable, SCRIPT, '--host', host, '-p', str(port), '-tm_p', str(tm_port), '--sync',
+           '-n', str(run['vehicles']), '--velocity', str(run['velocity']), '-m', run['map'],
+           '--ego_auto' if run['ego'] == 'auto' else '--non_ego_auto',
+           '--file_name', 'vehicles_info_{}.csv'.format(run['name']),
+           '--collision_file', 'collision_info_{}.csv'.format(run['name']),
+           '--max_ticks', str(max_ticks)]
+    return cmd + list(extra)
+
+
+def _logged_counts(log_path):
+    """Rows and collisions the run reported at its end (any --log_format), None if it did not"""
+    rows = collisions = None
+    with open(log_path) as log:
+        for line in log:
+            match = re.match(r'logged (\d+) rows to ', line)
+            if match:
+                rows = int(match.group(1))
+            match = re.match(r'logged (\d+) collisions', line)
+            if match:
+                collisions = int(match.group(1))
+    return rows, collisions
+
+
+def _execute(job):
+    run, workdir, max_ticks, extra = job
+    ## as many workers as slots, a slot is only missing while the pool starts a worker again
+    slot = _slots.get()
+    try:
+        host, port, tm_port = slot
+        cmd = command(run, host, port, tm_port, max_ticks, extra)
+        log_path = os.path.join(workdir, 'Datasets', 'sweep_logs', run['name'] + '.log')
+        start = time.time()
+        with open(log_path, 'w') as log:
+            returncode = subprocess.call(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        _slots.put(slot)
+    rows, collisions = _logged_counts(log_path)
+    result = dict(run)
+    result.update({'port': port, 'tm_port': tm_port, 'returncode': returncode,
+                   'seconds': round(time.time() - start, 1), 'rows': rows, 'collisions': collisions,
+                   'log': log_path})
+    return result
+
+
+def parse_slots(text, host):
+    """'2000:8000,2002:8001' -> [(host, 2000, 8000), (host, 2002, 8001)]"""
+    slots = []
+    for item in text.split(','):
+        port, tm_port = item.split(':')
+        slots.append((host, int(port), int(tm_port)))
+    return slots
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='IP of the host of the servers (default: 127.0.0.1)')
+    argparser.add_argument(
+        '--slots',
+        default='2000:8000',
+        help='comma separated port:tm_port of the running servers (default: 2000:8000)')
+    argparser.add_argument(
+        '--vehicles',
+        default='50',
+        help='comma separated numbers of vehicles (default: 50)')
+    argparser.add_argument(
+        '--velocities',
+        default='80',
+        help='comma separated velocities (default: 80)')
+    argparser.add_argument(
+        '--ego',
+        default='auto',
+        choices=('auto', 'lane_change', 'both'),
+        help='ego vehicle on autopilot (--ego_auto), random lane changes (--non_ego_auto) or both')
+    argparser.add_argument(
+        '--maps',
+        default='Town04',
+        help='comma separated maps (default: Town04)')
+    argparser.add_argument(
+        '--max_ticks',
+        default=20000,
+        type=int,
+        help='ticks of every run (default: 20000)')
+    argparser.add_argument(
+        '--workdir',
+        default=os.getcwd(),
+        help='directory the runs are started in, the datasets go to its Datasets/ (default: cwd)')
+    argparser.add_argument(
+        '--dry_run',
+        action='store_true',
+        help='only print the commands')
+    args, extra = argparser.parse_known_args()   ## unknown options are passed to every run
+
+    slots = parse_slots(args.slots, args.host)
+    ego_modes = ['auto', 'lane_change'] if args.ego == 'both' else [args.ego]
+    runs = grid([int(n) for n in args.vehicles.split(',')], [float(v) for v in args.velocities.split(',')],
+                ego_modes, args.maps.split(','))
+    if args.dry_run:
+        for k, run in enumerate(runs):
+            print(' '.join(command(run, *slots[k % len(slots)], max_ticks=args.max_ticks, extra=extra)))
+        return
+
+    datasets = os.path.join(args.workdir, 'Datasets')
+    if not os.path.isdir(os.path.join(datasets, 'sweep_logs')):
+        os.makedirs(os.path.join(datasets, 'sweep_logs'))
+    print('%d runs on %d servers' % (len(runs), len(slots)))
+
+    ctx = multiprocessing.get_context()
+    slot_queue = ctx.Queue()
+    for slot in slots:
+        slot_queue.put(slot)
+    results = []
+    pool = ctx.Pool(len(slots), initializer=_init_worker, initargs=(slot_queue,))
+    try:
+        jobs = [(run, args.workdir, args.max_ticks, extra) for run in runs]
+        for result in pool.imap_unordered(_execute, jobs):
+            results.append(result)
+            print('[%d/%d] %s on port %d: return code %d, %s rows, %.0f s' % (
+                len(results), len(runs), result['name'], result['port'], result['returncode'],
+                result['rows'], result['seconds']))
+    finally:
+        pool.close()
+        pool.join()
+
+    summary = pd.DataFrame(results, columns=['name', 'vehicles', 'velocity', 'ego', 'map', 'port', 'tm_port',
+                                             'returncode', 'seconds', 'rows', 'collisions', 'log'])
+    summary = summary.sort_values('name')
+    summary.to_csv(os.path.join(datasets, 'sweep_summary.csv'), index=False)
+    print(summary.drop(columns=['log']).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
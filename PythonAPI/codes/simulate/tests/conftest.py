@@ -0,0 +1,36 @@
+### The tests run the scripts and utils against utils.fake_carla, no server
+### is needed. The scripts import carla, the fixture swaps in the fake.
+
+import os
+import sys
+import types
+
+import pytest
+
+SIMULATE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SIMULATE)
+
+from utils import fake_carla
+
+
+@pytest.fixture
+def fake_server(monkeypatch, tmp_path):
+    """carla is utils.fake_carla, the working directory a temporary one with Datasets/"""
+    monkeypatch.setitem(sys.modules, 'carla', fake_carla)
+    try:
+        import utils.ego_to_exit
+    except ImportError:     ## not in the tree, egovehicle_radius.py only imports it
+        stub = types.ModuleType('utils.ego_to_exit')
+        stub.get_exit_waypoint = None
+        monkeypatch.setitem(sys.modules, 'utils.ego_to_exit', stub)
+    (tmp_path / 'Datasets').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def run_script(monkeypatch, name, *args):
+    """Run main() of a script with the command line args"""
+    import runpy
+    monkeypatch.setattr(sys, 'argv', [name] + [str(x) for x in args])
+    script = runpy.run_path(os.path.join(SIMULATE, name), run_name='script')
+    script['main']()
@@ -0,0 +1,18 @@
+import numpy as np
+
+from conftest import run_script
+from utils.trace import TraceReader
+
+
+def test_episodes_start_from_the_reset(fake_server, monkeypatch):
+    run_script(monkeypatch, 'egovehicle_radius.py', '--sync', '-n', 10, '--no_walkers', '--no_draw', '-wayr',
+               '--max_ticks', 180, '--reset_every', 60, '--trace', 'trace', '-p', 5001, '-tm_p', 9501)
+    trace = TraceReader(str(fake_server / 'Datasets' / 'trace'))
+    assert trace.num_episodes == 3
+    ego = np.asarray(trace['states'][:, 0, :2])     ## x, y of the ego vehicle
+    start = ego[trace.episode(0)[0]]
+    for k in range(1, trace.num_episodes):
+        first, _ = trace.episode(k)
+        ## the first row shows the ego vehicle back at its start, not where the last episode ended
+        assert np.allclose(ego[first], start, atol=0.5)
+        assert np.linalg.norm(ego[first - 1] - start) > 5.0
@@ -0,0 +1,16 @@
+from utils import fake_carla as carla
+
+
+def test_snapshot_changes_only_on_tick():
+    client = carla.Client('localhost', 5002)
+    world = client.get_world()
+    blueprint = world.get_blueprint_library().find('vehicle.audi.tt')
+    start, other = world.get_map().get_spawn_points()[:2]
+    actor = world.spawn_actor(blueprint, start)
+    world.tick()
+    before = world.get_snapshot().find(actor.id).get_transform().location
+    ## like the server, a teleport between ticks is only seen in the snapshot of the next tick
+    client.apply_batch_sync([carla.command.ApplyTransform(actor.id, other)])
+    assert world.get_snapshot().find(actor.id).get_transform().location == before
+    world.tick()
+    assert world.get_snapshot().find(actor.id).get_transform().location.distance(other.location) < 1.0
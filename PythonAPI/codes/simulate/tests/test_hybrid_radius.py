@@ -0,0 +1,42 @@
+from utils.hybrid_radius import HybridRadius
+
+
+class TrafficManager(object):
+    def set_hybrid_physics_mode(self, enabled):
+        pass
+
+    def set_hybrid_physics_radius(self, radius):
+        self.radius = radius
+
+
+def window(hybrid, seconds, misses=0):
+    hybrid.miss(misses)
+    for _ in range(hybrid.window):
+        hybrid.observe(seconds)
+
+
+def test_margin_grows_only_with_misses():
+    traffic_manager = TrafficManager()
+    hybrid = HybridRadius(traffic_manager, observation_radius=50.0, budget=0.05, margin=10.0, step=5.0,
+                          max_margin=20.0, window=10)
+    for _ in range(5):      ## fast ticks alone keep the minimum
+        window(hybrid, 0.001)
+    assert hybrid.margin == 10.0
+    window(hybrid, 0.001, misses=3)
+    assert hybrid.margin == 15.0 and traffic_manager.radius == 65.0
+    window(hybrid, 0.001, misses=1)
+    window(hybrid, 0.001, misses=1)
+    assert hybrid.margin == 20.0    ## max_margin
+    window(hybrid, 0.001)
+    window(hybrid, 0.001)
+    window(hybrid, 0.001)
+    assert hybrid.margin == 10.0    ## back to the minimum without misses
+
+
+def test_margin_shrinks_over_budget():
+    hybrid = HybridRadius(TrafficManager(), observation_radius=50.0, budget=0.05, margin=10.0, step=5.0, window=10)
+    window(hybrid, 0.1, misses=2)
+    window(hybrid, 0.1)
+    assert hybrid.radius == 50.0 and not hybrid.over_budget
+    window(hybrid, 0.1)
+    assert hybrid.over_budget
@@ -0,0 +1,26 @@
+import sys
+
+import pandas as pd
+
+import sweep
+
+## stands in for egovehicle_radius.py, reports its counts like it
+CHILD = '''
+import sys
+n = int(sys.argv[sys.argv.index('-n') + 1])
+print('logged %d rows to Datasets/x.npz' % (10 * n))
+print('logged %d collisions' % n)
+'''
+
+
+def test_rows_reported_by_every_run(tmp_path, monkeypatch):
+    child = tmp_path / 'child.py'
+    child.write_text(CHILD)
+    monkeypatch.setattr(sweep, 'SCRIPT', str(child))
+    monkeypatch.setattr(sys, 'argv', ['sweep.py', '--vehicles', '1,2,3', '--slots', '2000:8000,2002:8001',
+                                      '--workdir', str(tmp_path), '--log_format', 'npz'])
+    sweep.main()
+    summary = pd.read_csv(tmp_path / 'Datasets' / 'sweep_summary.csv')
+    assert list(summary['rows']) == [10, 20, 30]
+    assert list(summary['collisions']) == [1, 2, 3]
+    assert set(summary['port']) <= {2000, 2002}
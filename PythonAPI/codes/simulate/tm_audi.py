@@ -11,7 +11,7 @@ import glob
 import os
 import sys
 import time
-import pandas as pd
+import numpy as np
 
 try:
     sys.path.append(glob.glob('../carla/dist/carla-*%d.%d-%s.egg' % (
@@ -28,6 +28,17 @@ import logging
 import random
 import copy
 
+## utils
+from utils.recorder import ColumnRecorder, FORMATS
+from utils.actor_pool import ensure_world
+from utils.snapshot import SnapshotReader
+from utils.spawner import VehicleSpawner, VehicleSpec
+from utils.sampling import add_sampling_arguments, policy_from_args
+from utils.tm_proxy import TrafficManagerProxy
+from utils.pipeline import TickPipeline
+from utils.warm_cache import WarmCache, UNSAFE
+from utils.walkers import WalkerCrowd
+
 
 def main():
     argparser = argparse.ArgumentParser(
@@ -55,6 +66,10 @@ def main():
         default=50,
         type=int,
         help='number of walkers (default: 50)')
+    argparser.add_argument(
+        '--no_walkers',
+        action='store_true',
+        help='no walkers, e.g. on the highway (Town04)')
     argparser.add_argument(
         '--assigned',
         default=True,
@@ -95,30 +110,47 @@ def main():
         default='Town01',
         type=str,
         help='map name to load in the server (default: Town01)')
+    argparser.add_argument(
+        '--log_format',
+        default='csv',
+        choices=FORMATS,
+        help='format of the saved dataset (default: csv)')
+    argparser.add_argument(
+        '--log_chunk',
+        default=1024,
+        type=int,
+        help='number of rows buffered before they are written (default: 1024)')
+    add_sampling_arguments(argparser, stride=60)
+    argparser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='log a tick on a worker thread while the next tick runs')
+    argparser.add_argument(
+        '--pipeline_depth',
+        default=2,
+        type=int,
+        help='ticks waiting for the logging thread before the loop waits (default: 2)')
     args = argparser.parse_args()
     args.width, args.height = [int(x) for x in args.res.split('x')]
 
     logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
     vehicles_list = []
-    walkers_list = []
-    all_id = []
+    walkers = None
     client = carla.Client(args.host, args.port)
-    client.load_world(map_name=args.map_name)
     client.set_timeout(10.0)
+    ensure_world(client, args.map_name)   ## the map is only loaded if the server runs another one
 
     ## Datasets path
     path_dataset = os.getcwd() + "/Datasets/"
     dataset_name = "audi_tt.csv"
     path_dataset = path_dataset + dataset_name
-
-    if os.path.isfile(path_dataset):
-        newfile = False
-    else:
-        newfile = True
+    recorder = None
+    pipeline = None
 
     try:
-        traffic_manager = client.get_trafficmanager(args.tm_port)
+        ## the per vehicle settings are sent once per tick, unchanged ones are dropped
+        traffic_manager = TrafficManagerProxy(client.get_trafficmanager(args.tm_port))
 
         ## tm set the global distance to other vehicles
         traffic_manager.set_global_distance_to_leading_vehicle(4.0)
@@ -139,8 +171,9 @@ def main():
             else:
                 synchronous_master = False
 
-        blueprints = world.get_blueprint_library().filter(args.filterv)
-        blueprintsWalkers = world.get_blueprint_library().filter(args.filterw)
+        ## blueprint ids and spawn points of the map are cached under Datasets/warm_cache
+        cache = WarmCache(carla, client, world, os.path.dirname(path_dataset))
+        blueprintsWalkers = cache.blueprints(args.filterw)
 
         ## get traffic lights and set them to green
         # actor_trafficlights = world.get_actors().filter('traffic.traffic_light*')
@@ -149,13 +182,11 @@ def main():
         # print(actor_trafficlights[0])
 
         if args.safe:
-            blueprints = [x for x in blueprints if int(x.get_attribute('number_of_wheels')) == 4]
-            blueprints = [x for x in blueprints if not x.id.endswith('isetta')]
-            blueprints = [x for x in blueprints if not x.id.endswith('carlacola')]
-            blueprints = [x for x in blueprints if not x.id.endswith('cybertruck')]
-            blueprints = [x for x in blueprints if not x.id.endswith('t2')]
+            blueprints = cache.blueprints(args.filterv, wheels=4, exclude=UNSAFE)
+        else:
+            blueprints = cache.blueprints(args.filterv)
 
-        spawn_points = world.get_map().get_spawn_points()
+        spawn_points = cache.spawn_points()
         number_of_spawn_points = len(spawn_points)
 
         if args.number_of_vehicles < number_of_spawn_points:
@@ -174,21 +205,19 @@ def main():
         # --------------
         # Spawn vehicles
         # --------------
-        batch = []
         blueprint_audi = None          ## for audi tt
         blueprint_toyota = None        ## for toyota prius 3 Cars
         vehicle_actors = []
         if args.assigned:   ### assign special car, here is audi
             if blueprint_audi is None:
-                blueprint_audi = world.get_blueprint_library().filter('vehicle.audi.tt')   ## actorblueprint, transform, rotation
+                blueprint_audi = cache.blueprints('vehicle.audi.tt')   ## actorblueprint, transform, rotation
                 actorblueprint_audi = blueprint_audi[0]
             if blueprint_toyota is None:
-                blueprint_toyota = world.get_blueprint_library().filter('vehicle.toyota.prius')   ## actorblueprint, transform, rotation
-                blueprint_toyota1 = world.get_blueprint_library().filter('vehicle.toyota.prius')
-                blueprint_toyota2 = world.get_blueprint_library().filter('vehicle.toyota.prius')
-                bp_toyota_list = [blueprint_toyota, blueprint_toyota1, blueprint_toyota2]
-                actor_toyota_list = [blueprint_toyota[0], blueprint_toyota1[0], blueprint_toyota2[0]]
+                ## one copy of the blueprint per toyota, each gets its own color
+                actor_toyota_list = [cache.blueprint('vehicle.toyota.prius') for _ in range(3)]
+                blueprint_toyota = bp_toyota_list = actor_toyota_list
 
+        vehicle_specs = []
         for n, transform in enumerate(spawn_points):
             if n >= args.number_of_vehicles - 2:
                 break
@@ -211,18 +240,12 @@ def main():
                 transform.rotation.pitch = 0
                 transform.rotation.roll = 0
                 print(transform)
-                # print(type(blueprint_audi))
-                # actor_audi = SpawnActor(actorblueprint_audi, transform).then(SetAutopilot(FutureActor, True))
-                actor_audi = world.spawn_actor(actorblueprint_audi, transform)
-                print(actor_audi)
-                vehicle_actors.append(actor_audi)
-                traffic_manager.distance_to_leading_vehicle(actor_audi, 2.0) ## set the minimum distance in meters to keep with the others
-
-                traffic_manager.vehicle_percentage_speed_difference(actor_audi, 30.0)
-                actor_audi.set_autopilot()
-                traffic_manager.auto_lane_change(actor_audi, False)  ### not change the lane (force to ride on highway)?
-                traffic_manager.ignore_vehicles_percentage(actor_audi, 0)
-                traffic_manager.ignore_lights_percentage(actor_audi, 100)
+                vehicle_specs.append(VehicleSpec(actorblueprint_audi, transform, tag='ego', tm_settings={
+                    'distance_to_leading_vehicle': 2.0,  ## set the minimum distance in meters to keep with the others
+                    'vehicle_percentage_speed_difference': 30.0,
+                    'auto_lane_change': False,   ### not change the lane (force to ride on highway)?
+                    'ignore_vehicles_percentage': 0,
+                    'ignore_lights_percentage': 100}))
             elif n == 1 and bp_toyota_list is not None: ## the attribute setting for toyota
                 actor_toyota_list[0].set_attribute('role_name', 'autopilot')  # set the autopilot  ## hero?
                 actor_toyota_list[1].set_attribute('role_name', 'autopilot')  # set the autopilot  ## hero?
@@ -230,41 +253,19 @@ def main():
                 actor_toyota_list[0].set_attribute('color', '0,255,0')  # set the color of the toyota
                 actor_toyota_list[1].set_attribute('color', '0,255,255')  # set the color of the toyota
                 actor_toyota_list[2].set_attribute('color', '255,255,255')  # set the color of the toyota
-                ## set the starting point on the highway
-                transform.location.x = -5.9
-                transform.location.y = -39.15  ## -146.11
-                transform.rotation.yaw = 90
-                transform.rotation.pitch = 0
-                transform.rotation.roll = 0
-                print(transform)
-                actor_toyota = world.spawn_actor(actor_toyota_list[0], transform)
-                transform.location.x = -9.25
-                print(transform)
-                actor_toyota1 = world.spawn_actor(actor_toyota_list[1], transform)
-                transform.location.x = -13.03
-                print(transform)
-                actor_toyota2 = world.spawn_actor(actor_toyota_list[2], transform)
-                vehicle_actors.append(actor_toyota)
-                vehicle_actors.append(actor_toyota1)
-                vehicle_actors.append(actor_toyota2)
-                traffic_manager.distance_to_leading_vehicle(actor_toyota, 2.0)  ## set the minimum distance in meters to keep with the others
-                traffic_manager.distance_to_leading_vehicle(actor_toyota1, 4.0)  ## set the minimum distance in meters to keep with the others
-                traffic_manager.distance_to_leading_vehicle(actor_toyota2, 6.0)  ## set the minimum distance in meters to keep with the others
-                traffic_manager.vehicle_percentage_speed_difference(actor_toyota, -10.0)
-                traffic_manager.vehicle_percentage_speed_difference(actor_toyota1, -10.0)
-                traffic_manager.vehicle_percentage_speed_difference(actor_toyota2, -10.0)
-                traffic_manager.auto_lane_change(actor_toyota, False)  ### not change the lane (force to ride on highway)?
-                traffic_manager.auto_lane_change(actor_toyota1, False)  ### not change the lane (force to ride on highway)?
-                traffic_manager.auto_lane_change(actor_toyota2, False)  ### not change the lane (force to ride on highway)?
-                actor_toyota1.set_autopilot()
-                actor_toyota.set_autopilot()
-                actor_toyota2.set_autopilot()
-                traffic_manager.ignore_lights_percentage(actor_toyota, 100)
-                traffic_manager.ignore_lights_percentage(actor_toyota1, 100)
-                traffic_manager.ignore_lights_percentage(actor_toyota2, 100)
-                traffic_manager.ignore_vehicles_percentage(actor_toyota, 70)
-                traffic_manager.ignore_vehicles_percentage(actor_toyota1, 50)
-                traffic_manager.ignore_vehicles_percentage(actor_toyota2, 30)
+                ## set the starting point on the highway, one toyota per lane
+                ## distance to the leading vehicle and ignored vehicles differ per toyota
+                for bp_toyota, x, distance, ignore in zip(actor_toyota_list, [-5.9, -9.25, -13.03],
+                                                          [2.0, 4.0, 6.0], [70, 50, 30]):
+                    toyota_transform = carla.Transform(carla.Location(x=x, y=-39.15, z=transform.location.z),   ## -146.11
+                                                       carla.Rotation(pitch=0, yaw=90, roll=0))
+                    print(toyota_transform)
+                    vehicle_specs.append(VehicleSpec(bp_toyota, toyota_transform, tag='toyota', tm_settings={
+                        'distance_to_leading_vehicle': distance,
+                        'vehicle_percentage_speed_difference': -10.0,
+                        'auto_lane_change': False,   ### not change the lane (force to ride on highway)?
+                        'ignore_lights_percentage': 100,
+                        'ignore_vehicles_percentage': ignore}))
             else:
                 # mul = 3.5
                 blueprint.set_attribute('role_name', 'autopilot')
@@ -291,14 +292,22 @@ def main():
                 #     actor = world.spawn_actor(blueprint, transform)
                 #     actor.set_autopilot()
                 #     traffic_manager.auto_lane_change(actor, False)  ### not change the lane (force to ride on highway)?
-                batch.append(SpawnActor(blueprint, transform).then(SetAutopilot(FutureActor, True)))
+                vehicle_specs.append(VehicleSpec(blueprint, transform))
                 # vehicle_actors.append(world.spawn_actor(blueprint, transform))
         # print(dir(traffic_manager))
-        for response in client.apply_batch_sync(batch, synchronous_master):
-            if response.error:
-                logging.error(response.error)
-            else:
-                vehicles_list.append(response.actor_id)
+        ## all vehicles in one round trip
+        spawner = VehicleSpawner(carla, client, world, traffic_manager, args.tm_port)
+        actor_audi = None
+        for result in spawner.spawn(vehicle_specs, synchronous_master):
+            if not result.ok:
+                logging.error('%s: %s', result.spec.blueprint.id, result.error)
+                continue
+            vehicles_list.append(result.actor_id)
+            if result.spec.tag is not None:   ## audi and toyotas
+                vehicle_actors.append(world.get_actor(result.actor_id))
+            if result.spec.tag == 'ego':
+                actor_audi = vehicle_actors[-1]
+        print(actor_audi)
 
         # -------------
         # Spawn Walkers
@@ -306,80 +315,43 @@ def main():
         # some settings
         percentagePedestriansRunning = 0.0  # how many pedestrians will run
         percentagePedestriansCrossing = 0.0  # how many pedestrians will walk through the road
-        # 1. take all the random locations to spawn
-        spawn_points = []
-        for i in range(args.number_of_walkers):
-            spawn_point = carla.Transform()
-            loc = world.get_random_location_from_navigation()
-            if (loc != None):
-                spawn_point.location = loc
-                spawn_points.append(spawn_point)
-        # 2. we spawn the walker object
-        batch = []
-        walker_speed = []
-        for spawn_point in spawn_points:
-            walker_bp = random.choice(blueprintsWalkers)
-            # set as not invincible
-            if walker_bp.has_attribute('is_invincible'):
-                walker_bp.set_attribute('is_invincible', 'false')
-            # set the max speed
-            if walker_bp.has_attribute('speed'):
-                if (random.random() > percentagePedestriansRunning):
-                    # walking
-                    walker_speed.append(walker_bp.get_attribute('speed').recommended_values[1])
-                else:
-                    # running
-                    walker_speed.append(walker_bp.get_attribute('speed').recommended_values[2])
-            else:
-                print("Walker has no speed")
-                walker_speed.append(0.0)
-            batch.append(SpawnActor(walker_bp, spawn_point))
-        results = client.apply_batch_sync(batch, True)
-        walker_speed2 = []
-        for i in range(len(results)):
-            if results[i].error:
-                logging.error(results[i].error)
-            else:
-                walkers_list.append({"id": results[i].actor_id})
-                walker_speed2.append(walker_speed[i])
-        walker_speed = walker_speed2
-        # 3. we spawn the walker controller
-        batch = []
-        walker_controller_bp = world.get_blueprint_library().find('controller.ai.walker')
-        for i in range(len(walkers_list)):
-            batch.append(SpawnActor(walker_controller_bp, carla.Transform(), walkers_list[i]["id"]))
-        results = client.apply_batch_sync(batch, True)
-        for i in range(len(results)):
-            if results[i].error:
-                logging.error(results[i].error)
-            else:
-                walkers_list[i]["con"] = results[i].actor_id
-        # 4. we put altogether the walkers and controllers id to get the objects from their id
-        for i in range(len(walkers_list)):
-            all_id.append(walkers_list[i]["con"])
-            all_id.append(walkers_list[i]["id"])
-        all_actors = world.get_actors(all_id)
+        ## walkers and their controllers in two batches, none at all with --no_walkers
+        walkers = WalkerCrowd(carla, client, world, blueprintsWalkers, cache.blueprint('controller.ai.walker'))
+        walkers.spawn(0 if args.no_walkers else args.number_of_walkers, percentagePedestriansRunning,
+                      do_tick=synchronous_master)
 
+        traffic_manager.flush()
         # wait for a tick to ensure client receives the last transform of the walkers we have just created
         if not args.sync or not synchronous_master:
             world.wait_for_tick()
         else:
             world.tick()
 
-        # 5. initialize each controller and set target to walk to (list is [controler, actor, controller, actor ...])
-        # set how many pedestrians can cross the road
-        world.set_pedestrians_cross_factor(percentagePedestriansCrossing)
-        for i in range(0, len(all_id), 2):
-            # start walker
-            all_actors[i].start()
-            # set walk to random point
-            all_actors[i].go_to_location(world.get_random_location_from_navigation())
-            # max speed
-            all_actors[i].set_max_speed(float(walker_speed[int(i / 2)]))
-
-        print('spawned %d vehicles and %d walkers, press Ctrl+C to exit.' % (len(vehicles_list), len(walkers_list)))
-
-
+        # 5. initialize each controller and set target to walk to
+        walkers.start(percentagePedestriansCrossing)
+
+        print('spawned %d vehicles and %d walkers, press Ctrl+C to exit.' % (len(vehicles_list), len(walkers)))
+
+
+        data_columns = ["Frame", "Location X", "Location Y", "Location Z", "Rotation Yaw", "Rotation Pitch", "Rotation Roll", "Velocity X", "Velocity Y", "Velocity Z",
+                        "Acceleration X", "Acceleration Y", "Acceleration Z", "Angular Velocity X", "Angular Velocity Y", "Angular Velocity Z"]
+        recorder = ColumnRecorder(path_dataset, data_columns, dtypes={"Frame": np.int64}, fmt=args.log_format,
+                                  chunk_size=args.log_chunk)
+        ## the ego state is read once per logged frame from the world snapshot
+        snapshot_reader = SnapshotReader(world, [actor_audi.id])
+        sampling = policy_from_args(args)    ## which ticks are logged
+
+        def log_tick(frame, snapshot):
+            ## the dataset row of the ego vehicle
+            ego = snapshot[actor_audi.id]
+            data_list = [frame, ego.location.x, ego.location.y, ego.location.z,
+                         ego.rotation.yaw, ego.rotation.pitch, ego.rotation.roll,
+                         ego.velocity.x, ego.velocity.y, ego.velocity.z,
+                         ego.acceleration.x, ego.acceleration.y, ego.acceleration.z,
+                         ego.angular_velocity.x, ego.angular_velocity.y, ego.angular_velocity.z]
+            recorder.append(data_list)
+        ## with --pipeline the row is built and written while the next tick runs
+        pipeline = TickPipeline(log_tick, maxsize=args.pipeline_depth, enabled=args.pipeline)
         counter = 0
         frame = 0
         # traffic_manager.set_hybrid_physics_mode(True)
@@ -393,22 +365,10 @@ def main():
                     traffic_manager.distance_to_leading_vehicle(actor_audi, 2)
                     # for vehicle in vehicle_actors[1:]:
                     #     traffic_manager.collision_detection(actor_audi, vehicle, True)
-                if counter % 60 == 0:
+                if sampling.sample(counter):
                     # save the dataframe as a list
-                    data_list = [frame, actor_audi.get_transform().location.x, actor_audi.get_transform().location.y, actor_audi.get_transform().location.z,
-                                 actor_audi.get_transform().rotation.yaw, actor_audi.get_transform().rotation.pitch, actor_audi.get_transform().rotation.roll,
-                                 actor_audi.get_velocity().x, actor_audi.get_velocity().y, actor_audi.get_velocity().z,
-                                 actor_audi.get_acceleration().x, actor_audi.get_acceleration().y, actor_audi.get_acceleration().z,
-                                 actor_audi.get_angular_velocity().x, actor_audi.get_angular_velocity().y, actor_audi.get_angular_velocity().z]
-                    data_columns = ["Frame", "Location X", "Location Y", "Location Z", "Rotation Yaw", "Rotation Pitch", "Rotation Roll", "Velocity X", "Velocity Y", "Velocity Z",
-                                    "Acceleration X", "Acceleration Y", "Acceleration Z", "Angular Velocity X", "Angular Velocity Y", "Angular Velocity Z"]
-                    audi_tt_df = pd.DataFrame([data_list], columns=data_columns)
+                    pipeline.submit(frame, snapshot_reader.read())
                     frame += 1
-                    if newfile:
-                        audi_tt_df.to_csv(path_dataset, index=False)
-                        newfile = False
-                    else:
-                        audi_tt_df.to_csv(path_dataset, header=None, mode="a", index=False)
 
                 if counter % 200 == 0:
                     # for vehicle in vehicle_actors[1:]:
@@ -416,6 +376,7 @@ def main():
                     traffic_manager.ignore_vehicles_percentage(actor_audi, 100) ## crash the car to the side
                     traffic_manager.distance_to_leading_vehicle(actor_audi, 0)
                     traffic_manager.force_lane_change(actor_audi, False)        ## turn left
+                    sampling.event(counter, 'lane_change')
                     print('turn left')
                 elif counter % 502 == 0:
                     # for vehicle in vehicle_actors[1:]:
@@ -423,6 +384,7 @@ def main():
                     traffic_manager.ignore_vehicles_percentage(actor_audi, 100) ## crash the car to the side
                     traffic_manager.distance_to_leading_vehicle(actor_audi, 0)
                     traffic_manager.force_lane_change(actor_audi, True)         ## turn right
+                    sampling.event(counter, 'lane_change')
                     print('turn right')
 
                 ## turn the light to green
@@ -432,6 +394,7 @@ def main():
                 #         if traffic_light.get_state() == carla.TrafficLightState.Red:
                 #             traffic_light.set_state(carla.TrafficLightState.Green)
 
+                traffic_manager.flush()
                 world.tick()        ## synchronous mode
 
             else:
@@ -447,8 +410,15 @@ def main():
                     traffic_manager.ignore_vehicles_percentage(actor_audi, 100) ##
                     traffic_manager.force_lane_change(actor_audi, True)
                     print('turn right')
+                traffic_manager.flush()
     finally:
 
+        pipeline_error = None
+        if pipeline is not None:   ## log the ticks still queued, a logging error is raised after the cleanup
+            pipeline_error = pipeline.close()
+        if recorder is not None:   ## write the buffered rows
+            recorder.close()
+
         if args.sync and synchronous_master:
             settings = world.get_settings()
             settings.synchronous_mode = False
@@ -458,14 +428,12 @@ def main():
         print('\ndestroying %d vehicles' % len(vehicles_list))
         client.apply_batch([carla.command.DestroyActor(x) for x in vehicles_list])
 
-        # stop walker controllers (list is [controller, actor, controller, actor ...])
-        for i in range(0, len(all_id), 2):
-            all_actors[i].stop()
-
-        print('\ndestroying %d walkers' % len(walkers_list))
-        client.apply_batch([carla.command.DestroyActor(x) for x in all_id])
+        if walkers is not None:     ## stop the controllers, destroy them with the walkers
+            print('\ndestroying %d walkers' % walkers.destroy())
 
         time.sleep(0.5)
+        if pipeline_error is not None:
+            raise pipeline_error
 
 
 if __name__ == '__main__':
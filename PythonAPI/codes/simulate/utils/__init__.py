@@ -0,0 +1 @@
+## helpers shared by the simulate scripts
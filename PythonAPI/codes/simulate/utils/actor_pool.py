@@ -0,0 +1,73 @@
+### Episode reset without destroying the vehicles
+### The vehicles spawned once are kept alive, a reset teleports them back to
+### start transforms and zeroes their velocities with one batch. Only the
+### vehicles which are gone are spawned again.
+
+
+def ensure_world(client, map_name):
+    """Load map_name only if the server runs another map, return the world"""
+    world = client.get_world()
+    ## the map name is 'Town04' or '/Game/Carla/Maps/Town04' depending on the version
+    if world.get_map().name.split('/')[-1] != map_name.split('/')[-1]:
+        world = client.load_world(map_name)
+    return world
+
+
+class ActorPool(object):
+    """The vehicles of an episode, reset by teleport.
+
+    results are the SpawnResults of a utils.spawner.VehicleSpawner, failed
+    specs are kept too and spawned again on the next reset.
+    """
+
+    def __init__(self, carla, client, world, spawner, results):
+        self.carla = carla
+        self.client = client
+        self.world = world
+        self.spawner = spawner
+        self.specs = [r.spec for r in results]
+        self.ids = [r.actor_id for r in results]
+        self.respawned = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _velocity_commands(self):
+        command = self.carla.command
+        ## the commands were renamed in carla 0.9.11
+        apply_velocity = getattr(command, 'ApplyVelocity', None) or command.ApplyTargetVelocity
+        apply_angular = getattr(command, 'ApplyAngularVelocity', None) or command.ApplyTargetAngularVelocity
+        return apply_velocity, apply_angular
+
+    def reset(self, transforms=None, do_tick=False):
+        """Move every vehicle to its start transform (the spec transform by default).
+
+        Returns the list of actor ids, ids of vehicles which had to be spawned
+        again change, self.respawned counts them.
+        """
+        if transforms is None:
+            transforms = [spec.transform for spec in self.specs]
+        alive = set(a.id for a in self.world.get_actors([i for i in self.ids if i is not None]))
+        missing = [k for k, actor_id in enumerate(self.ids) if actor_id not in alive]
+        skip = set(missing)
+        self.respawned = 0
+        if missing:
+            for k in missing:
+                self.specs[k].transform = transforms[k]
+            results = self.spawner.spawn([self.specs[k] for k in missing])
+            for k, result in zip(missing, results):
+                self.ids[k] = result.actor_id
+                self.respawned += result.ok
+
+        command = self.carla.command
+        apply_velocity, apply_angular = self._velocity_commands()
+        zero = self.carla.Vector3D(0.0, 0.0, 0.0)
+        batch = []
+        for k, (actor_id, transform) in enumerate(zip(self.ids, transforms)):
+            if k in skip:
+                continue
+            batch += [command.ApplyTransform(actor_id, transform),
+                      apply_velocity(actor_id, zero),
+                      apply_angular(actor_id, zero)]
+        self.client.apply_batch_sync(batch, do_tick)
+        return list(self.ids)
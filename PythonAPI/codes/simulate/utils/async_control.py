@@ -0,0 +1,124 @@
+### Several simulators driven from one process
+### Every server is a Session (client, world and traffic manager of one
+### port / tm_port pair). The blocking calls of a session (connect, setup,
+### tick, step, close) run in a thread pool, one asyncio task per session
+### interleaves its waits with the other ones: while one server simulates
+### its tick, the snapshots of the others are read and logged. A session
+### which fails is closed and reported, the others keep running.
+###
+###     sessions = [MySession(carla, '127.0.0.1', 2000, 8000), MySession(carla, '127.0.0.1', 2002, 8001)]
+###     AsyncController(sessions, max_ticks=1000).run()
+
+import asyncio
+import concurrent.futures
+import logging
+
+from utils.actor_pool import ensure_world
+from utils.tm_proxy import TrafficManagerProxy
+
+
+class Session(object):
+    """One client / traffic manager pair.
+
+    carla is the carla module (or utils.fake_carla). Subclasses spawn their
+    actors in setup() and do the client work of a tick (read, log) in
+    step(). All methods block, the controller runs them in its executor.
+    """
+
+    def __init__(self, carla, host, port, tm_port, sync=True, delta_seconds=0.05, timeout=10.0, map_name=None):
+        self.carla = carla
+        self.host = host
+        self.port = port
+        self.tm_port = tm_port
+        self.map_name = map_name
+        self.sync = sync
+        self.delta_seconds = delta_seconds
+        self.timeout = timeout
+        self.client = None
+        self.world = None
+        self.traffic_manager = None
+        self.synchronous_master = False
+        self.ticks = 0
+        self.frame = None
+
+    @property
+    def name(self):
+        return '{}:{}'.format(self.host, self.port)
+
+    def connect(self):
+        self.client = self.carla.Client(self.host, self.port)
+        self.client.set_timeout(self.timeout)
+        if self.map_name:   ## the map is only loaded if the server runs another one
+            ensure_world(self.client, self.map_name)
+        self.world = self.client.get_world()
+        ## the per vehicle settings are sent once per tick, unchanged ones are dropped
+        self.traffic_manager = TrafficManagerProxy(self.client.get_trafficmanager(self.tm_port))
+        if self.sync:
+            self.traffic_manager.set_synchronous_mode(True)
+            settings = self.world.get_settings()
+            if not settings.synchronous_mode:
+                self.synchronous_master = True
+                settings.synchronous_mode = True
+                settings.fixed_delta_seconds = self.delta_seconds
+                self.world.apply_settings(settings)
+
+    def setup(self):
+        pass
+
+    def tick(self):
+        self.traffic_manager.flush()
+        if self.synchronous_master:
+            self.frame = self.world.tick()
+        else:
+            self.frame = self.world.wait_for_tick().frame
+        self.ticks += 1
+
+    def step(self):
+        pass
+
+    def close(self):
+        if self.synchronous_master:
+            settings = self.world.get_settings()
+            settings.synchronous_mode = False
+            settings.fixed_delta_seconds = None
+            self.world.apply_settings(settings)
+
+
+class AsyncController(object):
+    """Drives the sessions concurrently, max_ticks per session (0: until stop())"""
+
+    def __init__(self, sessions, max_ticks=0):
+        self.sessions = list(sessions)
+        self.max_ticks = max_ticks
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def _running(self, session):
+        return not self._stopped and (not self.max_ticks or session.ticks < self.max_ticks)
+
+    async def _drive(self, session, executor):
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(executor, session.connect)
+            await loop.run_in_executor(executor, session.setup)
+            while self._running(session):
+                await loop.run_in_executor(executor, session.tick)
+                await loop.run_in_executor(executor, session.step)
+        finally:
+            if session.world is not None:
+                await loop.run_in_executor(executor, session.close)
+
+    async def run_async(self):
+        """Returns one entry per session: None, or the exception which stopped it"""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.sessions)) as executor:
+            results = await asyncio.gather(*[self._drive(session, executor) for session in self.sessions],
+                                           return_exceptions=True)
+        for session, result in zip(self.sessions, results):
+            if isinstance(result, Exception):
+                logging.error('%s stopped after %d ticks: %s', session.name, session.ticks, result)
+        return [result if isinstance(result, BaseException) else None for result in results]
+
+    def run(self):
+        return asyncio.run(self.run_async())
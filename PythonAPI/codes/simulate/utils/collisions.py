@@ -0,0 +1,114 @@
+### Collision events off the sensor thread
+### The collision sensor callback only appends a tuple to a deque. The main
+### loop drains it once per tick with poll(), which aggregates the events of
+### every frame into a CollisionSummary (for the reward / done of a step) and
+### hands the rows to a background thread writing the collision dataset.
+
+import collections
+import math
+import queue
+import threading
+
+import numpy as np
+
+from utils.recorder import ColumnRecorder
+
+COLUMNS = ("frame", "actor id", "actor type", "location x", "location y", "location z")
+
+
+class CollisionSummary(object):
+    """The collisions of one frame"""
+    __slots__ = ('frame', 'count', 'other_ids', 'other_types', 'max_intensity')
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.count = 0
+        self.other_ids = []
+        self.other_types = []
+        self.max_intensity = 0.0
+
+    def __repr__(self):
+        return 'CollisionSummary(frame={}, count={}, other_ids={}, max_intensity={:.1f})'.format(
+            self.frame, self.count, self.other_ids, self.max_intensity)
+
+
+class CollisionMonitor(object):
+    """Listens to collision sensors without blocking them.
+
+    path is the collision dataset (None to keep no file). At most maxsize
+    events wait for poll(), older ones are lost (self.lost). At most maxsize
+    rows wait for the writer, the rest is not written (self.dropped).
+    """
+
+    def __init__(self, path=None, fmt='csv', maxsize=1024, chunk_size=256):
+        ## deque.append is atomic, the sensor thread never waits for a lock
+        self._events = collections.deque(maxlen=maxsize)
+        self.received = 0
+        self.polled = 0
+        self.dropped = 0
+        self._writer = None
+        if path is not None:
+            self._rows = queue.Queue(maxsize)
+            self._recorder = ColumnRecorder(path, COLUMNS, fmt=fmt, chunk_size=chunk_size,
+                                            dtypes={"frame": np.int64, "actor id": np.int64, "actor type": object})
+            self._writer = threading.Thread(target=self._write, name='collision-writer', daemon=True)
+            self._writer.start()
+
+    def on_collision(self, event):
+        """Sensor callback: sensor.listen(monitor.on_collision)"""
+        other = event.other_actor
+        location = event.transform.location
+        impulse = event.normal_impulse
+        self._events.append((event.frame, other.id if other is not None else -1,
+                             other.type_id if other is not None else 'None',
+                             location.x, location.y, location.z,
+                             math.sqrt(impulse.x ** 2 + impulse.y ** 2 + impulse.z ** 2)))
+        self.received += 1
+
+    def poll(self):
+        """Drain the events received since the last poll, returns their CollisionSummary per frame"""
+        summaries = collections.OrderedDict()
+        events = self._events
+        while events:
+            frame, other_id, other_type, x, y, z, intensity = events.popleft()
+            summary = summaries.get(frame)
+            if summary is None:
+                summary = summaries[frame] = CollisionSummary(frame)
+            summary.count += 1
+            summary.other_ids.append(other_id)
+            summary.other_types.append(other_type)
+            summary.max_intensity = max(summary.max_intensity, intensity)
+            if self._writer is not None:
+                try:
+                    self._rows.put_nowait((frame, other_id, other_type, x, y, z))
+                except queue.Full:
+                    self.dropped += 1
+            self.polled += 1
+        return list(summaries.values())
+
+    @property
+    def lost(self):
+        """Events pushed out of the full deque before a poll"""
+        return max(self.received - self.polled - len(self._events), 0)
+
+    @property
+    def rows_written(self):
+        """Rows in the collision dataset, complete after close()"""
+        return self._recorder.rows_written if self._writer is not None else 0
+
+    def _write(self):
+        while True:
+            row = self._rows.get()
+            if row is None:
+                break
+            self._recorder.append(row)
+            if self._rows.empty():   ## end of a burst, put it on disk
+                self._recorder.flush()
+        self._recorder.close()
+
+    def close(self):
+        """Write the remaining events and stop the writer"""
+        self.poll()
+        if self._writer is not None and self._writer.is_alive():
+            self._rows.put(None)
+            self._writer.join()
@@ -0,0 +1,99 @@
+### Debug drawing with a budget
+### Draw calls are queued during a tick and sent by flush(), at most budget
+### of them per frame. Shapes drawn for one frame which do not fit are
+### dropped, lasting ones (life_time 0 = permanent, or longer than
+### keep_after seconds) wait for the next frames. A disabled drawer does
+### nothing, for headless training runs.
+###
+###     draw = DebugDraw(carla, world.debug, budget=100, enabled=not args.no_draw)
+###     draw.point(x, y, z, color=(0, 0, 255), life_time=1)
+###     draw.flush()
+###     world.tick()
+
+import collections
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+class DebugDraw(object):
+    """Queues draw_point / draw_string / draw_line calls of a carla DebugHelper.
+
+    carla is the carla module (or utils.fake_carla), colors are (r, g, b) tuples.
+    """
+
+    def __init__(self, carla, debug, budget=100, enabled=True, keep_after=5.0):
+        self.carla = carla
+        self.debug = debug
+        self.budget = budget
+        self.enabled = enabled
+        self.keep_after = keep_after
+        self._frame = []
+        self._lasting = collections.deque()
+        self.drawn = 0
+        self.dropped = 0
+        if not enabled:
+            self.point = self.points = self.string = self.line = self.flush = _noop
+
+    @property
+    def pending(self):
+        return len(self._frame) + len(self._lasting)
+
+    def _queue(self, item, life_time):
+        if life_time == 0 or life_time > self.keep_after:
+            self._lasting.append(item)
+        else:
+            self._frame.append(item)
+
+    def point(self, x, y, z, color=(255, 0, 0), size=0.1, life_time=-1.0):
+        self._queue(('point', (x, y, z), color, size, life_time), life_time)
+
+    def points(self, locations, color=(255, 0, 0), text=None, life_time=-1.0):
+        """One point (or string text) for every row of an (N, 3) array"""
+        for x, y, z in locations:
+            if text is None:
+                self.point(x, y, z, color, life_time=life_time)
+            else:
+                self.string(x, y, z, text, color, life_time=life_time)
+
+    def string(self, x, y, z, text, color=(255, 0, 0), draw_shadow=False, life_time=-1.0):
+        self._queue(('string', (x, y, z), color, (text, draw_shadow), life_time), life_time)
+
+    def line(self, begin, end, color=(255, 0, 0), thickness=0.1, life_time=-1.0):
+        self._queue(('line', begin, color, (end, thickness), life_time), life_time)
+
+    def _location(self, xyz):
+        return self.carla.Location(x=float(xyz[0]), y=float(xyz[1]), z=float(xyz[2]))
+
+    def _draw(self, item):
+        kind, xyz, color, extra, life_time = item
+        location = self._location(xyz)
+        color = self.carla.Color(r=color[0], g=color[1], b=color[2])
+        if kind == 'point':
+            self.debug.draw_point(location, size=extra, color=color, life_time=life_time)
+        elif kind == 'string':
+            self.debug.draw_string(location, extra[0], draw_shadow=extra[1], color=color, life_time=life_time)
+        else:
+            self.debug.draw_line(location, self._location(extra[0]), thickness=extra[1], color=color,
+                                 life_time=life_time)
+
+    def flush(self):
+        """Send the queued shapes of this frame first, then lasting ones, budget calls at most"""
+        budget = self.budget
+        frame, self._frame = self._frame, []
+        for item in frame[:budget]:
+            self._draw(item)
+        self.drawn += min(len(frame), budget)
+        self.dropped += max(len(frame) - budget, 0)
+        budget -= min(len(frame), budget)
+        while budget > 0 and self._lasting:
+            self._draw(self._lasting.popleft())
+            self.drawn += 1
+            budget -= 1
+
+    def drain(self, wait):
+        """Flush until nothing is pending, wait() (e.g. world.tick) between the frames"""
+        while self.enabled and self.pending:
+            self.flush()
+            wait()
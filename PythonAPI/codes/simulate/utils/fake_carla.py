@@ -0,0 +1,1063 @@
+### Headless stand-in for the carla module
+### Implements the part of the carla 0.9.9 python API used by the simulate
+### scripts with plain python and numpy, so the client side code (neighbor
+### scan, logging, spawning, ...) can be run and measured without a
+### CarlaUE4 server:
+###
+###     from utils import fake_carla as carla
+###     client = carla.Client('127.0.0.1', 2000)
+###
+### The map is a straight four lane highway along +y (lane centers taken from
+### map04_coordination_1.csv), vehicles leaving its end come back at its start.
+### Autopilot vehicles follow their lane with a simple car-following model,
+### forced lane changes move them to the neighboring lane. Nothing is rendered,
+### debug drawing calls are only counted.
+
+import fnmatch
+import copy
+import math
+import types
+
+import numpy as np
+
+SPEED_LIMIT = 90.0 / 3.6       ## m/s on the highway
+VEHICLE_LENGTH = 4.5
+VEHICLE_WIDTH = 1.8
+
+
+# ----------
+# Geometry
+# ----------
+
+class Vector3D(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def __add__(self, other):
+        return type(self)(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return type(self)(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, k):
+        return type(self)(self.x * k, self.y * k, self.z * k)
+
+    def __eq__(self, other):
+        return isinstance(other, Vector3D) and (self.x, self.y, self.z) == (other.x, other.y, other.z)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def length(self):
+        return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
+
+    def __repr__(self):
+        return '{}(x={:.6f}, y={:.6f}, z={:.6f})'.format(type(self).__name__, self.x, self.y, self.z)
+
+
+class Location(Vector3D):
+    def distance(self, other):
+        return (self - other).length()
+
+
+class Rotation(object):
+    def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+        self.pitch = float(pitch)
+        self.yaw = float(yaw)
+        self.roll = float(roll)
+
+    def get_forward_vector(self):
+        yaw, pitch = math.radians(self.yaw), math.radians(self.pitch)
+        return Vector3D(math.cos(yaw) * math.cos(pitch), math.sin(yaw) * math.cos(pitch), math.sin(pitch))
+
+    def __repr__(self):
+        return 'Rotation(pitch={:.6f}, yaw={:.6f}, roll={:.6f})'.format(self.pitch, self.yaw, self.roll)
+
+
+class Transform(object):
+    def __init__(self, location=None, rotation=None):
+        self.location = location if location is not None else Location()
+        self.rotation = rotation if rotation is not None else Rotation()
+
+    def get_forward_vector(self):
+        return self.rotation.get_forward_vector()
+
+    def __repr__(self):
+        return 'Transform({}, {})'.format(self.location, self.rotation)
+
+
+class Color(object):
+    def __init__(self, r=0, g=0, b=0, a=255):
+        self.r, self.g, self.b, self.a = r, g, b, a
+
+
+class VehicleControl(object):
+    def __init__(self, throttle=0.0, steer=0.0, brake=0.0, hand_brake=False, reverse=False,
+                 manual_gear_shift=False, gear=0):
+        self.throttle = throttle
+        self.steer = steer
+        self.brake = brake
+        self.hand_brake = hand_brake
+        self.reverse = reverse
+        self.manual_gear_shift = manual_gear_shift
+        self.gear = gear
+
+
+class WorldSettings(object):
+    def __init__(self, synchronous_mode=False, no_rendering_mode=False, fixed_delta_seconds=None):
+        self.synchronous_mode = synchronous_mode
+        self.no_rendering_mode = no_rendering_mode
+        self.fixed_delta_seconds = fixed_delta_seconds
+
+
+class Timestamp(object):
+    def __init__(self, frame=0, elapsed_seconds=0.0, delta_seconds=0.0, platform_timestamp=0.0):
+        self.frame = frame
+        self.elapsed_seconds = elapsed_seconds
+        self.delta_seconds = delta_seconds
+        self.platform_timestamp = platform_timestamp
+
+
+class LaneType(object):
+    NONE = 'NONE'
+    Driving = 'Driving'
+    Sidewalk = 'Sidewalk'
+    Any = 'Any'
+
+
+# -----------
+# Blueprints
+# -----------
+
+class ActorAttribute(object):
+    def __init__(self, id, value, recommended_values=(), is_modifiable=True):
+        self.id = id
+        self.value = str(value)
+        self.recommended_values = list(recommended_values)
+        self.is_modifiable = is_modifiable
+
+    def as_str(self):
+        return self.value
+
+    def as_int(self):
+        return int(self.value)
+
+    def as_float(self):
+        return float(self.value)
+
+    def as_bool(self):
+        return self.value.lower() == 'true'
+
+    def __int__(self):
+        return self.as_int()
+
+    def __float__(self):
+        return self.as_float()
+
+    def __str__(self):
+        return self.value
+
+
+class ActorBlueprint(object):
+    def __init__(self, id, tags=(), attributes=None):
+        self.id = id
+        self.tags = list(tags)
+        self._attributes = {}
+        for key, value in (attributes or {}).items():
+            value, recommended = value if isinstance(value, tuple) else (value, ())
+            self._attributes[key] = ActorAttribute(key, value, recommended)
+
+    def has_tag(self, tag):
+        return tag in self.tags
+
+    def has_attribute(self, id):
+        return id in self._attributes
+
+    def get_attribute(self, id):
+        return self._attributes[id]
+
+    def set_attribute(self, id, value):
+        if id not in self._attributes:
+            raise IndexError('attribute {} not found in {}'.format(id, self.id))
+        self._attributes[id].value = str(value)
+
+    def __iter__(self):
+        return iter(self._attributes.values())
+
+    def __repr__(self):
+        return 'ActorBlueprint(id={}, tags={})'.format(self.id, self.tags)
+
+
+def _default_blueprints():
+    colors = ('255,0,0', '0,255,0', '0,0,255', '255,255,255', '0,0,0')
+    blueprints = []
+    cars = ['audi.tt', 'toyota.prius', 'tesla.model3', 'bmw.grandtourer', 'mercedes-benz.coupe',
+            'nissan.patrol', 'mustang.mustang', 'carlamotors.carlacola', 'tesla.cybertruck',
+            'volkswagen.t2', 'bmw.isetta']
+    for car in cars:
+        blueprints.append(ActorBlueprint('vehicle.' + car, car.split('.'), {
+            'number_of_wheels': '4', 'color': (colors[0], colors), 'role_name': 'autopilot',
+            'sticky_control': 'true'}))
+    for bike in ['bh.crossbike', 'yamaha.yzf']:
+        blueprints.append(ActorBlueprint('vehicle.' + bike, bike.split('.'), {
+            'number_of_wheels': '2', 'color': (colors[0], colors), 'role_name': 'autopilot',
+            'driver_id': ('0', ('0', '1', '2'))}))
+    for i in range(1, 11):
+        blueprints.append(ActorBlueprint('walker.pedestrian.%04d' % i, ['walker', 'pedestrian'], {
+            'is_invincible': 'true', 'speed': ('1.4', ('0.0', '1.4', '2.8')), 'role_name': 'pedestrian'}))
+    blueprints.append(ActorBlueprint('controller.ai.walker', ['controller'], {'role_name': 'controller'}))
+    for sensor in ['other.collision', 'other.lane_invasion', 'other.obstacle']:
+        blueprints.append(ActorBlueprint('sensor.' + sensor, sensor.split('.'), {'role_name': 'front'}))
+    return blueprints
+
+
+class BlueprintLibrary(object):
+    def __init__(self, blueprints):
+        self._blueprints = list(blueprints)
+
+    def filter(self, wildcard_pattern):
+        return BlueprintLibrary([copy.deepcopy(bp) for bp in self._blueprints
+                                 if fnmatch.fnmatch(bp.id, wildcard_pattern)])
+
+    def find(self, id):
+        for bp in self._blueprints:
+            if bp.id == id:
+                return copy.deepcopy(bp)
+        raise IndexError('blueprint {} not found'.format(id))
+
+    def __getitem__(self, i):
+        return self._blueprints[i]
+
+    def __iter__(self):
+        return iter(self._blueprints)
+
+    def __len__(self):
+        return len(self._blueprints)
+
+
+# -------
+# Actors
+# -------
+
+class Actor(object):
+    def __init__(self, world, id, blueprint, slot, parent=None):
+        self._world = world
+        self.id = id
+        self.type_id = blueprint.id
+        self.attributes = {a.id: a.value for a in blueprint}
+        self.parent = parent
+        self._slot = slot
+
+    @property
+    def is_alive(self):
+        return self.id in self._world._actors
+
+    def get_world(self):
+        return self._world
+
+    def get_transform(self):
+        return self._world._transform_of(self._slot)
+
+    def get_location(self):
+        return self.get_transform().location
+
+    def get_velocity(self):
+        return Vector3D(*self._world._velocity[self._slot])
+
+    def get_acceleration(self):
+        return Vector3D(*self._world._acceleration[self._slot])
+
+    def get_angular_velocity(self):
+        return Vector3D(*self._world._angular_velocity[self._slot])
+
+    def set_transform(self, transform):
+        self._world._set_transform(self._slot, transform)
+
+    def set_location(self, location):
+        self._world._location[self._slot] = (location.x, location.y, location.z)
+
+    def set_velocity(self, velocity):
+        self._world._velocity[self._slot] = (velocity.x, velocity.y, velocity.z)
+
+    def set_angular_velocity(self, angular_velocity):
+        self._world._angular_velocity[self._slot] = (angular_velocity.x, angular_velocity.y, angular_velocity.z)
+
+    ## names of newer carla versions
+    set_target_velocity = set_velocity
+    set_target_angular_velocity = set_angular_velocity
+
+    def set_simulate_physics(self, enabled=True):
+        pass
+
+    def destroy(self):
+        return self._world._destroy(self.id)
+
+    def __repr__(self):
+        return 'Actor(id={}, type={})'.format(self.id, self.type_id)
+
+
+class Vehicle(Actor):
+    def __init__(self, *args, **kwargs):
+        super(Vehicle, self).__init__(*args, **kwargs)
+        self._control = VehicleControl()
+
+    def apply_control(self, control):
+        self._control = control
+
+    def get_control(self):
+        return self._control
+
+    def set_autopilot(self, enabled=True, tm_port=8000):
+        self._world._set_autopilot(self, enabled, tm_port)
+
+
+class Walker(Actor):
+    pass
+
+
+class WalkerAIController(Actor):
+    def __init__(self, *args, **kwargs):
+        super(WalkerAIController, self).__init__(*args, **kwargs)
+        self.running = False
+        self.max_speed = 1.4
+        self.target = None
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def go_to_location(self, location):
+        self.target = location
+
+    def set_max_speed(self, speed):
+        self.max_speed = speed
+
+
+class Sensor(Actor):
+    def __init__(self, *args, **kwargs):
+        super(Sensor, self).__init__(*args, **kwargs)
+        self._callback = None
+
+    @property
+    def is_listening(self):
+        return self._callback is not None
+
+    def listen(self, callback):
+        self._callback = callback
+
+    def stop(self):
+        self._callback = None
+
+
+class CollisionEvent(object):
+    def __init__(self, frame, timestamp, transform, actor, other_actor, normal_impulse):
+        self.frame = frame
+        self.timestamp = timestamp
+        self.transform = transform
+        self.actor = actor
+        self.other_actor = other_actor
+        self.normal_impulse = normal_impulse
+
+
+class ActorList(list):
+    def filter(self, wildcard_pattern):
+        return ActorList(a for a in self if fnmatch.fnmatch(a.type_id, wildcard_pattern))
+
+    def find(self, actor_id):
+        for actor in self:
+            if actor.id == actor_id:
+                return actor
+        return None
+
+
+class ActorSnapshot(object):
+    def __init__(self, id, transform, velocity, angular_velocity, acceleration):
+        self.id = id
+        self._transform = transform
+        self._velocity = velocity
+        self._angular_velocity = angular_velocity
+        self._acceleration = acceleration
+
+    def get_transform(self):
+        return self._transform
+
+    def get_velocity(self):
+        return self._velocity
+
+    def get_angular_velocity(self):
+        return self._angular_velocity
+
+    def get_acceleration(self):
+        return self._acceleration
+
+
+class WorldSnapshot(object):
+    """The state arrays of one frame, ActorSnapshots are created on find()"""
+
+    def __init__(self, world):
+        self.id = world._frame
+        self.frame = world._frame
+        self.timestamp = Timestamp(world._frame, world._elapsed, world._delta)
+        self._slots = {actor_id: actor._slot for actor_id, actor in world._actors.items()}
+        n = world._count
+        self._location = world._location[:n].copy()
+        self._rotation = world._rotation[:n].copy()
+        self._velocity = world._velocity[:n].copy()
+        self._angular_velocity = world._angular_velocity[:n].copy()
+        self._acceleration = world._acceleration[:n].copy()
+
+    def has_actor(self, actor_id):
+        return actor_id in self._slots
+
+    def find(self, actor_id):
+        slot = self._slots.get(actor_id)
+        if slot is None:
+            return None
+        pitch, yaw, roll = self._rotation[slot]
+        return ActorSnapshot(actor_id, Transform(Location(*self._location[slot]), Rotation(pitch, yaw, roll)),
+                             Vector3D(*self._velocity[slot]), Vector3D(*self._angular_velocity[slot]),
+                             Vector3D(*self._acceleration[slot]))
+
+    def __iter__(self):
+        return (self.find(actor_id) for actor_id in self._slots)
+
+    def __len__(self):
+        return len(self._slots)
+
+
+# -------------
+# Map, waypoints
+# -------------
+
+class Waypoint(object):
+    def __init__(self, map, lane, s):
+        self._map = map
+        self.road_id = 0
+        self.section_id = 0
+        self.lane_index = lane
+        self.lane_id = map.lane_ids[lane]
+        self.s = s
+        self.lane_type = LaneType.Driving
+        self.lane_width = map.lane_width
+        self.is_junction = False
+        self.transform = Transform(Location(map.lane_x[lane], map.y_min + s, map.z),
+                                   Rotation(0.0, 90.0, 0.0))
+        self.id = hash((lane, round(s, 3)))
+
+    def next(self, distance):
+        return [Waypoint(self._map, self.lane_index, (self.s + distance) % self._map.length)]
+
+    def previous(self, distance):
+        return [Waypoint(self._map, self.lane_index, (self.s - distance) % self._map.length)]
+
+    def get_left_lane(self):
+        return Waypoint(self._map, self.lane_index - 1, self.s) if self.lane_index > 0 else None
+
+    def get_right_lane(self):
+        return Waypoint(self._map, self.lane_index + 1, self.s) if self.lane_index < len(self._map.lane_x) - 1 else None
+
+
+class Map(object):
+    """Straight highway along +y, lane 0 is the leftmost one"""
+
+    def __init__(self, name='Town04', lane_x=(-5.9, -9.25, -13.03, -16.25), lane_ids=(-1, -2, -3, -4),
+                 y_min=-1000.0, length=3000.0, z=0.0):
+        self.name = name
+        self.lane_x = np.asarray(lane_x, dtype=np.float64)
+        self.lane_ids = list(lane_ids)
+        self.lane_width = 3.5
+        self.y_min = y_min
+        self.length = length
+        self.z = z
+
+    def lane_of(self, x):
+        return np.abs(np.asarray(x, dtype=np.float64)[..., None] - self.lane_x).argmin(-1)
+
+    def get_spawn_points(self):
+        points = []
+        for s in np.arange(0.0, self.length, 25.0):
+            for x in self.lane_x:
+                points.append(Transform(Location(x, self.y_min + s, self.z + 0.3), Rotation(0.0, 90.0, 0.0)))
+        return points
+
+    def generate_waypoints(self, distance):
+        return [Waypoint(self, lane, s) for lane in range(len(self.lane_x))
+                for s in np.arange(0.0, self.length, distance)]
+
+    def get_waypoint(self, location, project_to_road=True, lane_type=LaneType.Driving):
+        lane = int(self.lane_of(location.x))
+        if not project_to_road and abs(location.x - self.lane_x[lane]) > self.lane_width / 2:
+            return None
+        return Waypoint(self, lane, (location.y - self.y_min) % self.length)
+
+    def get_topology(self):
+        return [(Waypoint(self, lane, 0.0), Waypoint(self, lane, self.length - 1.0)) for lane in range(len(self.lane_x))]
+
+
+# ----------------
+# Traffic manager
+# ----------------
+
+class TrafficManager(object):
+    """Keeps the per vehicle settings, the world reads them every tick"""
+
+    def __init__(self, world, port):
+        self._world = world
+        self.port = port
+        self.calls = 0
+        self.synchronous_mode = False
+        self.global_distance = 2.0
+        self.global_speed_difference = 30.0
+        self.hybrid_physics_mode = False
+        self.hybrid_physics_radius = 50.0
+
+    def get_port(self):
+        return self.port
+
+    def _set(self, actor, name, value):
+        self.calls += 1
+        self._world._tm_set(actor.id if isinstance(actor, Actor) else actor, name, value)
+
+    def set_synchronous_mode(self, mode=True):
+        self.calls += 1
+        self.synchronous_mode = mode
+
+    def set_global_distance_to_leading_vehicle(self, distance):
+        self.calls += 1
+        self.global_distance = distance
+
+    def global_percentage_speed_difference(self, percentage):
+        self.calls += 1
+        self.global_speed_difference = percentage
+
+    def set_hybrid_physics_mode(self, enabled=False):
+        self.calls += 1
+        self.hybrid_physics_mode = enabled
+
+    def set_hybrid_physics_radius(self, r=50.0):
+        self.calls += 1
+        self.hybrid_physics_radius = r
+
+    def set_random_device_seed(self, seed):
+        self.calls += 1
+        self._world._rng = np.random.RandomState(seed)
+
+    def distance_to_leading_vehicle(self, actor, distance):
+        self._set(actor, 'distance', distance)
+
+    def vehicle_percentage_speed_difference(self, actor, percentage):
+        self._set(actor, 'speed_difference', percentage)
+
+    def auto_lane_change(self, actor, enable):
+        self._set(actor, 'auto_lane_change', enable)
+
+    def force_lane_change(self, actor, direction):
+        ## True is a change to the right
+        self._set(actor, 'force_lane_change', direction)
+
+    def ignore_lights_percentage(self, actor, perc):
+        self._set(actor, 'ignore_lights', perc)
+
+    def ignore_signs_percentage(self, actor, perc):
+        self._set(actor, 'ignore_signs', perc)
+
+    def ignore_walkers_percentage(self, actor, perc):
+        self._set(actor, 'ignore_walkers', perc)
+
+    def ignore_vehicles_percentage(self, actor, perc):
+        self._set(actor, 'ignore_vehicles', perc)
+
+    def collision_detection(self, reference_actor, other_actor, detect_collision):
+        self.calls += 1
+
+
+# ------
+# World
+# ------
+
+class DebugHelper(object):
+    def __init__(self):
+        self.calls = {}
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def draw_point(self, location, size=0.1, color=None, life_time=-1.0):
+        self._count('draw_point')
+
+    def draw_string(self, location, text, draw_shadow=False, color=None, life_time=-1.0, persistent_lines=True):
+        self._count('draw_string')
+
+    def draw_line(self, begin, end, thickness=0.1, color=None, life_time=-1.0, persistent_lines=True):
+        self._count('draw_line')
+
+    def draw_arrow(self, begin, end, thickness=0.1, arrow_size=0.1, color=None, life_time=-1.0, persistent_lines=True):
+        self._count('draw_arrow')
+
+    def draw_box(self, box, rotation, thickness=0.1, color=None, life_time=-1.0, persistent_lines=True):
+        self._count('draw_box')
+
+
+class World(object):
+    """Actor states are kept in numpy arrays indexed by the actor slot"""
+
+    def __init__(self, map_name='Town04', seed=0, capacity=64):
+        self.id = 1
+        self._map = Map(map_name)
+        self._library = BlueprintLibrary(_default_blueprints())
+        self._settings = WorldSettings()
+        self._rng = np.random.RandomState(seed)
+        self._traffic_managers = {}
+        self.debug = DebugHelper()
+        self._actors = {}
+        self._by_slot = {}
+        self._next_id = 100
+        self._frame = 0
+        self._elapsed = 0.0
+        self._delta = 0.0
+        self._snapshot = None
+        self._count = 0
+        self._location = np.zeros((capacity, 3))
+        self._rotation = np.zeros((capacity, 3))          ## pitch, yaw, roll
+        self._velocity = np.zeros((capacity, 3))
+        self._acceleration = np.zeros((capacity, 3))
+        self._angular_velocity = np.zeros((capacity, 3))
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._vehicle = np.zeros(capacity, dtype=bool)
+        self._autopilot = np.zeros(capacity, dtype=bool)
+        self._speed_difference = np.full(capacity, np.nan)
+        self._distance = np.full(capacity, np.nan)
+        self._ignore_vehicles = np.zeros(capacity)
+        self._target_lane = np.full(capacity, -1, dtype=np.int64)
+        self._tm_settings = {}
+        self.rpc_calls = 0
+
+    # --- arrays ---
+
+    def _grow(self):
+        capacity = 2 * len(self._alive)
+        for name in ('_location', '_rotation', '_velocity', '_acceleration', '_angular_velocity'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity, 3))
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+        for name, fill in (('_alive', False), ('_vehicle', False), ('_autopilot', False),
+                           ('_speed_difference', np.nan), ('_distance', np.nan), ('_ignore_vehicles', 0.0),
+                           ('_target_lane', -1)):
+            array = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _transform_of(self, slot):
+        pitch, yaw, roll = self._rotation[slot]
+        return Transform(Location(*self._location[slot]), Rotation(pitch, yaw, roll))
+
+    def _set_transform(self, slot, transform):
+        self._location[slot] = (transform.location.x, transform.location.y, transform.location.z)
+        self._rotation[slot] = (transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll)
+        self._target_lane[slot] = -1
+
+    # --- api ---
+
+    def get_map(self):
+        self.rpc_calls += 1
+        return self._map
+
+    def get_blueprint_library(self):
+        self.rpc_calls += 1
+        return self._library
+
+    def get_settings(self):
+        self.rpc_calls += 1
+        return copy.copy(self._settings)
+
+    def apply_settings(self, settings):
+        self.rpc_calls += 1
+        self._settings = copy.copy(settings)
+        return self._frame
+
+    def get_snapshot(self):
+        ## like the server: the states of the last tick, teleports and spawns since then are not in it
+        if self._snapshot is None:
+            self._snapshot = WorldSnapshot(self)
+        return self._snapshot
+
+    def get_actor(self, actor_id):
+        self.rpc_calls += 1
+        return self._actors.get(actor_id)
+
+    def get_actors(self, actor_ids=None):
+        self.rpc_calls += 1
+        if actor_ids is None:
+            return ActorList(self._actors.values())
+        return ActorList(self._actors[i] for i in actor_ids if i in self._actors)
+
+    def get_random_location_from_navigation(self):
+        ## on the sidewalk right of the highway
+        side = self._map.lane_x[-1] - 5.0
+        return Location(side, self._map.y_min + self._rng.uniform(0.0, self._map.length), self._map.z + 1.0)
+
+    def set_pedestrians_cross_factor(self, percentage):
+        self.rpc_calls += 1
+
+    def spawn_actor(self, blueprint, transform, attach_to=None):
+        self.rpc_calls += 1
+        return self._spawn(blueprint, transform, attach_to)
+
+    def try_spawn_actor(self, blueprint, transform, attach_to=None):
+        try:
+            return self.spawn_actor(blueprint, transform, attach_to)
+        except RuntimeError:
+            return None
+
+    def _spawn(self, blueprint, transform, attach_to=None):
+        is_vehicle = blueprint.id.startswith('vehicle.')
+        if is_vehicle and self._count:
+            location = np.array([transform.location.x, transform.location.y, transform.location.z])
+            others = self._location[:self._count][self._alive[:self._count] & self._vehicle[:self._count]]
+            if len(others) and (np.sum((others - location) ** 2, axis=1) < 2.0 ** 2).any():
+                raise RuntimeError('Spawn failed because of collision at spawn position')
+        if self._count == len(self._alive):
+            self._grow()
+        slot = self._count
+        self._count += 1
+        actor_id = self._next_id
+        self._next_id += 1
+        if is_vehicle:
+            cls = Vehicle
+        elif blueprint.id.startswith('walker.'):
+            cls = Walker
+        elif blueprint.id.startswith('controller.'):
+            cls = WalkerAIController
+        elif blueprint.id.startswith('sensor.'):
+            cls = Sensor
+        else:
+            cls = Actor
+        actor = cls(self, actor_id, blueprint, slot, parent=attach_to)
+        self._actors[actor_id] = actor
+        self._by_slot[slot] = actor
+        self._alive[slot] = True
+        self._vehicle[slot] = is_vehicle
+        self._autopilot[slot] = False
+        self._speed_difference[slot] = np.nan
+        self._distance[slot] = np.nan
+        self._ignore_vehicles[slot] = 0.0
+        self._target_lane[slot] = -1
+        self._velocity[slot] = 0.0
+        self._acceleration[slot] = 0.0
+        self._angular_velocity[slot] = 0.0
+        self._set_transform(slot, transform)
+        return actor
+
+    def _destroy(self, actor_id):
+        actor = self._actors.pop(actor_id, None)
+        if actor is None:
+            return False
+        self._by_slot.pop(actor._slot, None)
+        self._alive[actor._slot] = False
+        self._autopilot[actor._slot] = False
+        return True
+
+    def _traffic_manager(self, port):
+        if port not in self._traffic_managers:
+            self._traffic_managers[port] = TrafficManager(self, port)
+        return self._traffic_managers[port]
+
+    def _set_autopilot(self, vehicle, enabled, tm_port):
+        self.rpc_calls += 1
+        self._autopilot[vehicle._slot] = enabled
+        if enabled:
+            self._traffic_manager(tm_port)
+
+    def _tm_set(self, actor_id, name, value):
+        actor = self._actors.get(actor_id)
+        if actor is None:
+            return
+        slot = actor._slot
+        self._tm_settings.setdefault(actor_id, {})[name] = value
+        if name == 'speed_difference':
+            self._speed_difference[slot] = value
+        elif name == 'distance':
+            self._distance[slot] = value
+        elif name == 'ignore_vehicles':
+            self._ignore_vehicles[slot] = value
+        elif name == 'force_lane_change':
+            lane = int(self._map.lane_of(self._location[slot, 0]))
+            target = lane + (1 if value else -1)
+            if 0 <= target < len(self._map.lane_x):
+                self._target_lane[slot] = target
+
+    def tick(self, seconds=10.0):
+        self.rpc_calls += 1
+        self._advance()
+        return self._frame
+
+    def wait_for_tick(self, seconds=10.0):
+        ## there is no server ticking on its own, the client wait ticks the world
+        if not self._settings.synchronous_mode:
+            self._advance()
+        return self.get_snapshot()
+
+    def on_tick(self, callback):
+        return 0
+
+    # --- simulation ---
+
+    def _advance(self):
+        dt = self._settings.fixed_delta_seconds or 0.05
+        self._step_vehicles(dt)
+        self._frame += 1
+        self._elapsed += dt
+        self._delta = dt
+        self._snapshot = WorldSnapshot(self)
+        self._dispatch_collisions()
+
+    def _step_vehicles(self, dt):
+        n = self._count
+        if n == 0:
+            return
+        tm = next(iter(self._traffic_managers.values()), None)
+        global_distance = tm.global_distance if tm else 2.0
+        global_difference = tm.global_speed_difference if tm else 30.0
+        location, velocity = self._location[:n], self._velocity[:n]
+        old_velocity = velocity.copy()
+        vehicles = self._alive[:n] & self._vehicle[:n]
+
+        auto = np.flatnonzero(vehicles & self._autopilot[:n])
+        if auto.size:
+            x, y = location[auto, 0], location[auto, 1]
+            lane = self._map.lane_of(x)
+            difference = np.where(np.isnan(self._speed_difference[auto]), global_difference, self._speed_difference[auto])
+            desired = SPEED_LIMIT * (1.0 - difference / 100.0)
+            speed = velocity[auto, 1]
+            ## leader of each vehicle: the next one in the same lane
+            order = np.lexsort((y, lane))
+            same_lane = lane[order][1:] == lane[order][:-1]
+            gap = np.full(auto.size, np.inf)
+            leader_speed = np.full(auto.size, np.inf)
+            gap[order[:-1][same_lane]] = (y[order][1:] - y[order][:-1])[same_lane] - VEHICLE_LENGTH
+            leader_speed[order[:-1][same_lane]] = speed[order][1:][same_lane]
+            distance = np.where(np.isnan(self._distance[auto]), global_distance, self._distance[auto])
+            safe_gap = distance + 0.8 * np.maximum(speed, 0.0) + 1e-3
+            ignoring = self._rng.uniform(0.0, 100.0, auto.size) < self._ignore_vehicles[auto]
+            following = (gap < safe_gap) & ~ignoring
+            desired = np.where(following, np.minimum(desired, leader_speed * np.clip(gap / safe_gap, 0.0, 1.0)), desired)
+            new_speed = np.maximum(speed + np.clip(desired - speed, -8.0 * dt, 3.0 * dt), 0.0)
+            ## lateral motion towards the lane center (or the target lane of a forced lane change)
+            target_lane = np.where(self._target_lane[auto] >= 0, self._target_lane[auto], lane)
+            lateral = np.clip((self._map.lane_x[target_lane] - x) * 0.8, -1.2, 1.2)
+            arrived = np.abs(self._map.lane_x[target_lane] - x) < 0.1
+            self._target_lane[auto[arrived]] = -1
+            velocity[auto, 0] = lateral
+            velocity[auto, 1] = new_speed
+            velocity[auto, 2] = 0.0
+            self._rotation[auto, 1] = 90.0
+
+        manual = np.flatnonzero(vehicles & ~self._autopilot[:n])
+        for slot in manual:
+            actor = self._by_slot.get(slot)
+            control = actor._control if actor is not None else VehicleControl()
+            yaw = math.radians(self._rotation[slot, 1])
+            speed = math.hypot(velocity[slot, 0], velocity[slot, 1])
+            speed = max(speed + (3.0 * control.throttle - 8.0 * control.brake) * dt, 0.0)
+            velocity[slot] = (speed * math.cos(yaw), speed * math.sin(yaw), 0.0)
+
+        location[vehicles] += velocity[vehicles] * dt
+        wrap = vehicles & (location[:, 1] > self._map.y_min + self._map.length)
+        location[wrap, 1] -= self._map.length
+        self._acceleration[:n] = (velocity - old_velocity) / dt
+
+    def _dispatch_collisions(self):
+        sensors = [a for a in self._actors.values()
+                   if isinstance(a, Sensor) and a.type_id == 'sensor.other.collision' and a.is_listening]
+        if not sensors:
+            return
+        n = self._count
+        vehicles = np.flatnonzero(self._alive[:n] & self._vehicle[:n])
+        for sensor in sensors:
+            parent = sensor.parent
+            if parent is None or not parent.is_alive:
+                continue
+            d = np.abs(self._location[vehicles] - self._location[parent._slot])
+            hits = vehicles[(d[:, 0] < VEHICLE_WIDTH) & (d[:, 1] < VEHICLE_LENGTH) & (vehicles != parent._slot)]
+            for slot in hits:
+                other = self._by_slot.get(slot)
+                impulse = (self._velocity[parent._slot] - self._velocity[slot]) * 1000.0
+                sensor._callback(CollisionEvent(self._frame, self._elapsed, self._transform_of(parent._slot),
+                                                parent, other, Vector3D(*impulse)))
+
+
+# -------
+# Client
+# -------
+
+class Response(object):
+    def __init__(self, actor_id=0, error=''):
+        self.actor_id = actor_id
+        self.error = error
+
+    def has_error(self):
+        return bool(self.error)
+
+
+class _FutureActor(object):
+    def __repr__(self):
+        return 'FutureActor'
+
+
+def _actor_id(actor):
+    return actor.id if isinstance(actor, Actor) else actor
+
+
+class _Command(object):
+    def __init__(self):
+        self._then = []
+
+    def then(self, command):
+        self._then.append(command)
+        return self
+
+
+class _SpawnActor(_Command):
+    def __init__(self, blueprint, transform, parent=None):
+        super(_SpawnActor, self).__init__()
+        ## carla copies blueprint and transform into the command
+        self.blueprint = copy.deepcopy(blueprint)
+        self.transform = copy.deepcopy(transform)
+        self.parent_id = _actor_id(parent) if parent is not None else 0
+
+
+class _ActorCommand(_Command):
+    def __init__(self, actor, *args):
+        super(_ActorCommand, self).__init__()
+        self.actor_id = actor if actor is FutureActor else _actor_id(actor)
+        self.args = args
+
+
+class _DestroyActor(_ActorCommand):
+    pass
+
+
+class _SetAutopilot(_ActorCommand):
+    def __init__(self, actor, enabled, tm_port=8000):
+        super(_SetAutopilot, self).__init__(actor, enabled, tm_port)
+
+
+class _ApplyTransform(_ActorCommand):
+    pass
+
+
+class _ApplyVelocity(_ActorCommand):
+    pass
+
+
+class _ApplyAngularVelocity(_ActorCommand):
+    pass
+
+
+class _ApplyVehicleControl(_ActorCommand):
+    pass
+
+
+class _SetSimulatePhysics(_ActorCommand):
+    pass
+
+
+FutureActor = _FutureActor()
+command = types.SimpleNamespace(
+    SpawnActor=_SpawnActor, DestroyActor=_DestroyActor, SetAutopilot=_SetAutopilot,
+    ApplyTransform=_ApplyTransform, ApplyVelocity=_ApplyVelocity, ApplyTargetVelocity=_ApplyVelocity,
+    ApplyAngularVelocity=_ApplyAngularVelocity, ApplyTargetAngularVelocity=_ApplyAngularVelocity,
+    ApplyVehicleControl=_ApplyVehicleControl, SetSimulatePhysics=_SetSimulatePhysics,
+    FutureActor=FutureActor, Response=Response)
+
+
+class Client(object):
+    """All clients of one host:port share the same world, like on a real server"""
+    _servers = {}
+
+    def __init__(self, host='127.0.0.1', port=2000, worker_threads=0):
+        self.host = host
+        self.port = port
+        self.timeout = 10.0
+        if (host, port) not in Client._servers:
+            Client._servers[(host, port)] = World()
+        self.batch_calls = 0
+
+    @property
+    def _world(self):
+        return Client._servers[(self.host, self.port)]
+
+    def set_timeout(self, seconds):
+        self.timeout = seconds
+
+    def get_client_version(self):
+        return '0.9.9-fake'
+
+    def get_server_version(self):
+        return '0.9.9-fake'
+
+    def get_world(self):
+        return self._world
+
+    def get_available_maps(self):
+        return ['/Game/Carla/Maps/Town04']
+
+    def load_world(self, map_name='Town04'):
+        Client._servers[(self.host, self.port)] = World(map_name)
+        return self._world
+
+    def reload_world(self):
+        return self.load_world(self._world._map.name)
+
+    def get_trafficmanager(self, client_connection=8000):
+        return self._world._traffic_manager(client_connection)
+
+    def apply_batch(self, commands):
+        self.apply_batch_sync(commands)
+
+    def apply_batch_sync(self, commands, do_tick=False):
+        self.batch_calls += 1
+        world = self._world
+        responses = [self._execute(world, c, None) for c in commands]
+        if do_tick:
+            world._advance()
+        return responses
+
+    def _execute(self, world, cmd, future_id):
+        try:
+            if isinstance(cmd, _SpawnActor):
+                parent = world._actors.get(cmd.parent_id) if cmd.parent_id else None
+                actor_id = world._spawn(cmd.blueprint, cmd.transform, parent).id
+            else:
+                actor_id = future_id if cmd.actor_id is FutureActor else cmd.actor_id
+                actor = world._actors.get(actor_id)
+                if actor is None:
+                    raise RuntimeError('actor {} not found'.format(actor_id))
+                self._apply(world, cmd, actor)
+        except RuntimeError as e:
+            return Response(0, str(e))
+        for then in cmd._then:
+            response = self._execute(world, then, actor_id)
+            if response.error:
+                return Response(actor_id, response.error)
+        return Response(actor_id)
+
+    def _apply(self, world, cmd, actor):
+        if isinstance(cmd, _DestroyActor):
+            world._destroy(actor.id)
+        elif isinstance(cmd, _SetAutopilot):
+            world._set_autopilot(actor, cmd.args[0], cmd.args[1])
+        elif isinstance(cmd, _ApplyTransform):
+            actor.set_transform(cmd.args[0])
+        elif isinstance(cmd, _ApplyVelocity):
+            actor.set_velocity(cmd.args[0])
+        elif isinstance(cmd, _ApplyAngularVelocity):
+            actor.set_angular_velocity(cmd.args[0])
+        elif isinstance(cmd, _ApplyVehicleControl):
+            actor.apply_control(cmd.args[0])
@@ -0,0 +1,109 @@
+### Hybrid physics radius of the traffic manager
+### With hybrid physics only the vehicles within the radius around the hero
+### vehicle are simulated with full physics, the others are teleported.
+### The radius never gets below the observation radius (the neighbors which
+### are logged / seen by the policy), the margin above it stays at its
+### minimum (margin) unless misses are reported (e.g. collisions of the ego
+### vehicle): then it grows by step up to max_margin, and goes back by step
+### once a window has no misses. Over the tick budget it shrinks by step,
+### down to the observation radius. It is adapted per episode (adapt() on
+### a reset) and every window ticks. Every adaptation is printed and
+### written to path (csv) if given.
+###
+###     hybrid = HybridRadius(traffic_manager, observation_radius=50.0, budget=0.05, enabled=args.hybrid)
+###     start = time.perf_counter()
+###     world.tick()
+###     hybrid.observe(time.perf_counter() - start)
+###     hybrid.miss(len(collision_monitor.poll()))
+
+import logging
+
+import numpy as np
+
+from utils.recorder import ColumnRecorder
+
+COLUMNS = ['Adaptation', 'Ticks', 'Mean Tick ms', 'P95 Tick ms', 'Budget ms', 'Observation Radius',
+           'Hybrid Radius', 'Misses', 'Over Budget']
+
+
+def _noop(*args):
+    pass
+
+
+class HybridRadius(object):
+    """Sets the hybrid physics radius of traffic_manager from the observation radius and the tick time (seconds)"""
+
+    def __init__(self, traffic_manager, observation_radius=50.0, budget=0.05, margin=10.0, step=5.0,
+                 max_margin=50.0, window=500, path=None, enabled=True):
+        self.traffic_manager = traffic_manager
+        self.observation_radius = observation_radius
+        self.budget = budget
+        self.min_margin = self.margin = max(margin, 0.0)
+        self.step = step
+        self.max_margin = max_margin
+        self.window = window
+        self.misses = 0     ## reported since the last adaptation
+        self.enabled = enabled
+        self.adaptations = 0
+        self.over_budget = False    ## the budget is not met even at the observation radius
+        self._times = []
+        self._recorder = None
+        if path and enabled:
+            self._recorder = ColumnRecorder(path, COLUMNS, chunk_size=64,
+                                            dtypes={c: np.int64 for c in ('Adaptation', 'Ticks', 'Misses', 'Over Budget')})
+        if enabled:
+            traffic_manager.set_hybrid_physics_mode(True)
+            traffic_manager.set_hybrid_physics_radius(self.radius)
+        else:
+            self.observe = self.miss = self.adapt = _noop
+
+    @property
+    def radius(self):
+        return self.observation_radius + self.margin
+
+    def observe(self, seconds):
+        """Time of one world.tick(), adapts the radius every window ticks"""
+        self._times.append(seconds)
+        if self.window and len(self._times) >= self.window:
+            self.adapt()
+
+    def miss(self, count=1):
+        """count vehicles near the ego vehicle went wrong (e.g. collisions), the margin grows on the next adapt()"""
+        self.misses += count
+
+    def adapt(self):
+        """New radius from the ticks observed since the last adaptation (e.g. at the end of an episode)"""
+        if not self._times:
+            return
+        times = np.asarray(self._times) * 1000.0
+        self._times = []
+        mean = float(times.mean())
+        budget = self.budget * 1000.0
+        margin = self.margin
+        misses, self.misses = self.misses, 0
+        self.over_budget = mean > budget and margin == 0.0
+        if mean > budget:
+            margin = max(margin - self.step, 0.0)
+        elif misses:
+            margin = min(margin + self.step, self.max_margin)
+        elif margin > self.min_margin:     ## back to the minimum, from above or after the budget was met again
+            margin = max(margin - self.step, self.min_margin)
+        else:
+            margin = min(margin + self.step, self.min_margin)
+        if margin != self.margin:
+            self.margin = margin
+            self.traffic_manager.set_hybrid_physics_radius(self.radius)
+        if self.over_budget:
+            logging.warning('tick %.1f ms over the budget of %.1f ms with the hybrid radius at the '
+                            'observation radius %.1f m', mean, budget, self.observation_radius)
+        self.adaptations += 1
+        row = [self.adaptations, len(times), mean, float(np.percentile(times, 95)), budget,
+               self.observation_radius, self.radius, misses, int(self.over_budget)]
+        print('hybrid radius %.1f m (observation %.1f m), tick %.1f ms mean %.1f ms p95, budget %.1f ms, %d misses' % (
+            self.radius, self.observation_radius, row[2], row[3], budget, misses))
+        if self._recorder is not None:
+            self._recorder.append(row)
+
+    def close(self):
+        if self._recorder is not None:
+            self._recorder.close()
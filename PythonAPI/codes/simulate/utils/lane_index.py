@@ -0,0 +1,110 @@
+### Lane id lookup without map.get_waypoint
+### The waypoints of a map are generated once, put into a 2D grid and
+### saved in Datasets/lane_index_<map>.npz. A batch of positions is then
+### answered with one vectorized query, only positions farther than the
+### tolerance from every indexed waypoint go back to the server
+
+import os
+
+import numpy as np
+
+from utils.warm_cache import atomic_save
+
+
+class LaneIndex(object):
+    """Nearest-waypoint lane id lookup on a uniform xy grid"""
+
+    def __init__(self, positions, lane_ids, cell_size=5.0):
+        positions = np.asarray(positions, dtype=np.float32)
+        lane_ids = np.asarray(lane_ids, dtype=np.int32)
+        self.cell_size = float(cell_size)
+        keys = self._keys(positions[:, 0], positions[:, 1])
+        order = np.argsort(keys, kind='stable')
+        self.positions = positions[order]
+        self.lane_ids = lane_ids[order]
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(
+            keys[order], return_index=True, return_counts=True)
+        self.max_count = int(self.cell_counts.max()) if len(self.cell_counts) else 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _cells(self, x, y):
+        return (np.floor(np.asarray(x) / self.cell_size).astype(np.int64),
+                np.floor(np.asarray(y) / self.cell_size).astype(np.int64))
+
+    def _keys(self, x, y, dx=0, dy=0):
+        cx, cy = self._cells(x, y)
+        ## the cell coordinates of a map fit easily into 32 bit each
+        return ((cx + dx) << 32) + (cy + dy)
+
+    @classmethod
+    def from_map(cls, map, distance=1.0, cell_size=5.0):
+        waypoints = map.generate_waypoints(distance)
+        positions = [(w.transform.location.x, w.transform.location.y, w.transform.location.z) for w in waypoints]
+        return cls(np.array(positions, dtype=np.float32).reshape(-1, 3),
+                   [w.lane_id for w in waypoints], cell_size)
+
+    @classmethod
+    def load_or_build(cls, map, directory, distance=1.0, cell_size=5.0):
+        """Load the index of the map from directory, build and save it on the first use"""
+        path = os.path.join(directory, 'lane_index_{}.npz'.format(os.path.basename(map.name)))
+        if os.path.isfile(path):
+            return cls.load(path)
+        index = cls.from_map(map, distance, cell_size)
+        index.save(path)
+        return index
+
+    def save(self, path):
+        atomic_save(path, lambda f: np.savez(f, positions=self.positions, lane_ids=self.lane_ids,
+                                             cell_size=self.cell_size))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['positions'], data['lane_ids'], float(data['cell_size']))
+
+    def nearest(self, positions):
+        """Index and squared distance of the nearest waypoint for (M, 3) positions.
+
+        The 3x3 cells around each position are searched, positions without any
+        waypoint nearby get the index -1 and an infinite distance.
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        m = len(positions)
+        if m == 0 or self.max_count == 0:
+            return np.full(m, -1, dtype=np.int64), np.full(m, np.inf, dtype=np.float32)
+        x, y = positions[:, 0], positions[:, 1]
+        keys = np.stack([self._keys(x, y, dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], axis=1)  ## (M, 9)
+        slot = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = self.cell_keys[slot] == keys
+        counts = np.where(found, self.cell_counts[slot], 0)
+        offsets = np.arange(self.max_count)
+        candidates = self.cell_starts[slot][..., None] + offsets                        ## (M, 9, C)
+        valid = offsets < counts[..., None]
+        candidates = np.where(valid, candidates, 0).reshape(m, -1)
+        diff = self.positions[candidates] - positions[:, None, :]
+        sq_distances = np.einsum('ijk,ijk->ij', diff, diff)
+        sq_distances[~valid.reshape(m, -1)] = np.inf
+        best = np.argmin(sq_distances, axis=1)
+        rows = np.arange(m)
+        best_sq = sq_distances[rows, best]
+        return np.where(np.isfinite(best_sq), candidates[rows, best], -1), best_sq
+
+    def query(self, positions, tolerance=2.5, fallback=None):
+        """Lane ids for (M, 3) positions.
+
+        fallback(x, y, z) is called for the positions farther than tolerance
+        from the nearest indexed waypoint, e.g. to ask map.get_waypoint().
+        Without a fallback those positions get lane id 0.
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        idx, sq_distances = self.nearest(positions)
+        lane_ids = np.where(idx >= 0, self.lane_ids[np.maximum(idx, 0)], 0)
+        far = np.flatnonzero(sq_distances > tolerance ** 2)
+        if fallback is not None:
+            for i in far:
+                lane_ids[i] = fallback(*(float(v) for v in positions[i]))
+        else:   ## off the indexed lanes, carla lane ids are never 0
+            lane_ids[far] = 0
+        return lane_ids
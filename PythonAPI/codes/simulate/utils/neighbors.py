@@ -0,0 +1,170 @@
+### Neighbor extraction around the ego vehicle
+### The states of all vehicles are read once per tick into numpy arrays,
+### the distances are computed in one vectorized operation and the
+### nearest vehicles are selected with argpartition
+### Optionally the neighbors are rotated into the ego frame (x forward,
+### y right like carla) and put into lane slots: the lead and the follow
+### vehicle of the left lane, the ego lane and the right lane.
+
+import numpy as np
+
+
+def squared_distances(positions, center):
+    """Squared distances of the (N, 3) positions to center (x, y, z)"""
+    diff = np.asarray(positions, dtype=np.float64) - np.asarray(center, dtype=np.float64)
+    return np.einsum('ij,ij->i', diff, diff)
+
+
+def select_nearest(sq_distances, radius=50.0, k=15):
+    """Indices of the k smallest squared distances inside radius, nearest first"""
+    inside = np.flatnonzero(sq_distances <= radius ** 2)
+    if inside.size > k:
+        inside = inside[np.argpartition(sq_distances[inside], k - 1)[:k]]
+    return inside[np.argsort(sq_distances[inside], kind='stable')]
+
+
+def nearest_neighbors(positions, center, radius=50.0, k=15):
+    """Return (indices, squared distances) of the k nearest positions inside radius.
+
+    positions is an (N, 3) array, center a length 3 array. The indices are
+    sorted by distance (nearest first).
+    """
+    if len(positions) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    sq_distances = squared_distances(positions, center)
+    order = select_nearest(sq_distances, radius, k)
+    return order, sq_distances[order]
+
+
+LANE_SLOTS = ('left lead', 'left follow', 'lead', 'follow', 'right lead', 'right follow')
+
+
+def to_ego_frame(vectors, yaw):
+    """Rotate the (N, 3) world vectors by -yaw (degrees) into the frame of the ego vehicle"""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    c, s = np.cos(np.radians(yaw)), np.sin(np.radians(yaw))
+    rotation = np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+    return vectors.dot(rotation)
+
+
+def assign_lane_slots(forward, lane_ids, ego_lane_id):
+    """Index of the vehicle in every slot of LANE_SLOTS, -1 for an empty slot.
+
+    forward is the ego frame x of the vehicles (> 0 ahead), lane_ids their lane
+    ids. The lane ids grow (in absolute value) from the center of the road to
+    the right, vehicles on the other side of the road get no slot.
+    """
+    forward = np.asarray(forward, dtype=np.float64)
+    lane_ids = np.asarray(lane_ids, dtype=np.int64)
+    offset = np.abs(lane_ids) - abs(int(ego_lane_id))    ## -1 left, 0 ego lane, +1 right
+    valid = (np.sign(lane_ids) == np.sign(ego_lane_id)) & (np.abs(offset) <= 1)
+    slot = (offset + 1) * 2 + (forward < 0)
+    slots = np.full(len(LANE_SLOTS), -1, dtype=np.int64)
+    candidates = np.flatnonzero(valid)
+    if candidates.size:
+        ## nearest along the lane first inside every slot
+        order = candidates[np.lexsort((np.abs(forward[candidates]), slot[candidates]))]
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = slot[order][1:] != slot[order][:-1]
+        slots[slot[order[first]]] = order[first]
+    return slots
+
+
+class NeighborSet(object):
+    """The vehicles inside the radius of the ego vehicle, nearest first"""
+
+    def __init__(self, ids, type_ids, location, rotation, velocity, sq_distances, in_radius,
+                 local_location=None, local_velocity=None):
+        self.ids = ids                    ## (K,) actor ids
+        self.type_ids = type_ids          ## list of K type_id strings
+        self.location = location          ## (K, 3) x, y, z
+        self.rotation = rotation          ## (K, 3) yaw, pitch, roll
+        self.velocity = velocity          ## (K, 3) x, y, z
+        self.sq_distances = sq_distances  ## (K,)
+        self.in_radius = in_radius        ## (M, 3) locations of all vehicles inside the radius
+        self.local_location = local_location    ## (K, 3) location in the ego frame, if asked for
+        self.local_velocity = local_velocity    ## (K, 3) velocity in the ego frame, if asked for
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lane_slots(self, lane_ids, ego_lane_id):
+        """Index into this set of the vehicle in every LANE_SLOTS slot, -1 if empty.
+
+        Needs the ego frame (scan with ego_yaw). Only the max_neighbors nearest
+        vehicles are candidates.
+        """
+        if self.local_location is None:
+            raise ValueError('lane slots need the ego frame, scan with ego_yaw')
+        return assign_lane_slots(self.local_location[:, 0], lane_ids, ego_lane_id)
+
+
+class NeighborScanner(object):
+    """Reads all vehicle states of a world into preallocated numpy arrays.
+
+    The actor list is fetched once with world.get_actors(ids) and reused for
+    every tick, call refresh() when vehicles are spawned or destroyed.
+    Each actor is asked for its transform and velocity exactly once per scan.
+    """
+
+    def __init__(self, world, vehicle_ids, radius=50.0, max_neighbors=15):
+        self.world = world
+        self.radius = radius
+        self.max_neighbors = max_neighbors
+        self.refresh(vehicle_ids)
+
+    def refresh(self, vehicle_ids):
+        self.actors = list(self.world.get_actors(list(vehicle_ids)))
+        n = len(self.actors)
+        self.ids = np.array([actor.id for actor in self.actors], dtype=np.int64)
+        self.type_ids = [actor.type_id for actor in self.actors]
+        self.location = np.zeros((n, 3), dtype=np.float64)
+        self.rotation = np.zeros((n, 3), dtype=np.float64)
+        self.velocity = np.zeros((n, 3), dtype=np.float64)
+
+    def read_states(self, snapshot=None):
+        if snapshot is not None:
+            self._read_snapshot(snapshot)
+            return
+        ## one transform and one velocity read per vehicle
+        for i, actor in enumerate(self.actors):
+            transform = actor.get_transform()
+            velocity = actor.get_velocity()
+            self.location[i] = (transform.location.x, transform.location.y, transform.location.z)
+            self.rotation[i] = (transform.rotation.yaw, transform.rotation.pitch, transform.rotation.roll)
+            self.velocity[i] = (velocity.x, velocity.y, velocity.z)
+
+    def _read_snapshot(self, snapshot):
+        ## vehicles missing in the snapshot are moved out of any radius
+        for i, actor_id in enumerate(self.ids):
+            state = snapshot.get(int(actor_id))
+            if state is None:
+                self.location[i] = np.inf
+                continue
+            location, rotation, velocity = state.location, state.rotation, state.velocity
+            self.location[i] = (location.x, location.y, location.z)
+            self.rotation[i] = (rotation.yaw, rotation.pitch, rotation.roll)
+            self.velocity[i] = (velocity.x, velocity.y, velocity.z)
+
+    def scan(self, ego_location, snapshot=None, ego_yaw=None, ego_velocity=None):
+        """Read the states and return the NeighborSet around ego_location (x, y, z).
+
+        With a utils.snapshot.WorldSnapshot the states are taken from it
+        instead of the actors, so ego and neighbors share the same frame.
+        With ego_yaw the neighbors are also given in the ego frame, their
+        velocities relative to ego_velocity (x, y, z) if it is given.
+        """
+        self.read_states(snapshot)
+        sq_distances = squared_distances(self.location, ego_location)
+        in_radius = self.location[sq_distances <= self.radius ** 2]
+        order = select_nearest(sq_distances, self.radius, self.max_neighbors)
+        local_location = local_velocity = None
+        if ego_yaw is not None:
+            local_location = to_ego_frame(self.location[order] - np.asarray(ego_location), ego_yaw)
+            velocity = self.velocity[order]
+            if ego_velocity is not None:
+                velocity = velocity - np.asarray(ego_velocity)
+            local_velocity = to_ego_frame(velocity, ego_yaw)
+        return NeighborSet(self.ids[order], [self.type_ids[i] for i in order],
+                           self.location[order], self.rotation[order], self.velocity[order],
+                           sq_distances[order], in_radius, local_location, local_velocity)
@@ -0,0 +1,89 @@
+### Observation of the ego vehicle and its neighbors
+### One float32 array of shape (1 + max_neighbors, F), the ego vehicle in
+### row 0 and the neighbors nearest first. Rows without a vehicle are zero
+### and have present = 0, the type_id strings are replaced by integer codes.
+### The same buffer is filled again at every step (copy it to keep it).
+###
+###     encoder = ObservationEncoder(TypeCodes.from_world(world))
+###     obs = encoder.encode(ego, neighbors, lane_ids)
+
+import numpy as np
+
+FEATURES = ('present', 'type', 'x', 'y', 'vx', 'vy', 'yaw', 'pitch', 'roll', 'lane_id')
+
+
+class TypeCodes(object):
+    """Integer codes of the type_ids, 0 is no vehicle.
+
+    The known type_ids get the codes 1..n in the given order, unknown ones
+    are appended when they are seen first.
+    """
+
+    def __init__(self, type_ids=()):
+        self.codes = {}
+        for type_id in type_ids:
+            self.code(type_id)
+
+    @classmethod
+    def from_world(cls, world, wildcard='vehicle.*'):
+        ## sorted so that the codes are the same for every run on the same server version
+        return cls(sorted(bp.id for bp in world.get_blueprint_library().filter(wildcard)))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def code(self, type_id):
+        code = self.codes.get(type_id)
+        if code is None:
+            code = self.codes[type_id] = len(self.codes) + 1
+        return code
+
+    def names(self):
+        """type_id of every code, index 0 is None"""
+        names = [None] * (len(self.codes) + 1)
+        for type_id, code in self.codes.items():
+            names[code] = type_id
+        return names
+
+
+class ObservationEncoder(object):
+    """Writes the ego state and a utils.neighbors.NeighborSet into a reused float32 buffer"""
+
+    def __init__(self, type_codes=None, max_neighbors=15):
+        self.type_codes = type_codes or TypeCodes()
+        self.max_neighbors = max_neighbors
+        self.buffer = np.zeros((1 + max_neighbors, len(FEATURES)), dtype=np.float32)
+        self.mask = np.zeros(1 + max_neighbors, dtype=bool)   ## presence of every row
+        self._codes = np.zeros(max_neighbors, dtype=np.float32)
+
+    @property
+    def shape(self):
+        return self.buffer.shape
+
+    def encode(self, ego, neighbors, lane_ids):
+        """Fill the buffer and return it.
+
+        ego is a utils.snapshot.ActorState, lane_ids holds the lane id of the
+        ego vehicle followed by the ones of the neighbors.
+        """
+        buffer = self.buffer
+        k = min(len(neighbors), self.max_neighbors)
+        location, velocity, rotation = ego.location, ego.velocity, ego.rotation
+        buffer[0] = (1.0, self.type_codes.code(ego.type_id), location.x, location.y, velocity.x, velocity.y,
+                     rotation.yaw, rotation.pitch, rotation.roll, lane_ids[0])
+
+        codes = self._codes
+        for i in range(k):
+            codes[i] = self.type_codes.code(neighbors.type_ids[i])
+        rows = buffer[1:1 + k]
+        rows[:, 0] = 1.0
+        rows[:, 1] = codes[:k]
+        rows[:, 2:4] = neighbors.location[:k, :2]
+        rows[:, 4:6] = neighbors.velocity[:k, :2]
+        rows[:, 6:9] = neighbors.rotation[:k]
+        rows[:, 9] = lane_ids[1:1 + k]
+        buffer[1 + k:] = 0.0
+
+        self.mask[:1 + k] = True
+        self.mask[1 + k:] = False
+        return buffer
@@ -0,0 +1,79 @@
+### Client work of a tick overlapped with the next tick
+### The main loop reads the snapshot of frame t and submits it, a worker
+### thread extracts the features and records them while the main thread
+### already ticks frame t + 1. At most maxsize ticks wait for the worker,
+### submit() blocks when it is behind (backpressure). Disabled, submit()
+### runs the work right away like the serial loops.
+###
+###     pipeline = TickPipeline(log_tick, maxsize=2, enabled=args.pipeline)
+###     pipeline.submit(counter, snapshot)
+###     world.tick()
+###     ...
+###     pipeline.close()
+
+import logging
+import queue
+import threading
+
+
+class TickPipeline(object):
+    """Runs process(*args) of the submitted ticks in order on one worker thread.
+
+    The utils.snapshot.WorldSnapshot handed over is a copy, the next tick
+    does not change it. An exception of process() is raised again in the
+    main thread by the next submit() or join(), close() returns it.
+    """
+
+    def __init__(self, process, maxsize=2, enabled=True):
+        self.process = process
+        self.enabled = enabled
+        self.error = None
+        self.waited = 0     ## submits which had to wait for the worker
+        if enabled:
+            self._queue = queue.Queue(maxsize)
+            self._worker = threading.Thread(target=self._run, name='tick-pipeline', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            args = self._queue.get()
+            try:
+                if args is None:
+                    break
+                if self.error is None:      ## after an error the ticks are only drained
+                    self.process(*args)
+            except Exception as error:
+                self.error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, *args):
+        if not self.enabled:
+            self.process(*args)
+            return
+        self._raise()
+        if self._queue.full():
+            self.waited += 1
+        self._queue.put(args)
+
+    def join(self):
+        """Wait until the worker processed every submitted tick (e.g. before the vehicles change)"""
+        if self.enabled:
+            self._queue.join()
+            self._raise()
+
+    def close(self):
+        """Log the queued ticks and stop the worker. Does not raise (it runs in the teardown of
+        the scripts), an exception of process() is logged and returned."""
+        if self.enabled and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+        error, self.error = self.error, None
+        if error is not None:
+            logging.error('logging thread failed: %r', error)
+        return error
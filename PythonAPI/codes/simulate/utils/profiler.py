@@ -0,0 +1,126 @@
+### Per phase timings of the tick loops
+### Every tick is one row of a ring buffer, lap(phase) adds the time since
+### the previous lap to the column of the phase. The 'tick' phase (waiting
+### for world.tick()) is the server bound part, the others are client side.
+###
+###     profiler = TickProfiler(enabled=args.profile, report_every=100)
+###     while True:
+###         profiler.tick()
+###         snapshot = snapshot_reader.read()
+###         profiler.lap('read')
+###         ...
+###         world.tick()
+###         profiler.lap('tick')
+###
+### Work of a worker thread is timed there and add()ed to the tick it
+### overlaps, its phase must be given to the constructor. A disabled profiler
+### only costs the calls of empty methods.
+
+import time
+
+import numpy as np
+
+
+def _noop(*args):
+    pass
+
+
+class TickProfiler(object):
+    """Ring buffer of the phase timings (seconds) of the last capacity ticks.
+
+    report_every > 0 prints the percentiles every report_every ticks, path is
+    the csv file the samples are exported to by close().
+    """
+
+    def __init__(self, phases=(), capacity=1024, enabled=True, report_every=0, path=None):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.report_every = report_every
+        self.path = path
+        self.phases = []
+        self._columns = {}
+        ## one row more than capacity for the tick in progress, the last capacity finished ticks are kept
+        self._slots = capacity + 1
+        self._samples = np.zeros((self._slots, 0), dtype=np.float64)
+        self.ticks = 0
+        self._row = None
+        self._last = None
+        for phase in phases:
+            self._column(phase)
+        if not enabled:
+            self.tick = self.lap = self.add = _noop
+
+    def _column(self, phase):
+        column = self._columns.get(phase)
+        if column is None:
+            column = self._columns[phase] = len(self.phases)
+            self.phases.append(phase)
+            self._samples = np.hstack([self._samples, np.zeros((self._slots, 1))])
+            self._row = None if self._row is None else self._samples[self.ticks % self._slots]
+        return column
+
+    def tick(self):
+        """Start the next tick (and finish the current one)"""
+        if self._row is not None:
+            self.ticks += 1
+            if self.report_every and self.ticks % self.report_every == 0:
+                print(self.report())
+        self._row = self._samples[self.ticks % self._slots]
+        self._row[:] = 0.0
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """Add the time since the previous lap (or the start of the tick) to phase"""
+        if self._row is None:
+            return
+        now = time.perf_counter()
+        column = self._columns.get(phase)
+        if column is None:
+            column = self._column(phase)
+        self._row[column] += now - self._last
+        self._last = now
+
+    def add(self, phase, seconds):
+        """Add seconds timed off the loop (e.g. on the TickPipeline worker) to phase of the current tick"""
+        row = self._row
+        if row is None:
+            return
+        row[self._columns[phase]] += seconds
+
+    def samples(self):
+        """(ticks, phases) timings of the finished ticks in the buffer, oldest first"""
+        n = min(self.ticks, self.capacity)
+        current = self.ticks % self._slots      ## the tick in progress is left out
+        return self._samples[(current - n + np.arange(n)) % self._slots]
+
+    def percentiles(self, q=(50, 90, 99)):
+        """{phase: percentiles in milliseconds}, 'total' is the sum of the phases"""
+        samples = self.samples()
+        if len(samples) == 0:
+            return {}
+        result = {phase: np.percentile(samples[:, i], q) * 1000.0 for i, phase in enumerate(self.phases)}
+        result['total'] = np.percentile(samples.sum(axis=1), q) * 1000.0
+        return result
+
+    def report(self, q=(50, 90, 99)):
+        samples = self.samples()
+        if len(samples) == 0:
+            return 'no ticks profiled'
+        total = samples.sum()
+        lines = ['ticks {}-{} (ms) {}'.format(self.ticks - len(samples), self.ticks,
+                                              ' '.join('p{}'.format(p) for p in q))]
+        for phase, values in self.percentiles(q).items():
+            share = samples[:, self.phases.index(phase)].sum() / total if phase != 'total' and total else 1.0
+            lines.append('  {:<12} {}  {:5.1f}%'.format(phase, ' '.join('%7.2f' % v for v in values), 100.0 * share))
+        return '\n'.join(lines)
+
+    def export(self, path=None):
+        """Write the buffered samples (milliseconds, one row per tick) to a csv file"""
+        path = path or self.path
+        np.savetxt(path, self.samples() * 1000.0, delimiter=',', fmt='%.4f',
+                   header=','.join(self.phases), comments='')
+        return path
+
+    def close(self):
+        if self.enabled and self.path and self.ticks:
+            self.export()
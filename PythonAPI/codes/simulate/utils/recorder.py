@@ -0,0 +1,104 @@
+### Buffered dataset writer
+### Rows are collected in preallocated numpy column buffers and written
+### in chunks, instead of one DataFrame and one file open per row.
+### Formats: csv (appended to one file), parquet and npz (one part file per chunk)
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ('csv', 'parquet', 'npz')
+
+
+def format_path(path, fmt):
+    """Replace the extension of path by the one of the format"""
+    if fmt not in FORMATS:
+        raise ValueError('unknown dataset format {}, expected one of {}'.format(fmt, FORMATS))
+    return os.path.splitext(path)[0] + '.' + fmt
+
+
+class ColumnRecorder(object):
+    """Accumulates rows column by column and flushes every chunk_size rows.
+
+    dtypes maps column names to numpy dtypes, columns not listed are float64.
+    Use dtype object for columns which mix numbers and strings (e.g. 'None'
+    padding). close() must be called at the end to write the last rows.
+    """
+
+    def __init__(self, path, columns, dtypes=None, fmt='csv', chunk_size=4096):
+        if fmt == 'parquet':
+            try:
+                import pyarrow
+            except ImportError:
+                raise ImportError('the parquet format needs pyarrow, install it or use csv/npz')
+        dtypes = dtypes or {}
+        self.path = format_path(path, fmt)
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+        self._buffers = [np.empty(chunk_size, dtype=dtypes.get(c, np.float64)) for c in self.columns]
+        self._size = 0
+        self._part = len(glob.glob(self._part_path('*')))
+
+    def __len__(self):
+        return self.rows_written + self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _part_path(self, part):
+        base, ext = os.path.splitext(self.path)
+        return '{}_{}{}'.format(base, part if part == '*' else '%05d' % part, ext)
+
+    def append(self, row):
+        if len(row) != len(self._buffers):
+            raise ValueError('row has {} values, expected {}'.format(len(row), len(self._buffers)))
+        i = self._size
+        for buffer, value in zip(self._buffers, row):
+            buffer[i] = value
+        self._size += 1
+        if self._size == self.chunk_size:
+            self.flush()
+
+    def chunk(self):
+        """The buffered rows as a dict of column arrays (views, not copies)"""
+        return {c: b[:self._size] for c, b in zip(self.columns, self._buffers)}
+
+    def flush(self):
+        if self._size == 0:
+            return
+        if self.fmt == 'csv':
+            self._write_csv()
+        elif self.fmt == 'parquet':
+            self._write_parquet()
+        else:
+            self._write_npz()
+        self.rows_written += self._size
+        self._size = 0
+
+    def close(self):
+        self.flush()
+
+    def _write_csv(self):
+        newfile = not os.path.isfile(self.path)
+        pd.DataFrame(self.chunk(), columns=self.columns).to_csv(
+            self.path, header=newfile, mode='a', index=False)
+
+    def _text_columns(self):
+        ## object columns are stored as strings in the binary formats
+        return {c: (b.astype(str) if b.dtype == object else b) for c, b in self.chunk().items()}
+
+    def _write_parquet(self):
+        pd.DataFrame(self._text_columns(), columns=self.columns).to_parquet(
+            self._part_path(self._part), index=False)
+        self._part += 1
+
+    def _write_npz(self):
+        np.savez(self._part_path(self._part), **self._text_columns())
+        self._part += 1
@@ -0,0 +1,137 @@
+### Which ticks are logged
+### A sampling policy decides per tick whether the recorder gets a row:
+###   stride    every N ticks
+###   event     every N ticks, and every event_stride ticks for event_window
+###             ticks after an event (lane change, collision)
+###   adaptive  at most every min_stride ticks when the neighbor set changed
+###             by change_threshold (Jaccard distance of the ids), at least
+###             every N ticks
+### The loop asks candidate(counter) first (cheap), computes what the policy
+### needs (e.g. the neighbors) and then asks sample(). The scripts share the
+### command line options of add_sampling_arguments().
+
+SAMPLINGS = ('stride', 'event', 'adaptive')
+
+
+class StridePolicy(object):
+    """Every stride ticks"""
+
+    def __init__(self, stride=20):
+        self.stride = max(int(stride), 1)
+        self.samples = 0
+
+    def event(self, counter, name):
+        pass
+
+    def candidate(self, counter):
+        return counter % self.stride == 0
+
+    def sample(self, counter, neighbor_ids=None):
+        if counter % self.stride:
+            return False
+        self.samples += 1
+        return True
+
+
+class EventPolicy(StridePolicy):
+    """Every stride ticks, denser (every event_stride ticks) for event_window ticks after an event"""
+
+    def __init__(self, stride=20, event_stride=1, event_window=40):
+        super(EventPolicy, self).__init__(stride)
+        self.event_stride = max(int(event_stride), 1)
+        self.event_window = event_window
+        self.last_event = None
+        self.events = {}
+
+    def event(self, counter, name):
+        self.last_event = counter
+        self.events[name] = self.events.get(name, 0) + 1
+
+    def _in_window(self, counter):
+        return self.last_event is not None and counter - self.last_event <= self.event_window
+
+    def candidate(self, counter):
+        return counter % self.stride == 0 or (self._in_window(counter) and counter % self.event_stride == 0)
+
+    def sample(self, counter, neighbor_ids=None):
+        if not self.candidate(counter):
+            return False
+        self.samples += 1
+        return True
+
+
+class AdaptivePolicy(StridePolicy):
+    """Log when the neighbor set changed enough, at least every stride ticks.
+
+    Without neighbor ids (scripts without neighbors) it is a stride policy.
+    """
+
+    def __init__(self, stride=100, min_stride=5, change_threshold=0.2):
+        super(AdaptivePolicy, self).__init__(stride)
+        self.min_stride = max(int(min_stride), 1)
+        self.change_threshold = change_threshold
+        self.last_sample = None
+        self.last_ids = frozenset()
+
+    def candidate(self, counter):
+        return counter % self.min_stride == 0 or self.last_sample is None or counter - self.last_sample >= self.stride
+
+    def change(self, neighbor_ids):
+        """Jaccard distance between neighbor_ids and the ids of the last logged tick"""
+        ids = frozenset(int(i) for i in neighbor_ids)
+        union = len(ids | self.last_ids)
+        return 1.0 - len(ids & self.last_ids) / float(union) if union else 0.0
+
+    def sample(self, counter, neighbor_ids=None):
+        due = self.last_sample is None or counter - self.last_sample >= self.stride
+        changed = (neighbor_ids is not None and counter % self.min_stride == 0 and
+                   self.change(neighbor_ids) >= self.change_threshold)
+        if not (due or changed):
+            return False
+        self.last_sample = counter
+        if neighbor_ids is not None:
+            self.last_ids = frozenset(int(i) for i in neighbor_ids)
+        self.samples += 1
+        return True
+
+
+def add_sampling_arguments(argparser, stride):
+    """The sampling options, stride is the default logging stride of the script"""
+    argparser.add_argument(
+        '--sampling',
+        default='stride',
+        choices=SAMPLINGS,
+        help='which ticks are logged: {} (default: stride)'.format(', '.join(SAMPLINGS)))
+    argparser.add_argument(
+        '--log_every',
+        default=stride,
+        type=int,
+        help='log every N ticks, the base stride of all samplings (default: {})'.format(stride))
+    argparser.add_argument(
+        '--event_window',
+        default=40,
+        type=int,
+        help='event sampling: ticks logged densely after a lane change or collision (default: 40)')
+    argparser.add_argument(
+        '--event_stride',
+        default=1,
+        type=int,
+        help='event sampling: stride inside the event window (default: 1)')
+    argparser.add_argument(
+        '--min_stride',
+        default=5,
+        type=int,
+        help='adaptive sampling: ticks between two looks at the neighbors (default: 5)')
+    argparser.add_argument(
+        '--change_threshold',
+        default=0.2,
+        type=float,
+        help='adaptive sampling: neighbor set change which is logged (default: 0.2)')
+
+
+def policy_from_args(args):
+    if args.sampling == 'event':
+        return EventPolicy(args.log_every, args.event_stride, args.event_window)
+    if args.sampling == 'adaptive':
+        return AdaptivePolicy(args.log_every, args.min_stride, args.change_threshold)
+    return StridePolicy(args.log_every)
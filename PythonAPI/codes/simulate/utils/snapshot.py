@@ -0,0 +1,115 @@
+### Per tick actor states
+### All states of one frame are copied from world.get_snapshot() into
+### small __slots__ records, so the logging code reads every field of a
+### vehicle from the same simulation frame without asking the actor again
+
+
+class Vector3(object):
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __repr__(self):
+        return 'Vector3(x={}, y={}, z={})'.format(self.x, self.y, self.z)
+
+
+class Rotation3(object):
+    __slots__ = ('pitch', 'yaw', 'roll')
+
+    def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+        self.pitch = pitch
+        self.yaw = yaw
+        self.roll = roll
+
+    def __repr__(self):
+        return 'Rotation3(pitch={}, yaw={}, roll={})'.format(self.pitch, self.yaw, self.roll)
+
+
+def _vector(v):
+    return Vector3(v.x, v.y, v.z)
+
+
+class ActorState(object):
+    """State of one actor in one frame"""
+    __slots__ = ('id', 'type_id', 'location', 'rotation', 'velocity', 'acceleration', 'angular_velocity')
+
+    def __init__(self, id, type_id, location, rotation, velocity, acceleration, angular_velocity):
+        self.id = id
+        self.type_id = type_id
+        self.location = location
+        self.rotation = rotation
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.angular_velocity = angular_velocity
+
+    @classmethod
+    def from_actor_snapshot(cls, actor_snapshot, type_id):
+        transform = actor_snapshot.get_transform()
+        rotation = transform.rotation
+        return cls(actor_snapshot.id, type_id, _vector(transform.location),
+                   Rotation3(rotation.pitch, rotation.yaw, rotation.roll),
+                   _vector(actor_snapshot.get_velocity()), _vector(actor_snapshot.get_acceleration()),
+                   _vector(actor_snapshot.get_angular_velocity()))
+
+
+class WorldSnapshot(object):
+    """The states of the tracked actors in one frame, indexed by actor id"""
+    __slots__ = ('frame', 'elapsed_seconds', 'states')
+
+    def __init__(self, frame, elapsed_seconds, states):
+        self.frame = frame
+        self.elapsed_seconds = elapsed_seconds
+        self.states = states
+
+    def __getitem__(self, actor_id):
+        return self.states[actor_id]
+
+    def __contains__(self, actor_id):
+        return actor_id in self.states
+
+    def __iter__(self):
+        return iter(self.states.values())
+
+    def __len__(self):
+        return len(self.states)
+
+    def get(self, actor_id, default=None):
+        return self.states.get(actor_id, default)
+
+
+class SnapshotReader(object):
+    """Builds a WorldSnapshot of the tracked actors from world.get_snapshot().
+
+    The type ids are not part of a carla snapshot, they are read once when
+    the actors are tracked. Actors which are gone are left out of the snapshot.
+    """
+
+    def __init__(self, world, actor_ids=()):
+        self.world = world
+        self.type_ids = {}
+        self.track(actor_ids)
+
+    def track(self, actor_ids):
+        actor_ids = [i for i in actor_ids if i not in self.type_ids]
+        if actor_ids:
+            for actor in self.world.get_actors(actor_ids):
+                self.type_ids[actor.id] = actor.type_id
+
+    def untrack(self, actor_ids):
+        for actor_id in actor_ids:
+            self.type_ids.pop(actor_id, None)
+
+    def read(self):
+        snapshot = self.world.get_snapshot()
+        states = {}
+        for actor_id, type_id in self.type_ids.items():
+            actor_snapshot = snapshot.find(actor_id)
+            if actor_snapshot is not None:
+                states[actor_id] = ActorState.from_actor_snapshot(actor_snapshot, type_id)
+        return WorldSnapshot(snapshot.frame, snapshot.timestamp.elapsed_seconds, states)
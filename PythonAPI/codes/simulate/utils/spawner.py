@@ -0,0 +1,93 @@
+### Batched vehicle spawning
+### Every vehicle is described by a VehicleSpec. All of them are spawned
+### with one apply_batch_sync round trip (SpawnActor, then SetAutopilot and
+### the start control on the FutureActor), afterwards the traffic manager
+### settings are applied per setting for the vehicles which were spawned.
+### The traffic manager setters have no batch command in carla 0.9.9.
+
+
+class VehicleSpec(object):
+    """What to spawn: blueprint, transform and the traffic manager settings.
+
+    tm_settings maps traffic manager setter names to their value, e.g.
+    {'distance_to_leading_vehicle': 3.0, 'auto_lane_change': True}
+    The modifiable attributes of blueprint (color, role_name, ...) are copied
+    now, the caller may set them again for the next spec.
+    """
+    __slots__ = ('blueprint', 'attributes', 'transform', 'autopilot', 'tm_settings', 'control', 'tag')
+
+    def __init__(self, blueprint, transform, autopilot=True, tm_settings=None, control=None, tag=None):
+        self.blueprint = blueprint
+        self.attributes = [(a.id, a.as_str()) for a in blueprint if a.is_modifiable]
+        self.transform = transform
+        self.autopilot = autopilot
+        self.tm_settings = tm_settings or {}
+        self.control = control
+        self.tag = tag
+
+
+class SpawnResult(object):
+    __slots__ = ('spec', 'actor_id', 'error')
+
+    def __init__(self, spec, actor_id, error):
+        self.spec = spec
+        self.actor_id = actor_id
+        self.error = error
+
+    @property
+    def ok(self):
+        return not self.error
+
+
+class VehicleSpawner(object):
+    """Spawns VehicleSpecs in one batch.
+
+    carla is the carla module (or utils.fake_carla), it provides the commands.
+    """
+
+    def __init__(self, carla, client, world, traffic_manager, tm_port=8000):
+        self.carla = carla
+        self.client = client
+        self.world = world
+        self.traffic_manager = traffic_manager
+        self.tm_port = tm_port
+
+    def commands(self, specs):
+        command = self.carla.command
+        batch = []
+        for spec in specs:
+            ## the blueprint may be shared by several specs, SpawnActor copies it with the attributes of this one
+            for id, value in spec.attributes:
+                spec.blueprint.set_attribute(id, value)
+            cmd = command.SpawnActor(spec.blueprint, spec.transform)
+            if spec.autopilot:
+                cmd = cmd.then(command.SetAutopilot(command.FutureActor, True, self.tm_port))
+            if spec.control is not None:
+                cmd = cmd.then(command.ApplyVehicleControl(command.FutureActor, spec.control))
+            batch.append(cmd)
+        return batch
+
+    def spawn(self, specs, do_tick=False):
+        """Spawn the specs, return one SpawnResult per spec (in the same order)"""
+        responses = self.client.apply_batch_sync(self.commands(specs), do_tick)
+        results = [SpawnResult(spec, response.actor_id if not response.error else None, response.error)
+                   for spec, response in zip(specs, responses)]
+        self.configure([r for r in results if r.ok])
+        return results
+
+    def configure(self, results):
+        """Apply the traffic manager settings, grouped by setting"""
+        if not results:
+            return
+        actors = {a.id: a for a in self.world.get_actors([r.actor_id for r in results])}
+        settings = {}
+        for result in results:
+            actor = actors.get(result.actor_id)
+            if actor is None:
+                continue
+            for name, value in result.spec.tm_settings.items():
+                settings.setdefault(name, []).append((actor, value))
+        for name, pairs in settings.items():
+            setter = getattr(self.traffic_manager, name)
+            for actor, value in pairs:
+                setter(actor, value)
@@ -0,0 +1,87 @@
+### Start positions of the lanes
+### The coordination csv written by view_spawn_points.py (Frame, then
+### X, Y, Z, pitch, yaw, roll for every lane) is compiled once into a
+### (lanes, frames, 6) float32 array saved next to it as .npy. Later runs
+### memory map the .npy instead of parsing the csv with pandas.
+### Lanes are numbered from 1 like in the csv columns ('lane3 X').
+
+import os
+
+import numpy as np
+
+from utils.warm_cache import atomic_save
+
+FIELDS = ('X', 'Y', 'Z', 'pitch', 'yaw', 'roll')
+
+
+class StartTable(object):
+    def __init__(self, table):
+        self.table = table
+
+    @property
+    def num_lanes(self):
+        return self.table.shape[0]
+
+    @property
+    def num_frames(self):
+        return self.table.shape[1]
+
+    @staticmethod
+    def compile(csv_path, npy_path=None):
+        """Convert the csv to the (lanes, frames, 6) array and save it"""
+        npy_path = npy_path or os.path.splitext(csv_path)[0] + '.npy'
+        with open(csv_path) as f:
+            header = f.readline().strip().split(',')
+        data = np.loadtxt(csv_path, delimiter=',', skiprows=1, dtype=np.float64, ndmin=2)
+        num_lanes = (len(header) - 1) // len(FIELDS)
+        columns = [[header.index('lane{} {}'.format(lane + 1, field)) for field in FIELDS]
+                   for lane in range(num_lanes)]
+        table = np.ascontiguousarray(data[:, columns].transpose(1, 0, 2), dtype=np.float32)
+        atomic_save(npy_path, lambda f: np.save(f, table))     ## other runs may load it meanwhile
+        return npy_path
+
+    @classmethod
+    def load(cls, csv_path, mmap=True):
+        """Load the compiled table, (re)compile it if the csv is newer"""
+        npy_path = os.path.splitext(csv_path)[0] + '.npy'
+        if not os.path.isfile(npy_path) or (os.path.isfile(csv_path) and
+                                            os.path.getmtime(csv_path) > os.path.getmtime(npy_path)):
+            cls.compile(csv_path, npy_path)
+        return cls(np.load(npy_path, mmap_mode='r' if mmap else None))
+
+    def row(self, lane, frame):
+        """X, Y, Z, pitch, yaw, roll of a lane in a frame"""
+        return self.table[lane - 1, frame]
+
+    def layout(self, count, first_frame=51, spacing=20, lanes=None, skip_frames=()):
+        """(lane, frame) slots for count vehicles: the lanes in turn, spacing frames apart.
+
+        Frames in skip_frames (e.g. the start of the ego vehicle) are left out.
+        """
+        lanes = list(lanes or range(1, self.num_lanes + 1))
+        slots = []
+        frame = first_frame
+        while len(slots) < count:
+            if frame not in skip_frames:
+                slots.append((lanes[len(slots) % len(lanes)], frame))
+            frame += spacing
+        return np.array(slots, dtype=np.int64).reshape(-1, 2)
+
+    def max_offset(self, slots):
+        """Largest frame offset which keeps all slots inside the table"""
+        slots = np.asarray(slots).reshape(-1, 2)
+        return self.num_frames - 1 - int(slots[:, 1].max()) if len(slots) else self.num_frames - 1
+
+    def sample_offset(self, slots, rng=np.random):
+        return int(rng.randint(0, self.max_offset(slots) + 1))
+
+    def poses(self, slots, offset=0):
+        """(N, 6) poses of the slots moved by offset frames, read in one indexing operation"""
+        slots = np.asarray(slots).reshape(-1, 2)
+        return np.asarray(self.table[slots[:, 0] - 1, slots[:, 1] + offset])
+
+    def transforms(self, carla, slots, offset=0, z_offset=2.0):
+        """carla.Transforms of the slots, z_offset lifts the vehicles above the road"""
+        return [carla.Transform(carla.Location(x=float(x), y=float(y), z=float(z) + z_offset),
+                                carla.Rotation(pitch=float(pitch), yaw=float(yaw), roll=float(roll)))
+                for x, y, z, pitch, yaw, roll in self.poses(slots, offset)]
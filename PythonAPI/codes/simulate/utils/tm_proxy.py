@@ -0,0 +1,70 @@
+### Traffic manager calls once per tick
+### The per vehicle setters of the traffic manager are queued by the proxy
+### and sent by flush() (before world.tick()). A setting which already has
+### the value last applied to the actor is dropped, several calls of the
+### same setter during a tick only send the last value. force_lane_change
+### is a command, not a setting: it is sent again every time, but only once
+### per tick. Every other attribute is the one of the traffic manager.
+###
+###     traffic_manager = TrafficManagerProxy(client.get_trafficmanager(8000))
+###     traffic_manager.ignore_vehicles_percentage(actor, 100)
+###     traffic_manager.flush()
+###     world.tick()
+
+SETTERS = ('auto_lane_change', 'collision_detection', 'distance_to_leading_vehicle', 'force_lane_change',
+           'ignore_lights_percentage', 'ignore_signs_percentage', 'ignore_vehicles_percentage',
+           'ignore_walkers_percentage', 'vehicle_percentage_speed_difference')
+COMMANDS = ('force_lane_change',)
+
+
+class TrafficManagerProxy(object):
+    """Deduplicates and defers the per vehicle settings of a carla TrafficManager"""
+
+    def __init__(self, traffic_manager):
+        self.traffic_manager = traffic_manager
+        self._applied = {}      ## (setter, actor ids) -> value
+        self._pending = {}      ## (setter, actor ids) -> arguments, in call order
+        self.sent = 0
+        self.dropped = 0
+
+    def __getattr__(self, name):
+        if name not in SETTERS:
+            return getattr(self.traffic_manager, name)
+
+        def setter(*args):
+            ## the last argument is the value, the others are actors
+            self._queue(name, args)
+        return setter
+
+    def _queue(self, name, args):
+        key = (name, tuple(actor.id for actor in args[:-1]))
+        if key in self._pending:    ## the last value of the tick wins
+            del self._pending[key]
+            self.dropped += 1
+        if name not in COMMANDS and key in self._applied and self._applied[key] == args[-1]:
+            self.dropped += 1
+            return
+        self._pending[key] = args
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Send the queued settings, returns how many calls were sent"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        for (name, ids), args in pending.items():
+            getattr(self.traffic_manager, name)(*args)
+            if name not in COMMANDS:
+                self._applied[(name, ids)] = args[-1]
+        self.sent += len(pending)
+        return len(pending)
+
+    def forget(self, actor_ids):
+        """Drop the cached settings of actors which are gone"""
+        actor_ids = set(actor_ids)
+        for cache in (self._applied, self._pending):
+            for key in [k for k in cache if actor_ids.intersection(k[1])]:
+                del cache[key]
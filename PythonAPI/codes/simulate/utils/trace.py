@@ -0,0 +1,213 @@
+### Recorded traces of the simulation
+### TraceWriter stores one row per tick: the states of the tracked actors
+### (ego vehicle first), the action, the collisions and the episode. Every
+### field is a raw binary file in the trace directory, rows are appended
+### chunk by chunk and meta.json describes the shapes. TraceReader memory
+### maps the files, ReplayEnv serves reset() / step() from them so rewards
+### can be tried out again without a simulator.
+###
+###     trace = TraceWriter('Datasets/trace_1', [audi_id] + rest_vehicleactors)
+###     trace.append(snapshot, collisions=collision_monitor.poll())
+###     ...
+###     env = ReplayEnv(TraceReader('Datasets/trace_1'))
+
+import json
+import os
+
+import numpy as np
+
+## columns of the state of an actor
+STATE_FIELDS = ('x', 'y', 'z', 'pitch', 'yaw', 'roll', 'vx', 'vy', 'vz', 'wx', 'wy', 'wz')
+
+
+def map_fields(directory, meta):
+    """Memory map the <field>.bin files described by meta ({'rows': .., 'fields': {name: {dtype, shape}}})"""
+    rows = meta['rows']
+    fields = {}
+    for name, field in meta['fields'].items():
+        shape = (rows,) + tuple(field['shape'])
+        if 0 in shape:   ## an empty file can not be mapped
+            fields[name] = np.zeros(shape, dtype=field['dtype'])
+        else:
+            fields[name] = np.memmap(os.path.join(directory, name + '.bin'), dtype=field['dtype'],
+                                     mode='r', shape=shape)
+    return fields
+
+
+class TraceWriter(object):
+    """Appends ticks to a trace directory, chunk_size ticks are buffered.
+
+    actor_ids are the tracked actors, their order gives the slots of the
+    state rows. action_size is the length of the action vector (0 for none),
+    action_fields optionally names its entries (kept in meta.json).
+    A trace already in directory is replaced.
+    """
+
+    def __init__(self, directory, actor_ids, action_size=0, chunk_size=1024, action_fields=()):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.actor_ids = list(actor_ids)
+        self.chunk_size = chunk_size
+        self.action_fields = list(action_fields)
+        if self.action_fields and len(self.action_fields) != action_size:
+            raise ValueError('got {} action fields for an action of size {}'.format(len(self.action_fields), action_size))
+        self.episode = 0
+        self.rows_written = 0
+        n = len(self.actor_ids)
+        self.fields = {
+            'frame': np.zeros(chunk_size, dtype=np.int64),
+            'elapsed': np.zeros(chunk_size, dtype=np.float64),
+            'episode': np.zeros(chunk_size, dtype=np.int32),
+            'done': np.zeros(chunk_size, dtype=np.uint8),
+            'states': np.zeros((chunk_size, n, len(STATE_FIELDS)), dtype=np.float32),
+            'actions': np.zeros((chunk_size, action_size), dtype=np.float32),
+            'collisions': np.zeros(chunk_size, dtype=np.int32),
+            'intensity': np.zeros(chunk_size, dtype=np.float32),
+        }
+        self._size = 0
+        for name in self.fields:
+            open(self._path(name), 'wb').close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + '.bin')
+
+    def track(self, actor_ids):
+        """New ids of the same slots, e.g. after vehicles were spawned again"""
+        if len(actor_ids) != len(self.actor_ids):
+            raise ValueError('got {} actor ids for {} slots'.format(len(actor_ids), len(self.actor_ids)))
+        self.actor_ids = list(actor_ids)
+
+    def new_episode(self):
+        """The next ticks belong to a new episode"""
+        self.episode += 1
+
+    def append(self, snapshot, action=None, collisions=(), done=False):
+        """Add one tick.
+
+        snapshot is a utils.snapshot.WorldSnapshot, actors missing in it get
+        NaN states. collisions are the utils.collisions.CollisionSummary of the tick.
+        """
+        i = self._size
+        fields = self.fields
+        fields['frame'][i] = snapshot.frame
+        fields['elapsed'][i] = snapshot.elapsed_seconds
+        fields['episode'][i] = self.episode
+        fields['done'][i] = done
+        states = fields['states'][i]
+        for slot, actor_id in enumerate(self.actor_ids):
+            state = snapshot.get(actor_id)
+            if state is None:
+                states[slot] = np.nan
+                continue
+            location, rotation, velocity, angular = state.location, state.rotation, state.velocity, state.angular_velocity
+            states[slot] = (location.x, location.y, location.z, rotation.pitch, rotation.yaw, rotation.roll,
+                            velocity.x, velocity.y, velocity.z, angular.x, angular.y, angular.z)
+        if action is not None:
+            fields['actions'][i] = action
+        fields['collisions'][i] = sum(c.count for c in collisions)
+        fields['intensity'][i] = max([c.max_intensity for c in collisions] or [0.0])
+        self._size += 1
+        if self._size == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._size == 0:
+            return
+        for name, buffer in self.fields.items():
+            with open(self._path(name), 'ab') as f:
+                f.write(buffer[:self._size].tobytes())
+        self.rows_written += self._size
+        self._size = 0
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {'rows': self.rows_written, 'actor_ids': self.actor_ids, 'state_fields': STATE_FIELDS,
+                'action_fields': self.action_fields,
+                'fields': {name: {'dtype': buffer.dtype.str, 'shape': list(buffer.shape[1:])}
+                           for name, buffer in self.fields.items()}}
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+
+    def close(self):
+        self.flush()
+        self._write_meta()
+
+
+class TraceReader(object):
+    """Memory maps a trace directory, fields are read as trace['states'][rows]"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.actor_ids = self.meta['actor_ids']
+        rows = self.meta['rows']
+        self.fields = map_fields(directory, self.meta)
+        ## first row of every episode, plus the end
+        self.episode_bounds = np.zeros(1, dtype=np.int64)
+        if rows:
+            starts = np.flatnonzero(np.diff(self.fields['episode'])) + 1
+            self.episode_bounds = np.concatenate([[0], starts, [rows]]).astype(np.int64)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    @property
+    def num_episodes(self):
+        return len(self.episode_bounds) - 1
+
+    def episode(self, k):
+        """(start, stop) rows of episode k"""
+        return int(self.episode_bounds[k]), int(self.episode_bounds[k + 1])
+
+
+def collision_penalty(trace, row, action):
+    return -float(trace['collisions'][row])
+
+
+class ReplayEnv(object):
+    """reset() / step() from a TraceReader, the recorded ticks are played back.
+
+    The action passed to step() does not change the trace, it is given to
+    reward_fn(trace, row, action) together with the row of the tick.
+    observation_fn(trace, row) builds the observation, by default the state
+    rows of the tick (a view of the memory map). Episodes are played in order.
+    """
+
+    def __init__(self, trace, observation_fn=None, reward_fn=collision_penalty):
+        if len(trace) == 0:
+            raise ValueError('the trace {} is empty'.format(trace.directory))
+        self.trace = trace
+        self.observation_fn = observation_fn or (lambda trace, row: trace['states'][row])
+        self.reward_fn = reward_fn
+        self.episode = -1
+        self.row = 0
+        self.stop = 0
+
+    def reset(self, episode=None):
+        self.episode = (self.episode + 1) % self.trace.num_episodes if episode is None else episode
+        self.row, self.stop = self.trace.episode(self.episode)
+        return self.observation_fn(self.trace, self.row)
+
+    def step(self, action=None):
+        trace = self.trace
+        reward = self.reward_fn(trace, self.row, action)
+        info = {'frame': int(trace['frame'][self.row]), 'recorded_action': trace['actions'][self.row],
+                'collisions': int(trace['collisions'][self.row])}
+        ## the last row of an episode is only observed, an episode of one row is done right away
+        self.row = min(self.row + 1, self.stop - 1)
+        done = self.row >= self.stop - 1 or bool(trace['done'][self.row])
+        return self.observation_fn(trace, self.row), reward, done, info
+
+    def close(self):
+        pass
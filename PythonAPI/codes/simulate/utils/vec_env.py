@@ -0,0 +1,148 @@
+### Vectorized gym environments
+### N CarlaEnv instances, each one talking to its own server and traffic
+### manager (port / tm_port pair), are stepped together. reset() and step()
+### return the observations stacked into one numpy array.
+###
+###     env_fns = carla_env_fns(4, port=2000, tm_port=8000)
+###     envs = VecCarlaEnv(env_fns)
+###     obs = envs.reset()
+###     obs, rewards, dones, infos = envs.step(actions)
+###
+### An environment which is done is reset right away, its last observation
+### is kept in info['terminal_observation'].
+
+import multiprocessing
+
+import numpy as np
+
+
+class CarlaEnvFactory(object):
+    """Picklable constructor of one gym environment, used in the worker processes"""
+
+    def __init__(self, env_id='carla-v0', **kwargs):
+        self.env_id = env_id
+        self.kwargs = kwargs
+
+    def __call__(self):
+        import gym
+        return gym.make(self.env_id, **self.kwargs)
+
+
+def carla_env_fns(num_envs, env_id='carla-v0', host='127.0.0.1', port=2000, tm_port=8000,
+                  port_step=2, tm_port_step=1, **kwargs):
+    """One factory per server, a carla server uses port and port + 1"""
+    return [CarlaEnvFactory(env_id, host=host, port=port + i * port_step, tm_p=tm_port + i * tm_port_step, **kwargs)
+            for i in range(num_envs)]
+
+
+def _step(env, action):
+    ob, reward, done, info = env.step(action)
+    if done:
+        info = dict(info)
+        info['terminal_observation'] = ob
+        ob = env.reset()
+    return ob, reward, done, info
+
+
+def _stack(results):
+    obs, rewards, dones, infos = zip(*results)
+    return np.stack(obs), np.asarray(rewards, dtype=np.float32), np.asarray(dones, dtype=bool), list(infos)
+
+
+def _worker(remote, parent_remote, env_fn):
+    parent_remote.close()
+    env = env_fn()
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                remote.send(_step(env, data))
+            elif cmd == 'reset':
+                remote.send(env.reset())
+            elif cmd == 'spaces':
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == 'close':
+                break
+            else:
+                raise NotImplementedError(cmd)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env.close()
+        remote.close()
+
+
+class SerialVecEnv(object):
+    """All environments in this process, one after the other (debugging, fake simulators)"""
+
+    def __init__(self, env_fns):
+        self.envs = [fn() for fn in env_fns]
+        self.num_envs = len(self.envs)
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+
+    def reset(self):
+        return np.stack([env.reset() for env in self.envs])
+
+    def step(self, actions):
+        return _stack([_step(env, action) for env, action in zip(self.envs, actions)])
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+class VecCarlaEnv(object):
+    """One worker process per environment, the steps of all servers run at the same time"""
+
+    def __init__(self, env_fns, start_method=None):
+        ctx = multiprocessing.get_context(start_method)
+        self.num_envs = len(env_fns)
+        self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(self.num_envs)])
+        self.processes = []
+        for work_remote, remote, env_fn in zip(work_remotes, self.remotes, env_fns):
+            process = ctx.Process(target=_worker, args=(work_remote, remote, env_fn), daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+        self.closed = False
+        self.waiting = False
+        self.remotes[0].send(('spaces', None))
+        self.observation_space, self.action_space = self.remotes[0].recv()
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        return np.stack([remote.recv() for remote in self.remotes])
+
+    def step_async(self, actions):
+        if len(actions) != self.num_envs:
+            raise ValueError('got {} actions for {} environments'.format(len(actions), self.num_envs))
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        return _stack(results)
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
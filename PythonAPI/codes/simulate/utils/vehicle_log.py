@@ -0,0 +1,140 @@
+### Typed, memory mapped vehicles_info datasets
+### The csv written by egovehicle_radius.py (ego vehicle + 15 neighbors,
+### 161 columns, 'None' padding) is converted chunk by chunk into binary
+### field files like a trace (utils.trace): ids, type codes, lane ids and
+### the features of the 16 vehicles of every row. VehicleLog reads frame
+### ranges and minibatches from the memory maps without loading the file.
+###
+###     python -m utils.vehicle_log Datasets/vehicles_info_car50_velo80_autopilot.csv
+###     log = VehicleLog('Datasets/vehicles_info_car50_velo80_autopilot')
+###     for batch in log.batches(256):
+###         batch['features']   ## (256, 16, 7) float32
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.observation import TypeCodes
+from utils.trace import map_fields
+
+FEATURES = ('x', 'y', 'vx', 'vy', 'yaw', 'pitch', 'roll')
+NUM_VEHICLES = 16   ## the ego vehicle and 15 neighbors
+
+
+def _columns(num_neighbors=NUM_VEHICLES - 1):
+    """csv column names of the type, id, lane id and features of every vehicle, the ego vehicle first"""
+    types, ids, lanes = ["Ego Vehicle"], ["Ego ID"], ["Ego Lane ID"]
+    features = [["Location X", "Location Y", "Velocity X", "Velocity Y",
+                 "Rotation Yaw", "Rotation Pitch", "Rotation Roll"]]
+    for i in range(1, num_neighbors + 1):
+        types.append("Vehicle {}".format(i))
+        ids.append("Vehicle {} ID".format(i))
+        lanes.append("Vehicle {} Lane ID".format(i))
+        features.append([name + " {}".format(i) for name in features[0]])
+    return types, ids, lanes, features
+
+
+def convert(csv_path, directory=None, chunk_rows=65536):
+    """Convert a vehicles_info csv, returns the directory of the field files (csv name without extension)"""
+    directory = directory or os.path.splitext(csv_path)[0]
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    type_columns, id_columns, lane_columns, feature_columns = _columns()
+    type_codes = TypeCodes()
+    dtypes = {'frame': np.int64, 'ids': np.int64, 'types': np.int16, 'lane_ids': np.int32,
+              'features': np.float32, 'present': np.bool_}
+    files = {name: open(os.path.join(directory, name + '.bin'), 'wb') for name in dtypes}
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, na_values=['None'], keep_default_na=False):
+            ids = chunk[id_columns].to_numpy(dtype=np.float64)
+            present = ~np.isnan(ids)
+            types = chunk[type_columns].to_numpy(dtype=object)
+            codes = np.zeros(types.shape, dtype=np.int16)
+            for type_id in pd.unique(types[present]):
+                codes[types == type_id] = type_codes.code(type_id)
+            fields = {
+                'frame': chunk["Frame"].to_numpy(dtype=np.int64),
+                'ids': np.where(present, ids, -1).astype(np.int64),
+                'types': codes,
+                'lane_ids': np.nan_to_num(chunk[lane_columns].to_numpy(dtype=np.float64)).astype(np.int32),
+                'features': chunk[sum(feature_columns, [])].to_numpy(dtype=np.float32).reshape(
+                    len(chunk), NUM_VEHICLES, len(FEATURES)),
+                'present': present,
+            }
+            for name, values in fields.items():
+                files[name].write(np.ascontiguousarray(values, dtype=dtypes[name]).tobytes())
+            rows += len(chunk)
+    finally:
+        for f in files.values():
+            f.close()
+    shapes = {'frame': [], 'ids': [NUM_VEHICLES], 'types': [NUM_VEHICLES], 'lane_ids': [NUM_VEHICLES],
+              'features': [NUM_VEHICLES, len(FEATURES)], 'present': [NUM_VEHICLES]}
+    meta = {'rows': rows, 'source': os.path.basename(csv_path), 'features': FEATURES,
+            'type_ids': type_codes.names(),
+            'fields': {name: {'dtype': np.dtype(dtype).str, 'shape': shapes[name]} for name, dtype in dtypes.items()}}
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    return directory
+
+
+class VehicleLog(object):
+    """Memory mapped converted vehicles_info dataset.
+
+    Fields: frame (R,), ids (R, 16) (-1 no vehicle), types (R, 16) (codes
+    into type_ids, 0 no vehicle), lane_ids (R, 16), features (R, 16, 7)
+    and present (R, 16).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.type_ids = self.meta['type_ids']
+        self.fields = map_fields(directory, self.meta)
+        ## frame index, rows of appended runs start again at small frames
+        frame = self.fields['frame']
+        self.monotonic = bool(np.all(np.diff(frame) >= 0))
+        self._order = None if self.monotonic else np.argsort(frame, kind='stable')
+        self._sorted_frames = frame if self.monotonic else np.asarray(frame)[self._order]
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    def rows(self, start_frame, stop_frame):
+        """Rows of the frames start_frame <= frame < stop_frame, a slice if the frames are sorted"""
+        lo, hi = np.searchsorted(self._sorted_frames, [start_frame, stop_frame])
+        if self.monotonic:
+            return slice(int(lo), int(hi))
+        return np.sort(self._order[lo:hi])
+
+    def frames(self, start_frame, stop_frame, fields=None):
+        """{field: values} of a frame range, views of the memory maps if the frames are sorted"""
+        rows = self.rows(start_frame, stop_frame)
+        return {name: self.fields[name][rows] for name in (fields or self.fields)}
+
+    def batches(self, batch_size, shuffle=True, seed=None, fields=None, drop_last=True):
+        """Yield {field: values} minibatches of batch_size rows, only the rows of a batch are read"""
+        n = len(self)
+        order = np.random.RandomState(seed).permutation(n) if shuffle else np.arange(n)
+        stop = n - n % batch_size if drop_last else n
+        for start in range(0, stop, batch_size):
+            ## sorted rows read the memory map in file order
+            rows = np.sort(order[start:start + batch_size])
+            yield {name: self.fields[name][rows] for name in (fields or self.fields)}
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='convert vehicles_info csv files to memory mapped field files')
+    argparser.add_argument('csv_files', nargs='+')
+    argparser.add_argument('--chunk_rows', default=65536, type=int, help='csv rows read at once (default: 65536)')
+    args = argparser.parse_args()
+    for csv_file in args.csv_files:
+        directory = convert(csv_file, chunk_rows=args.chunk_rows)
+        print('{} -> {} ({} rows)'.format(csv_file, directory, len(VehicleLog(directory))))
@@ -0,0 +1,109 @@
+### Walkers (pedestrians) with their AI controllers
+### The navigation locations of all walkers (start and target) are sampled
+### in one go, the walkers are spawned in one batch and their controllers in
+### a second one (a controller needs the id of its walker). The controllers
+### have no batch commands in carla 0.9.9, they are started per walker from
+### one get_actors() list. With count 0 (e.g. --no_walkers on the highway)
+### nothing is sent to the server at all.
+###
+###     walkers = WalkerCrowd(carla, client, world, blueprintsWalkers, controller_bp)
+###     walkers.spawn(args.number_of_walkers, do_tick=synchronous_master)
+###     world.tick()    ## the walkers need a tick before their controllers start
+###     walkers.start()
+###     ...
+###     walkers.destroy()
+
+import logging
+import random
+
+
+class WalkerCrowd(object):
+    """The walkers of a script, blueprints are the walker blueprints to choose from.
+
+    carla is the carla module (or utils.fake_carla).
+    """
+
+    def __init__(self, carla, client, world, blueprints, controller_blueprint):
+        self.carla = carla
+        self.client = client
+        self.world = world
+        self.blueprints = blueprints
+        self.controller_blueprint = controller_blueprint
+        self.walker_ids = []
+        self.controller_ids = []
+        self._speeds = []
+        self._targets = []
+        self._controllers = []
+
+    def __len__(self):
+        return len(self.walker_ids)
+
+    def _spawn_batch(self, batch, do_tick):
+        results = self.client.apply_batch_sync(batch, do_tick) if batch else []
+        for result in results:
+            if result.error:
+                logging.error(result.error)
+        return results
+
+    def spawn(self, count, running=0.0, do_tick=False):
+        """Spawn up to count walkers, running is the share of running walkers. Returns how many were spawned"""
+        if count <= 0:
+            return 0
+        SpawnActor = self.carla.command.SpawnActor
+        ## start and target location of every walker
+        locations = [self.world.get_random_location_from_navigation() for _ in range(2 * count)]
+        batch = []
+        speeds = []
+        targets = []
+        for location, target in zip(locations[:count], locations[count:]):
+            if location is None:
+                continue
+            walker_bp = random.choice(self.blueprints)
+            if walker_bp.has_attribute('is_invincible'):   # set as not invincible
+                walker_bp.set_attribute('is_invincible', 'false')
+            if walker_bp.has_attribute('speed'):   # walking or running max speed
+                speed = walker_bp.get_attribute('speed').recommended_values
+                speeds.append(float(speed[2] if random.random() < running else speed[1]))
+            else:
+                speeds.append(0.0)
+            targets.append(target)
+            batch.append(SpawnActor(walker_bp, self.carla.Transform(location)))
+        walkers = [(result.actor_id, speed, target)
+                   for result, speed, target in zip(self._spawn_batch(batch, do_tick), speeds, targets)
+                   if not result.error]
+
+        batch = [SpawnActor(self.controller_blueprint, self.carla.Transform(), walker_id)
+                 for walker_id, _, _ in walkers]
+        for result, (walker_id, speed, target) in zip(self._spawn_batch(batch, do_tick), walkers):
+            self.walker_ids.append(walker_id)
+            if result.error:    ## a walker without controller stands still, it is destroyed with the others
+                continue
+            self.controller_ids.append(result.actor_id)
+            self._speeds.append(speed)
+            self._targets.append(target)
+        return len(walkers)
+
+    def start(self, crossing=0.0):
+        """Start the controllers (after a tick), crossing is the share of walkers crossing the road"""
+        if not self.controller_ids:
+            return
+        self.world.set_pedestrians_cross_factor(crossing)
+        actors = dict((actor.id, actor) for actor in self.world.get_actors(self.controller_ids))
+        self._controllers = [actors[x] for x in self.controller_ids]
+        for controller, speed, target in zip(self._controllers, self._speeds, self._targets):
+            controller.start()
+            controller.go_to_location(target if target is not None else
+                                      self.world.get_random_location_from_navigation())
+            controller.set_max_speed(speed)
+
+    def destroy(self):
+        """Stop the controllers, destroy controllers and walkers in one batch. Returns the number of walkers"""
+        for controller in self._controllers:
+            controller.stop()
+        self._controllers = []
+        ids = self.controller_ids + self.walker_ids
+        if ids:
+            self.client.apply_batch([self.carla.command.DestroyActor(x) for x in ids])
+        count = len(self.walker_ids)
+        self.walker_ids, self.controller_ids = [], []
+        return count
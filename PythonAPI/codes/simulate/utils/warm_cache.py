@@ -0,0 +1,121 @@
+### Warm start cache of the static data of a map
+### The filtered blueprint ids, the spawn points and the waypoint
+### transforms do not change between the runs on one map, they are saved
+### under <directory>/warm_cache/<map>_<server version>/ on the first run
+### and loaded from there afterwards. Every item is only read (or asked
+### from the server) when it is used, the blueprint library is fetched once
+### per process for all filters.
+###
+###     cache = WarmCache(carla, client, world, path_dataset)
+###     blueprints = cache.blueprints('vehicle.*', wheels=4)
+###     spawn_points = cache.spawn_points()
+###     waypoints = cache.waypoint_transforms(10.0)
+
+import json
+import os
+import re
+import tempfile
+
+import numpy as np
+
+## blueprints prone to accidents, left out by the --safe option of the scripts
+UNSAFE = ('isetta', 'carlacola', 'cybertruck', 't2')
+
+
+def atomic_save(path, save):
+    """save(f) into a temporary file which then replaces path.
+
+    A run which is stopped leaves no half file, runs on several servers may
+    write (and read) the same file at the same time.
+    """
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or '.', suffix='.tmp', delete=False) as f:
+        save(f)
+    os.replace(f.name, path)
+
+
+class WarmCache(object):
+    """Blueprint ids, spawn points and waypoint transforms of the map of world.
+
+    carla is the carla module (or utils.fake_carla). The transforms are new
+    carla.Transform objects on every call, the callers may change them.
+    """
+
+    def __init__(self, carla, client, world, directory, map=None):
+        self.carla = carla
+        self.world = world
+        self._map = map     ## the carla.Map of the script, if it has one already
+        self._library = None
+        self._blueprint_ids = None
+        self._arrays = {}
+        key = '{}_{}'.format(os.path.basename(self.map.name), client.get_server_version())
+        self.path = os.path.join(directory, 'warm_cache', re.sub(r'[^\w.-]', '_', key))
+        os.makedirs(self.path, exist_ok=True)
+
+    @property
+    def map(self):
+        if self._map is None:
+            self._map = self.world.get_map()
+        return self._map
+
+    @property
+    def library(self):
+        if self._library is None:
+            self._library = self.world.get_blueprint_library()
+        return self._library
+
+    def blueprint_ids(self, pattern, wheels=None, exclude=()):
+        """Ids of the blueprints matching pattern, with wheels wheels and no id ending with one of exclude"""
+        path = os.path.join(self.path, 'blueprints.json')
+        if self._blueprint_ids is None:
+            self._blueprint_ids = {}
+            if os.path.isfile(path):
+                with open(path) as f:
+                    self._blueprint_ids = json.load(f)
+        key = '{}|{}|{}'.format(pattern, wheels or '', ','.join(exclude))
+        if key not in self._blueprint_ids:
+            blueprints = self.library.filter(pattern)
+            if wheels is not None:
+                blueprints = [x for x in blueprints if int(x.get_attribute('number_of_wheels')) == wheels]
+            self._blueprint_ids[key] = [x.id for x in blueprints if not x.id.endswith(tuple(exclude))]
+            atomic_save(path, lambda f: f.write(json.dumps(self._blueprint_ids, indent=1).encode()))
+        return self._blueprint_ids[key]
+
+    def blueprints(self, pattern, wheels=None, exclude=()):
+        """The blueprints of blueprint_ids(), every one is a copy the caller may set attributes on"""
+        return [self.library.find(x) for x in self.blueprint_ids(pattern, wheels, exclude)]
+
+    def blueprint(self, id):
+        return self.library.find(id)
+
+    def _array(self, name, build):
+        ## (N, 6) x, y, z, pitch, yaw, roll, built by build() on the first run
+        if name not in self._arrays:
+            path = os.path.join(self.path, name + '.npy')
+            if os.path.isfile(path):
+                self._arrays[name] = np.load(path)
+            else:
+                transforms = build()
+                array = np.array([(t.location.x, t.location.y, t.location.z,
+                                   t.rotation.pitch, t.rotation.yaw, t.rotation.roll) for t in transforms],
+                                 dtype=np.float64).reshape(-1, 6)
+                atomic_save(path, lambda f: np.save(f, array))
+                self._arrays[name] = array
+        return self._arrays[name]
+
+    def _transforms(self, array):
+        carla = self.carla
+        return [carla.Transform(carla.Location(x=x, y=y, z=z), carla.Rotation(pitch=pitch, yaw=yaw, roll=roll))
+                for x, y, z, pitch, yaw, roll in array.tolist()]
+
+    def spawn_points(self):
+        return self._transforms(self._array('spawn_points', self.map.get_spawn_points))
+
+    def waypoint_transforms(self, distance, driving_only=False):
+        """Transforms of map.generate_waypoints(distance), in the same order"""
+        def build():
+            waypoints = self.map.generate_waypoints(distance)
+            if driving_only:
+                waypoints = [w for w in waypoints if w.lane_type == self.carla.LaneType.Driving]
+            return [w.transform for w in waypoints]
+        name = 'waypoints_{:g}{}'.format(distance, '_driving' if driving_only else '')
+        return self._transforms(self._array(name, build))
@@ -27,7 +27,17 @@ import carla
 import argparse
 import logging
 import random
-import pandas as pd
+import numpy as np
+
+## utils
+from utils.recorder import ColumnRecorder, FORMATS
+from utils.actor_pool import ensure_world
+from utils.snapshot import SnapshotReader
+from utils.profiler import TickProfiler
+from utils.debug_draw import DebugDraw
+from utils.sampling import add_sampling_arguments, policy_from_args
+from utils.pipeline import TickPipeline
+from utils.warm_cache import WarmCache
 
 def main():
     argparser = argparse.ArgumentParser(
@@ -81,26 +91,64 @@ def main():
         type=str,
         help='map name to load in the server (default: Town01)')
 
+    argparser.add_argument(
+        '--log_format',
+        default='csv',
+        choices=FORMATS,
+        help='format of the saved dataset (default: csv)')
+    argparser.add_argument(
+        '--log_chunk',
+        default=1024,
+        type=int,
+        help='number of rows buffered before they are written (default: 1024)')
+    add_sampling_arguments(argparser, stride=1)
+    argparser.add_argument(
+        '--no_draw',
+        action='store_true',
+        help='no debug drawing in the simulator (headless runs)')
+    argparser.add_argument(
+        '--draw_budget',
+        default=100,
+        type=int,
+        help='debug shapes drawn per frame at most (default: 100)')
+    argparser.add_argument(
+        '--profile',
+        action='store_true',
+        help='measure the time of every phase of the tick loop')
+    argparser.add_argument(
+        '--profile_every',
+        default=100,
+        type=int,
+        help='print the timing percentiles every N ticks (default: 100)')
+    argparser.add_argument(
+        '--profile_file',
+        default=None,
+        help='csv file the timings of the last ticks are written to at the end')
+    argparser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='log a tick on a worker thread while the next tick runs')
+    argparser.add_argument(
+        '--pipeline_depth',
+        default=2,
+        type=int,
+        help='ticks waiting for the logging thread before the loop waits (default: 2)')
     args = argparser.parse_args()
     args.width, args.height = [int(x) for x in args.res.split('x')]
 
     logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
     client = carla.Client(args.host, args.port)
-    client.load_world(map_name=args.map_name)
     client.set_timeout(10.0)
+    ensure_world(client, args.map_name)   ## the map is only loaded if the server runs another one
 
     ## Datasets path
     path_dataset = os.getcwd() + "../Datasets/"
     dataset_name = "map04_coordination_1.csv"
     path_dataset = path_dataset + dataset_name
-
-    ## To check whether the dataset exists 
-    ## if not, new file should be created
-    if os.path.isfile(path_dataset):
-        newfile = False
-    else:
-        newfile = True
+    recorder = None
+    pipeline = None
+    profiler = TickProfiler(enabled=False)
 
     try:
         traffic_manager = client.get_trafficmanager(args.tm_port)
@@ -120,9 +168,9 @@ def main():
             else:
                 synchronous_master = False
 
-        blueprints = world.get_blueprint_library().filter(args.filterv)
-
-        spawn_points = world.get_map().get_spawn_points()
+        ## blueprint ids and spawn points of the map are cached under Datasets/warm_cache
+        cache = WarmCache(carla, client, world, os.path.dirname(path_dataset))
+        spawn_points = cache.spawn_points()
         number_of_spawn_points = len(spawn_points)
 
         ## for 4 lanes that we can mark the points that they drive through
@@ -134,12 +182,9 @@ def main():
         transform = carla.Transform(carla.Location(x=-5.9, y=150.15, z=0.2819), carla.Rotation(pitch=0, yaw=90, roll=0))
         if blueprint_toyota is None: 
             ## create new actors (four toyotas)
-            blueprint_toyota = world.get_blueprint_library().filter('vehicle.toyota.prius')   ## actorblueprint, transform, rotation
-            blueprint_toyota1 = world.get_blueprint_library().filter('vehicle.toyota.prius')
-            blueprint_toyota2 = world.get_blueprint_library().filter('vehicle.toyota.prius')
-            blueprint_toyota3 = world.get_blueprint_library().filter('vehicle.toyota.prius')
-            bp_toyota_list = [blueprint_toyota, blueprint_toyota1, blueprint_toyota2, blueprint_toyota3]
-            actor_toyota_list = [blueprint_toyota[0], blueprint_toyota1[0], blueprint_toyota2[0], blueprint_toyota3[0]]
+            ## one copy of the blueprint per toyota, each gets its own color
+            actor_toyota_list = [cache.blueprint('vehicle.toyota.prius') for _ in range(4)]
+            blueprint_toyota = actor_toyota_list
 
             actor_toyota_list[0].set_attribute('role_name', 'autopilot')  # set the autopilot  ## hero?
             actor_toyota_list[1].set_attribute('role_name', 'autopilot')  # set the autopilot  ## hero?
@@ -195,53 +240,64 @@ def main():
             # for save the coordination of each lane in the csv. file 
             counter = 0
             frame = 0  ## for the csv file, record each frame
-            last_time = time.time()
             data_columns = ['Frame', 'lane1 X', 'lane1 Y', 'lane1 Z', 'lane1 pitch', 'lane1 yaw', 'lane1 roll', 'lane2 X', 'lane2 Y', 'lane2 Z', 'lane2 pitch', 'lane2 yaw', 'lane2 roll', 'lane3 X', 'lane3 Y',
                             'lane3 Z', 'lane3 pitch', 'lane3 yaw', 'lane3 roll', 'lane4 X', 'lane4 Y', 'lane4 Z', 'lane4 pitch', 'lane4 yaw', 'lane4 roll']
+            ## the header is only written if the dataset does not exist yet
+            recorder = ColumnRecorder(path_dataset, data_columns, dtypes={'Frame': np.int64}, fmt=args.log_format,
+                                      chunk_size=args.log_chunk)
+            snapshot_reader = SnapshotReader(world, [actor.id for actor in vehicle_actors])
+            draw = DebugDraw(carla, world.debug, budget=args.draw_budget, enabled=not args.no_draw)
+            sampling = policy_from_args(args)    ## which ticks are logged
+
+            def log_tick(frame, snapshot):
+                ## the coordinations of the four lanes in one row
+                data_list = [frame]
+                for actor in vehicle_actors:
+                    state = snapshot[actor.id]
+                    data_list += [state.location.x, state.location.y, state.location.z,
+                                  state.rotation.pitch, state.rotation.yaw, state.rotation.roll]
+                recorder.append(data_list)
+            ## with --pipeline the row is built and written while the next tick runs
+            pipeline = TickPipeline(log_tick, maxsize=args.pipeline_depth, enabled=args.pipeline)
+            # to draw spawn points
+            # spawn points are not equal to the coordination we are saving
+            if args.draw_spawn_points:
+                for waypoint in spawn_points:
+                    location = waypoint.location
+                    draw.string(location.x, location.y, location.z,
+                                'x:{}, y:{}, z:{}'.format(location.x, location.y, location.z),
+                                color=(0, 255, 0), draw_shadow=True, life_time=0)
+            profiler = TickProfiler(('read', 'log', 'draw', 'tick'), enabled=args.profile,
+                                    report_every=args.profile_every, path=args.profile_file)
             while True:
                 if args.sync and synchronous_master:
-                    now = time.time()
-                    if counter > 1:
-                        print('interval : {}'.format(now - last_time))
-                        last_time = now
+                    profiler.tick()
                     counter += 1
 
                     if args.save_coordinate: 
-                        if counter % 30:
-                            data_list = [frame, actor_toyota.get_transform().location.x, actor_toyota.get_transform().location.y, actor_toyota.get_transform().location.z,
-                                         actor_toyota.get_transform().rotation.pitch, actor_toyota.get_transform().rotation.yaw, actor_toyota.get_transform().rotation.roll,
-                                         actor_toyota1.get_transform().location.x, actor_toyota1.get_transform().location.y, actor_toyota1.get_transform().location.z,
-                                         actor_toyota1.get_transform().rotation.pitch, actor_toyota1.get_transform().rotation.yaw, actor_toyota1.get_transform().rotation.roll,
-                                         actor_toyota2.get_transform().location.x, actor_toyota2.get_transform().location.y, actor_toyota2.get_transform().location.z,
-                                         actor_toyota2.get_transform().rotation.pitch, actor_toyota2.get_transform().rotation.yaw, actor_toyota2.get_transform().rotation.roll,
-                                         actor_toyota3.get_transform().location.x, actor_toyota3.get_transform().location.y, actor_toyota3.get_transform().location.z,
-                                         actor_toyota3.get_transform().rotation.pitch, actor_toyota3.get_transform().rotation.yaw, actor_toyota3.get_transform().rotation.roll]
-
-                            toyota_locations_df = pd.DataFrame([data_list], columns=data_columns) # transform list to dataframe
+                        if sampling.sample(counter):
+                            ## one snapshot for the four lanes, same frame for all of them
+                            snapshot = snapshot_reader.read()
+                            profiler.lap('read')
+                            pipeline.submit(frame, snapshot)
                             frame += 1
-                            # save the dataframe 
-                            if newfile:
-                                toyota_locations_df.to_csv(path_dataset, index=False)
-                                newfile = False
-                            else:
-                                toyota_locations_df.to_csv(path_dataset, header=None, mode='a', index=False)
+                            profiler.lap('log')
 
-                    # to draw spawn points
-                    # spawn points are not equal to the coordination we are saving
-                    if args.draw_spawn_points:
-                        for waypoint in spawn_points:
-                            print(type(waypoint.location))
-                            world.debug.draw_string(waypoint.location, 'x:{}, y:{}, z:{}'.format(waypoint.location.x, waypoint.location.y, waypoint.location.z),
-                                                    draw_shadow=True,
-                                                    color=carla.Color(r=0, g=255, b=0), life_time=100,
-                                                    persistent_lines=True)
-
-                            # life_time=0.2) ## to view the points for the start
-                            time.sleep(2)
+                    ## the queued spawn points are drawn a budget per frame
+                    draw.flush()
+                    profiler.lap('draw')
                     world.tick()
+                    profiler.lap('tick')
 
     finally:
 
+        pipeline_error = None
+        if pipeline is not None:   ## log the ticks still queued, a logging error is raised after the cleanup
+            pipeline_error = pipeline.close()
+        if recorder is not None:   ## write the buffered rows
+            recorder.close()
+        profiler.close()
+
         if args.sync and synchronous_master:
             settings = world.get_settings()
             settings.synchronous_mode = False
@@ -249,6 +305,8 @@ def main():
             world.apply_settings(settings)
 
         time.sleep(0.5)
+        if pipeline_error is not None:
+            raise pipeline_error
 
 if __name__ == '__main__':
 
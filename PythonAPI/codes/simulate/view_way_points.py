@@ -29,6 +29,11 @@ import logging
 import random
 import pandas as pd
 
+## utils
+from utils.actor_pool import ensure_world
+from utils.debug_draw import DebugDraw
+from utils.warm_cache import WarmCache
+
 def main():
     argparser = argparse.ArgumentParser(
         description=__doc__)
@@ -58,6 +63,11 @@ def main():
         '--sync',
         action='store_true',
         help='Synchronous mode execution')
+    argparser.add_argument(
+        '--draw_budget',
+        default=500,
+        type=int,
+        help='waypoints drawn per frame at most (default: 500)')
     argparser.add_argument(
         '-m', '--map_name',
         default='Town04',
@@ -70,8 +80,8 @@ def main():
     logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
     client = carla.Client(args.host, args.port)
-    client.load_world(map_name=args.map_name)
     client.set_timeout(10.0)
+    ensure_world(client, args.map_name)   ## the map is only loaded if the server runs another one
 
     try:
         traffic_manager = client.get_trafficmanager(args.tm_port)
@@ -94,16 +104,19 @@ def main():
 
         count = 0
         distance = 3.0    # distance for 3 meter between each point
-        waypoints = map.generate_waypoints(distance)
+        ## the transforms of the driving lane waypoints are cached under Datasets/warm_cache
+        cache = WarmCache(carla, client, world, os.getcwd() + "/Datasets", map=map)
+        waypoints = cache.waypoint_transforms(distance, driving_only=True)
         # waypoints = [w for w in waypoints if w.lane_type is 'Sidewalk']
         
-        for w in waypoints:
-            if w.lane_type is carla.LaneType.Driving:
-                count += 1
-                world.debug.draw_string(w.transform.location, 'O', draw_shadow=False,
-                                    color=carla.Color(r=255, g=0, b=0), life_time=120.0,
-                                    persistent_lines=True)
-                print(type(w.lane_type))
+        draw = DebugDraw(carla, world.debug, budget=args.draw_budget)
+        for transform in waypoints:
+            count += 1
+            location = transform.location
+            draw.string(location.x, location.y, location.z, 'O', color=(255, 0, 0), life_time=120.0)
+        print('{} driving waypoints'.format(count))
+        ## a budget of waypoints per frame instead of all of them at once
+        draw.drain(world.tick if synchronous_master else world.wait_for_tick)
 
     finally:
 